@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the stages of ``BokehJSONComparisonFixture.check_plot`` for synthetic
+bokeh documents of increasing size.
+
+The documents are scaled along the following axes
+
+    - ``renderers``: number of glyph renderers in a single figure
+    - ``points``: number of points in the ColumnDataSource of a single renderer
+    - ``depth``: nesting depth of layouts around a single figure
+    - ``shared``: number of figures sharing the same ColumnDataSource and ranges
+
+For each document the serialization, cleaning, writing of the test file, loading of the
+test file and the comparison are timed and the peak memory allocated in each stage
+is recorded using tracemalloc (tracing slows down the pure Python YAML
+emitter/parser considerably, use ``--no-memory`` for larger sizes). The cleaner for the installed bokeh version is used
+(``_clean_bokeh_json_v2`` for bokeh<3, ``_clean_bokeh_json_v3`` otherwise), so run
+the benchmark in environments with both major versions of bokeh to cover both cleaners.
+
+Usage::
+
+    python benchmarks/benchmark_check_plot.py --output results.json
+"""
+import argparse
+import copy
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import bokeh.models
+
+Measure = Callable[..., Tuple[Any, Dict[str, Optional[float]]]]
+
+AXES = {
+    "renderers": [1, 10, 50, 100],
+    "points": [100, 1_000, 10_000, 50_000],
+    "depth": [1, 10, 50, 100],
+    "shared": [1, 10, 50, 100],
+}
+
+QUICK_AXES = {
+    "renderers": [1, 5],
+    "points": [10, 100],
+    "depth": [1, 3],
+    "shared": [1, 3],
+}
+
+
+def make_document(axis: str, size: int) -> "bokeh.models.Model":
+    """
+    Create a bokeh model scaled along the given axis
+
+    :param axis: name of the axis (see ``AXES``)
+    :param size: size along the axis
+    """
+    import numpy as np
+    from bokeh.layouts import column, row
+    from bokeh.models import ColumnDataSource
+    from bokeh.plotting import figure
+
+    rng = np.random.default_rng(42)
+
+    def _source(n_points):
+        x = np.linspace(0, 1, n_points)
+        return ColumnDataSource(data={"x": x, "y": rng.random(n_points)})
+
+    if axis == "renderers":
+        p = figure()
+        for _ in range(size):
+            p.line("x", "y", source=_source(50))
+        return p
+
+    if axis == "points":
+        p = figure()
+        p.scatter("x", "y", source=_source(size))
+        return p
+
+    if axis == "depth":
+        model = figure()
+        model.line("x", "y", source=_source(50))
+        for level in range(size):
+            model = column(model) if level % 2 == 0 else row(model)
+        return model
+
+    if axis == "shared":
+        source = _source(50)
+        first = figure()
+        first.line("x", "y", source=source)
+        figures = [first]
+        for _ in range(size - 1):
+            p = figure(x_range=first.x_range, y_range=first.y_range)
+            p.line("x", "y", source=source)
+            figures.append(p)
+        return column(*figures)
+
+    raise ValueError(f"Unknown axis: {axis}")
+
+
+def _measure(
+    func: Callable[..., Any], repeat: int, setup: Callable[[], Tuple] = tuple, memory: bool = True
+) -> Tuple[Any, Dict[str, Optional[float]]]:
+    """
+    Run the given function and record the best time of the runs. The peak memory
+    is recorded in a separate run, since tracing the allocations slows down the function
+
+    :param func: function to run
+    :param repeat: number of runs
+    :param setup: function returning the arguments of each run, which is not timed
+    :param memory: if False the peak memory is not recorded
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+
+    args = setup()
+    if not memory:
+        return func(*args), {"time": min(times), "peak_memory": None}
+
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, {"time": min(times), "peak_memory": peak}
+
+
+def benchmark_document(
+    model: "bokeh.models.Model", mode: str, tmp_dir: Path, measure: Measure, fp_precision: int = 5
+) -> Dict[str, Any]:
+    """
+    Benchmark the stages of ``check_plot`` for the given model
+
+    :param model: bokeh model to check
+    :param mode: ``yaml`` for the default comparison of the YAML files, ``arrays`` for
+        the comparison keeping arrays as numpy arrays or ``serializer`` for the default comparison
+        producing the cleaned data while serializing (only bokeh 3 or newer)
+    :param tmp_dir: directory for the test files
+    :param measure: function running a stage and returning its result and its time and peak memory
+        (see ``_measure``)
+    :param fp_precision: number of digits to use in floating point rounding
+    """
+    from pytest_bokeh_regressions import storage
+    from pytest_bokeh_regressions.array_check import ArrayCheckOptions, compare_json_data
+    from pytest_bokeh_regressions.array_diff import compare_documents
+    from pytest_bokeh_regressions.json_comparison import BOKEH_LT_3, BokehJSONComparisonFixture, default_json_clean_fn
+
+    stages = {}
+    baseline = tmp_dir / f"{mode}.yml"
+
+    if mode == "serializer":
+        from pytest_bokeh_regressions.normalizing_serialization import serialize_cleaned
+
+        # Serializing and cleaning are a single stage in this case
+        cleaned, stages["serialize"] = measure(partial(serialize_cleaned, model, fp_precision))
+        _, stages["dump"] = measure(partial(storage.dump, cleaned, baseline))
+        expected, stages["load"] = measure(partial(storage.load, baseline))
+        _, stages["compare"] = measure(partial(compare_documents, cleaned, expected))
+        return {"test_file_size": baseline.stat().st_size, "stages": stages}
+
+    # The models are serialized in the same way as in the checks of the fixture
+    serialize = BokehJSONComparisonFixture._serialize  # pylint: disable=protected-access
+    data, stages["serialize"] = measure(partial(serialize, model))
+
+    if mode == "yaml":
+        # The cleaner for bokeh<3 modifies parts of the data in place
+        cleaned, stages["clean"] = measure(
+            partial(default_json_clean_fn, fp_precision=fp_precision),
+            setup=(lambda: (copy.deepcopy(data),)) if BOKEH_LT_3 else (lambda: (data,)),
+        )
+        cleaned.pop("version", None)
+        _, stages["dump"] = measure(partial(storage.dump, cleaned, baseline))
+        expected, stages["load"] = measure(partial(storage.load, baseline))
+        _, stages["compare"] = measure(partial(compare_documents, cleaned, expected))
+    elif mode == "arrays":
+        cleaned, stages["clean"] = measure(
+            partial(default_json_clean_fn, data, fp_precision=fp_precision, keep_arrays=True)
+        )
+        cleaned.pop("version", None)
+        _, stages["dump"] = measure(
+            lambda: storage.dump(storage.to_stored_form(cleaned, baseline, fp_precision), baseline)
+        )
+        expected, stages["load"] = measure(partial(storage.load, baseline))
+        differences, stages["compare"] = measure(
+            partial(
+                compare_json_data,
+                cleaned,
+                expected,
+                lambda entry: storage.load_array(entry, baseline),
+                ArrayCheckOptions(fp_precision),
+            )
+        )
+        assert not differences, differences
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+
+    return {"test_file_size": baseline.stat().st_size, "stages": stages}
+
+
+def run(axes: Dict[str, List[int]], repeat: int = 3, memory: bool = True) -> Dict[str, Any]:
+    """
+    Run the benchmark for all given axes and sizes
+
+    :param axes: dict of the axes and the sizes to benchmark
+    :param repeat: number of runs of each stage
+    :param memory: if False the peak memory of the stages is not recorded
+    """
+    import bokeh
+    import numpy as np
+    from packaging.version import Version
+    import pytest_bokeh_regressions
+    from pytest_bokeh_regressions.json_comparison import default_json_clean_fn
+
+    measure = partial(_measure, repeat=repeat, memory=memory)
+    modes = ["yaml"] if Version(bokeh.__version__) < Version("3.0.0") else ["yaml", "arrays", "serializer"]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for axis, sizes in axes.items():
+            for size in sizes:
+                model = make_document(axis, size)
+                for mode in modes:
+                    result = benchmark_document(model, mode, Path(tmp_dir), measure)
+                    results.append({"axis": axis, "size": size, "mode": mode, **result})
+                    total = sum(stage["time"] for stage in result["stages"].values())
+                    print(f"{axis:>10} {size:>8} {mode:>10}: {total:.4f}s", file=sys.stderr)
+
+    return {
+        "metadata": {
+            "pytest-bokeh-regressions": pytest_bokeh_regressions.__version__,
+            "bokeh": bokeh.__version__,
+            "numpy": np.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cleaner": default_json_clean_fn.__name__,
+            "repeat": repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Command line interface of the benchmark
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--output", "-o", type=Path, help="JSON file to write the results to (default: stdout)")
+    parser.add_argument("--axis", action="append", choices=list(AXES), help="Only run the given axes")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each stage")
+    parser.add_argument("--no-memory", action="store_true", help="Do not record the peak memory of the stages")
+    parser.add_argument("--quick", action="store_true", help="Use small sizes (for checking the benchmark itself)")
+    args = parser.parse_args(argv)
+
+    axes = QUICK_AXES if args.quick else AXES
+    if args.axis:
+        axes = {axis: axes[axis] for axis in args.axis}
+
+    results = run(axes, repeat=args.repeat, memory=not args.no_memory)
+    output = json.dumps(results, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        args.output.write_text(output + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
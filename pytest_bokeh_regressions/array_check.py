@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the checks of the bokeh_json_regression fixture keeping the arrays as numpy arrays,
+i.e. comparing them with tolerances and storing them in .npy files, in a blob store, as summaries or compactly
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, MutableMapping, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pytest
+    from pytest_regressions.data_regression import DataRegressionFixture
+    from .blob_store import BlobStore
+    from .timing import CheckPlotTiming
+
+
+@dataclass(frozen=True)
+class ArrayCheckOptions:  # pylint: disable=too-many-instance-attributes
+    """
+    Options of a check of the bokeh_json_regression fixture, which decide whether the
+    arrays are kept as numpy arrays (see :py:attr:`keeps_arrays`) and how they are compared and stored
+
+    :param fp_precision: number of digits to use in floating point rounding
+    :param rtol: relative tolerance for comparing floating point arrays
+    :param atol: absolute tolerance for comparing floating point arrays
+    :param sidecar_threshold: arrays with at least this number of elements are stored in .npy files
+    :param use_hash: if True a hash of the data is stored next to the test file. If the hash
+        matches (and no tolerances are given) the test file is not read
+    :param chunk_size: number of array elements processed at once when rounding, hashing
+        comparing and writing arrays
+    :param summary_threshold: arrays with at least this number of elements are stored as their summaries
+    :param compact: if True arrays serialized into the test file are encoded compactly where possible
+    :param blob_store: store for the arrays of the test files
+    """
+
+    fp_precision: int
+    rtol: Optional[float] = None
+    atol: Optional[float] = None
+    sidecar_threshold: Optional[int] = None
+    use_hash: bool = False
+    chunk_size: Optional[int] = None
+    summary_threshold: Optional[int] = None
+    compact: bool = False
+    blob_store: "Optional[BlobStore]" = None
+
+    @property
+    def keeps_arrays(self) -> bool:
+        """
+        Whether the check compares the data keeping the arrays as numpy arrays, i.e. always loads the test file
+        """
+        return (
+            any(
+                option is not None
+                for option in (self.rtol, self.atol, self.sidecar_threshold, self.chunk_size, self.summary_threshold)
+            )
+            or self.use_hash
+            or self.compact
+            or self.blob_store is not None
+        )
+
+    @property
+    def with_tolerance(self) -> bool:
+        """
+        Whether floating point arrays are compared with tolerances
+        """
+        return self.rtol is not None or self.atol is not None
+
+
+def compare_json_data(
+    obtained: MutableMapping,
+    expected: MutableMapping,
+    load_array: Callable,
+    options: ArrayCheckOptions,
+) -> List[str]:
+    """
+    Compare cleaned JSON data, where the arrays are kept as numpy arrays, against
+    the data loaded from a test file. All entries except arrays are compared for equality of their values and types.
+    Floating point arrays are rounded and compared for equality or, if a tolerance is given,
+    compared unrounded using ``np.isclose``. Arrays are compared in chunks, so that at most
+    one rounded chunk is held in memory in addition to the arrays. Differing arrays are
+    summarized (see :py:func:`~pytest_bokeh_regressions.array_diff.describe_array_difference`).
+    Arrays stored as summaries in the test file are compared by their summaries
+    (see :py:func:`~pytest_bokeh_regressions.summary.compare_summaries`)
+
+    :param obtained: cleaned data of the current test run (with ``keep_arrays=True``)
+    :param expected: data loaded from the test file
+    :param load_array: function returning the array for an entry of the expected data
+        or None if the entry does not represent an array
+    :param options: options of the check (precision, tolerances and chunk size)
+
+    :returns: list of messages describing the found differences
+    """
+    import numpy as np
+    from .array_diff import describe_array_difference, path_component, values_differ
+    from .summary import SUMMARY_TYPE, compare_summaries, summarize_array
+
+    tolerances = {"rtol": options.rtol, "atol": options.atol}
+    differences = []
+
+    stack = [("", obtained, expected)]
+    while stack:
+        path, obtained_entry, expected_entry = stack.pop()
+        if (
+            isinstance(obtained_entry, np.ndarray)
+            and isinstance(expected_entry, dict)
+            and expected_entry.get("type") == SUMMARY_TYPE
+        ):
+            summary = summarize_array(obtained_entry, options.fp_precision, options.chunk_size)
+            differences.append(compare_summaries(path, summary, expected_entry, **tolerances))
+        elif isinstance(obtained_entry, np.ndarray):
+            expected_array = load_array(expected_entry)
+            if expected_array is None:
+                differences.append(f"{path}: expected {expected_entry!r}, got an array")
+                continue
+            differences.append(
+                describe_array_difference(
+                    path,
+                    obtained_entry,
+                    expected_array,
+                    options.fp_precision,
+                    chunk_size=options.chunk_size,
+                    **tolerances,
+                )
+            )
+        elif isinstance(obtained_entry, dict) and isinstance(expected_entry, dict):
+            if obtained_entry.keys() != expected_entry.keys():
+                differences.append(
+                    f"{path}: expected keys {sorted(expected_entry.keys())}, got {sorted(obtained_entry.keys())}"
+                )
+                continue
+            stack.extend((f"{path}/{key}", val, expected_entry[key]) for key, val in obtained_entry.items())
+        elif isinstance(obtained_entry, list) and isinstance(expected_entry, list):
+            if len(obtained_entry) != len(expected_entry):
+                differences.append(f"{path}: expected {len(expected_entry)} entries, got {len(obtained_entry)}")
+                continue
+            stack.extend(
+                (f"{path}/{path_component(obtained_entry, index)}", val, expected_entry[index])
+                for index, val in enumerate(obtained_entry)
+            )
+        elif values_differ(obtained_entry, expected_entry):
+            differences.append(f"{path}: expected {expected_entry!r}, got {obtained_entry!r}")
+
+    return [difference for difference in differences if difference is not None]
+
+
+class ArrayCheckMixin:
+    """
+    Checks of the :py:class:`~pytest_bokeh_regressions.json_comparison.BokehJSONComparisonFixture`
+    keeping the arrays as numpy arrays, i.e. without re-encoding them into their serialized form.
+    The data is compared in memory against the test file in the original data directory
+    """
+
+    # Provided by the fixture
+    request: "pytest.FixtureRequest"
+    data_regression: "DataRegressionFixture"
+    summary_threshold: Optional[int]
+    blob_store: "Optional[BlobStore]"
+    _basename: Callable[[Optional[str]], str]
+    _source_filename: Callable[[Optional[str]], Path]
+    _clean: Callable[..., MutableMapping]
+    _load: Callable[[Path], MutableMapping]
+    _load_array: Callable[..., Any]
+    _write_source: Callable[[Path, Callable[[Path], None]], None]
+    _regen_incremental: Callable[[Path, Callable[[Path], bool], Callable[[Path], None]], None]
+
+    def _array_options(
+        self,
+        fp_precision: Optional[int] = None,
+        rtol: Optional[float] = None,
+        atol: Optional[float] = None,
+        summary_threshold: Optional[int] = None,
+    ) -> ArrayCheckOptions:
+        """
+        Get the options of a check from the given arguments, the options of the fixture and the command line options
+
+        :param fp_precision: number of digits to use in floating point rounding
+        :param rtol: relative tolerance for comparing floating point arrays
+        :param atol: absolute tolerance for comparing floating point arrays
+        :param summary_threshold: arrays with at least this number of elements are compared by their summaries
+        """
+        config = self.request.config
+        return ArrayCheckOptions(
+            fp_precision=fp_precision or config.getoption("bokeh_fp_precision"),
+            rtol=rtol,
+            atol=atol,
+            sidecar_threshold=config.getoption("bokeh_sidecar_threshold"),
+            use_hash=config.getoption("bokeh_hash"),
+            chunk_size=config.getoption("bokeh_chunk_size"),
+            summary_threshold=self.summary_threshold if summary_threshold is None else summary_threshold,
+            compact=config.getoption("bokeh_compact_arrays"),
+            blob_store=self.blob_store,
+        )
+
+    def _check_with_arrays(
+        self,
+        json_to_check: MutableMapping,
+        basename: Optional[str],
+        options: ArrayCheckOptions,
+        timing: "CheckPlotTiming",
+        clean_memo: Optional[Dict[int, Tuple]] = None,
+    ) -> None:
+        """
+        Compare the JSON data against the test file keeping the arrays as numpy arrays
+
+        :param json_to_check: JSON data of the bokeh model
+        :param basename: basename of the file. If not given the name of the test is used.
+        :param options: options of the check
+        :param timing: timing of the check
+        :param clean_memo: memo passed to the default cleaning function
+        """
+        __tracebackhide__ = True  # pylint: disable=unused-variable
+        from functools import partial
+        from . import storage
+
+        with timing.stage("clean"):
+            json_to_check = self._clean(json_to_check, options.fp_precision, clean_memo, keep_arrays=True)
+        json_to_check.pop("version", None)
+        timing.record_document(json_to_check)
+
+        digest = None
+        if options.use_hash:
+            with timing.stage("hash"):
+                digest = storage.content_hash(json_to_check, options.fp_precision, options.chunk_size)
+
+        def check_fn(filename: Path) -> List[str]:
+            if digest is not None and not options.with_tolerance and storage.hash_matches(filename, digest):
+                return []
+            with timing.stage("load"):
+                expected = self._load(filename)
+            with timing.stage("compare"):
+                load_fn = partial(storage.load_array, filename=filename, blob_store=options.blob_store)
+                differences = compare_json_data(
+                    json_to_check, expected, partial(self._load_array, filename, load_fn=load_fn), options
+                )
+            if digest is not None and not options.with_tolerance and not differences:
+                # The data is identical, so the hash is (re)written, e.g. if it is missing
+                # or was computed by an older version of the plugin
+                storage.write_hash(filename, digest)
+            return differences
+
+        def dump_fn(filename: Path, blob_store: "Optional[BlobStore]" = options.blob_store) -> None:
+            with timing.stage("dump"):
+                stored = storage.to_stored_form(
+                    json_to_check,
+                    filename,
+                    options.fp_precision,
+                    sidecar_threshold=options.sidecar_threshold,
+                    chunk_size=options.chunk_size,
+                    blob_store=blob_store,
+                    summary_threshold=options.summary_threshold,
+                    compact=options.compact,
+                )
+                storage.dump(stored, filename)
+                if digest is not None:
+                    storage.write_hash(filename, digest)
+
+        # The arrays of obtained files are not added to the (shared) blob store, but kept in the obtained files
+        self._perform_check(basename, check_fn, dump_fn, dump_obtained_fn=partial(dump_fn, blob_store=None))
+
+    def _perform_check(
+        self,
+        basename: Optional[str],
+        check_fn: Callable[[Path], List[str]],
+        dump_fn: Callable[[Path], None],
+        dump_obtained_fn: Optional[Callable[[Path], None]] = None,
+    ) -> None:
+        """
+        Regression check of the pytest-regressions plugin, where the data is compared
+        in memory and the obtained file is only written if the data differs
+
+        :param basename: basename of the file. If not given the name of the test is used.
+        :param check_fn: function comparing against the given test file, returning a list of differences
+        :param dump_fn: function writing the obtained data to the given file
+        :param dump_obtained_fn: function writing the obtained file of a failed check (default: dump_fn)
+        """
+        __tracebackhide__ = True  # pylint: disable=unused-variable
+        from pytest_regressions.common import perform_regression_check
+        from . import storage
+        from .codec import codec_of
+
+        name = self._basename(basename)
+        source_filename = self._source_filename(name)
+
+        if self.request.config.getoption("bokeh_regen_incremental"):
+            self._regen_incremental(source_filename, lambda filename: not check_fn(filename), dump_fn)
+            return
+
+        extension = codec_of(storage.plain_filename(source_filename)).extension
+        obtained_filename = self.data_regression.datadir / f"{name}.obtained{extension}"
+
+        def check_regression(obtained_filename: Path, expected_filename: Path) -> None:
+            __tracebackhide__ = True  # pylint: disable=unused-variable
+            # The expected file is the test file in the original data directory (see below), since
+            # arrays may be stored in .npy files next to it, which are not copied
+            differences = check_fn(expected_filename)
+            if differences:
+                (dump_obtained_fn or dump_fn)(obtained_filename)
+                raise AssertionError(
+                    "\n".join(["DATA DIFFERS:", str(expected_filename), str(obtained_filename), *differences])
+                )
+
+        def dump_regression(filename: Path) -> None:
+            # The obtained file is only written by check_regression if the data differs
+            if filename != obtained_filename:
+                self._write_source(filename, dump_fn)
+
+        # The test file is compared in place, so it is not copied into the temporary data directory
+        perform_regression_check(
+            datadir=self.data_regression.original_datadir,
+            original_datadir=self.data_regression.original_datadir,
+            request=self.request,
+            check_fn=check_regression,
+            dump_fn=dump_regression,
+            # Compressed test files have the extension .yml.<suffix>, the obtained files are not compressed
+            extension=source_filename.name[len(name) :],
+            basename=name,
+            force_regen=self.data_regression.force_regen,
+            with_test_class_names=self.data_regression.with_test_class_names,
+            obtained_filename=obtained_filename,
+        )
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the comparison of cleaned JSON data, where arrays are compared and summarized
+using vectorized numpy operations and only the remaining (non-array) part of the data
+is compared as text
+"""
+import base64
+import difflib
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+#: Value replacing arrays in the data compared as text
+ARRAY_PLACEHOLDER = "<array>"
+
+#: Maximal number of indices of differing elements shown
+MAX_INDICES = 5
+
+
+def _encoded_data(entry: Any) -> Optional[str]:
+    """
+    Get the base64 encoded data of an array in the given entry of cleaned JSON data
+    (``ndarray``/``typed_array`` of bokeh 3 or ``__ndarray__`` of older versions)
+
+    :param entry: entry of the cleaned JSON data
+    """
+    if not isinstance(entry, dict):
+        return None
+    if entry.get("type") in ("ndarray", "typed_array") and isinstance(entry.get("array"), dict):
+        encoded = entry["array"].get("data")
+    else:
+        encoded = entry.get("__ndarray__")
+    return encoded if isinstance(encoded, str) else None
+
+
+def decode_array(entry: Any) -> "Optional[np.ndarray]":
+    """
+    Decode the base64 encoded array in the given entry of cleaned JSON data
+
+    :param entry: entry of the cleaned JSON data
+
+    :returns: the array or None if the entry does not represent a base64 encoded array
+    """
+    import numpy as np
+
+    encoded = _encoded_data(entry)
+    if encoded is None:
+        return None
+
+    byteorder = ">" if entry.get("order") == "big" else "<"
+    array = np.frombuffer(base64.b64decode(encoded), dtype=np.dtype(entry["dtype"]).newbyteorder(byteorder))
+    shape = entry.get("shape")
+    if shape is not None and len(shape) > 1:
+        array = array.reshape(shape)
+    return array
+
+
+def path_component(container: Any, key: Any) -> str:
+    """
+    Get the component of the path of an entry in the data. Entries of dict attributes
+    of bokeh 3 (``[key, value]`` pairs) are named after their key
+
+    :param container: the list or dict containing the entry
+    :param key: index or key of the entry
+    """
+    entry = container[key]
+    if isinstance(container, list) and isinstance(entry, list) and len(entry) == 2 and isinstance(entry[0], str):
+        return f"{key}[{entry[0]}]"
+    return str(key)
+
+
+def values_differ(obtained: Any, expected: Any) -> bool:
+    """
+    Whether two (non-array) values of cleaned JSON data differ. Values of different types
+    differ even if they are equal in Python (e.g. ``2`` and ``2.0`` or ``True`` and ``1``),
+    since they are written differently to the test files
+
+    :param obtained: the obtained value
+    :param expected: the expected value
+    """
+    if isinstance(obtained, bool) != isinstance(expected, bool):
+        return True
+    if isinstance(obtained, float) != isinstance(expected, float):
+        return True
+    return obtained != expected
+
+
+def split_arrays(data: Any, path: str = "") -> Tuple[Any, Dict[str, Any]]:
+    """
+    Replace the base64 encoded arrays in cleaned JSON data by a placeholder
+
+    :param data: cleaned JSON data
+    :param path: path of the data
+
+    :returns: tuple of the data without arrays and a dict of the paths and entries of the arrays
+    """
+    arrays: Dict[str, Any] = {}
+
+    def _split(entry, entry_path):
+        if _encoded_data(entry) is not None:
+            arrays[entry_path] = entry
+            return ARRAY_PLACEHOLDER
+        if isinstance(entry, dict):
+            return {key: _split(val, f"{entry_path}/{path_component(entry, key)}") for key, val in entry.items()}
+        if isinstance(entry, (list, tuple)):
+            entry = list(entry)
+            return [_split(val, f"{entry_path}/{path_component(entry, index)}") for index, val in enumerate(entry)]
+        return entry
+
+    return _split(data, path), arrays
+
+
+def _differing_indices(
+    obtained_chunk: "np.ndarray",
+    expected_chunk: "np.ndarray",
+    fp_precision: Optional[int],
+    rtol: Optional[float],
+    atol: Optional[float],
+) -> "np.ndarray":
+    """
+    Flat indices of the differing elements of two chunks of arrays of the same dtype
+
+    NaNs compare equal; floating point chunks are compared within the tolerances if given, otherwise after
+    rounding the obtained chunk to ``fp_precision`` digits.
+    """
+    import numpy as np
+
+    if obtained_chunk.dtype.kind != "f":
+        differing = obtained_chunk != expected_chunk
+    elif rtol is not None or atol is not None:
+        differing = ~np.isclose(obtained_chunk, expected_chunk, rtol=rtol or 0.0, atol=atol or 0.0, equal_nan=True)
+    else:
+        if fp_precision is not None:
+            obtained_chunk = np.around(obtained_chunk, decimals=fp_precision)
+        differing = (obtained_chunk != expected_chunk) & ~(np.isnan(obtained_chunk) & np.isnan(expected_chunk))
+    return np.flatnonzero(differing)
+
+
+class _Differences:
+    """
+    Number, first flat indices and maximal absolute and relative errors of the differing elements of two arrays,
+    which are updated chunk by chunk
+    """
+
+    __slots__ = ("count", "first_indices", "max_abs_error", "max_rel_error")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.first_indices: List[int] = []
+        self.max_abs_error = 0.0
+        self.max_rel_error = 0.0
+
+    def update(self, indices: "np.ndarray", offset: int) -> None:
+        """
+        Add the differing elements of a chunk
+
+        :param indices: flat indices of the differing elements in the chunk
+        :param offset: flat index of the first element of the chunk in the array
+        """
+        self.count += indices.size
+        self.first_indices.extend((indices[: MAX_INDICES - len(self.first_indices)] + offset).tolist())
+
+    def update_errors(self, obtained_values: "np.ndarray", expected_values: "np.ndarray") -> None:
+        """
+        Add the errors between differing numeric values, NaN errors are ignored
+
+        :param obtained_values: the differing obtained values
+        :param expected_values: the corresponding expected values
+        """
+        import numpy as np
+
+        expected_values = expected_values.astype(np.float64)
+        errors = np.abs(obtained_values.astype(np.float64) - expected_values)
+        if np.all(np.isnan(errors)):
+            return
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rel_errors = errors / np.abs(expected_values)
+        self.max_abs_error = max(self.max_abs_error, float(np.nanmax(errors)))
+        self.max_rel_error = max(self.max_rel_error, float(np.nanmax(rel_errors)))
+
+
+def describe_array_difference(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    path: str,
+    obtained: "np.ndarray",
+    expected: "np.ndarray",
+    fp_precision: Optional[int] = None,
+    rtol: Optional[float] = None,
+    atol: Optional[float] = None,
+    chunk_size: Optional[int] = None,
+) -> Optional[str]:
+    """
+    Compare two arrays chunk by chunk and summarize the differences: changes of dtype or shape,
+    the number and first indices of the differing elements and the maximal absolute and relative errors
+
+    :param path: path of the array in the data
+    :param obtained: the obtained array
+    :param expected: the expected array
+    :param fp_precision: if given, the obtained floating point array is rounded to this number of digits
+    :param rtol: relative tolerance for comparing floating point arrays
+    :param atol: absolute tolerance for comparing floating point arrays
+    :param chunk_size: number of array elements compared at once
+
+    :returns: description of the differences or None if the arrays are equal
+    """
+    import numpy as np
+    from .rules import array_precision
+    from .chunks import iter_chunks
+
+    if obtained.dtype != expected.dtype or obtained.shape != expected.shape:
+        return f"{path}: expected array of {expected.dtype}{expected.shape}, got {obtained.dtype}{obtained.shape}"
+
+    is_numeric = obtained.dtype.kind in "iuf"
+    if fp_precision is not None:
+        fp_precision = array_precision(obtained, fp_precision)
+
+    differences = _Differences()
+    offset = 0
+    for obtained_chunk, expected_chunk in zip(iter_chunks(obtained, chunk_size), iter_chunks(expected, chunk_size)):
+        indices = _differing_indices(obtained_chunk, expected_chunk, fp_precision, rtol, atol)
+        if indices.size:
+            differences.update(indices, offset)
+            if is_numeric:
+                differences.update_errors(obtained_chunk[indices], expected_chunk[indices])
+        offset += obtained_chunk.size
+
+    if differences.count == 0:
+        return None
+
+    first: List[Any] = differences.first_indices
+    if obtained.ndim > 1:
+        first = [tuple(int(i) for i in index) for index in zip(*np.unravel_index(first, obtained.shape))]
+    use_tolerance = obtained.dtype.kind == "f" and (rtol is not None or atol is not None)
+    tolerance = f" within rtol={rtol}, atol={atol}" if use_tolerance else ""
+    message = (
+        f"{path}: arrays are not equal{tolerance}: {differences.count} of {obtained.size} elements differ "
+        f"({obtained.dtype}{obtained.shape}), first at {', '.join(map(str, first))}"
+    )
+    if is_numeric:
+        message += f"; max abs error {differences.max_abs_error:.6g}, max rel error {differences.max_rel_error:.6g}"
+    return message
+
+
+def compare_documents(
+    obtained: Any, expected: Any, decode_expected: Callable[[Any], "Optional[np.ndarray]"] = decode_array
+) -> List[str]:
+    """
+    Compare cleaned JSON data (with serialized arrays) against the data loaded from a test file.
+    Arrays are compared using numpy and only the remaining part of the data is compared as YAML text,
+    so that changes of the type of values (e.g. ``2`` and ``2.0`` or ``true`` and ``1``) are differences
+
+    :param obtained: cleaned JSON data of the current test run
+    :param expected: data loaded from the test file
+    :param decode_expected: function decoding the arrays of the expected data
+
+    :returns: list of lines describing the differences
+    """
+    import yaml
+
+    obtained_data, obtained_arrays = split_arrays(obtained)
+    expected_data, expected_arrays = split_arrays(expected)
+
+    differences = []
+    for path in sorted(obtained_arrays.keys() & expected_arrays.keys()):
+        difference = describe_array_difference(
+            path, decode_array(obtained_arrays[path]), decode_expected(expected_arrays[path])
+        )
+        if difference is not None:
+            differences.append(difference)
+
+    obtained_lines = yaml.safe_dump(obtained_data, default_flow_style=False, allow_unicode=True).splitlines()
+    expected_lines = yaml.safe_dump(expected_data, default_flow_style=False, allow_unicode=True).splitlines()
+    if obtained_lines != expected_lines:
+        differences.extend(difflib.unified_diff(expected_lines, obtained_lines, "expected", "obtained", lineterm=""))
+
+    return differences
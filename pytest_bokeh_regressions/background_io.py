@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the reading and writing of test files on background threads, so that
+the disk I/O of the bokeh regression checks overlaps with the construction of the plots in the tests
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, MutableMapping, Tuple
+
+from . import storage
+
+
+def _file_state(filename: Path) -> Tuple[int, int]:
+    """
+    Get the modification time and size of a file, used to detect changes of prefetched files
+
+    :param filename: path to the file
+    """
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class BackgroundIO:
+    """
+    Loads test files ahead of their checks and writes test files in the background.
+
+    Prefetched test files are only used if the file did not change after it was read.
+    Writes are done in the order they are submitted on a single thread. Errors of writes
+    are raised when the writer is flushed or closed
+
+    :param max_workers: number of threads used for prefetching test files
+    """
+
+    def __init__(self, max_workers: int = 2) -> None:
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bokeh-prefetch")
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bokeh-writer")
+        self._prefetched: Dict[Path, Future] = {}
+        self._writes: Dict[Path, List[Future]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load(filename: Path) -> Tuple[Tuple[int, int], MutableMapping]:
+        state = _file_state(filename)
+        return state, storage.load(filename)
+
+    def prefetch(self, filename: Path) -> None:
+        """
+        Start loading the given test file in the background
+
+        :param filename: path to the test file
+        """
+        with self._lock:
+            if filename not in self._prefetched:
+                self._prefetched[filename] = self._prefetch_executor.submit(self._load, filename)
+
+    def discard(self, filename: Path) -> None:
+        """
+        Drop the prefetched data of the given test file if it was not used by :py:meth:`load`,
+        so that it is not kept in memory
+
+        :param filename: path to the test file
+        """
+        with self._lock:
+            future = self._prefetched.pop(filename, None)
+        if future is not None:
+            future.cancel()
+
+    def load(self, filename: Path) -> MutableMapping:
+        """
+        Get the data of a test file. The result of the prefetch is used if it was started and
+        the file did not change afterwards, otherwise the file is read
+
+        :param filename: path to the test file
+        """
+        self.wait(filename)
+        with self._lock:
+            future = self._prefetched.pop(filename, None)
+        if future is not None:
+            try:
+                state, data = future.result()
+                if state == _file_state(filename):
+                    return data
+            except Exception:  # pylint: disable=broad-except
+                # Errors are raised when reading the file again
+                pass
+        return storage.load(filename)
+
+    def write(self, filename: Path, dump_fn: Callable[[Path], Any]) -> None:
+        """
+        Write a test file in the background. Prefetched data of the file is discarded
+
+        :param filename: path to the test file
+        :param dump_fn: function writing the data to the given file
+        """
+        with self._lock:
+            future = self._prefetched.pop(filename, None)
+            if future is not None:
+                future.cancel()
+            self._writes.setdefault(storage.file_key(filename), []).append(
+                self._write_executor.submit(dump_fn, filename)
+            )
+
+    def wait(self, filename: Path) -> None:
+        """
+        Wait until the pending writes of the given test file (in any format) are finished
+
+        :param filename: path to the test file
+        """
+        with self._lock:
+            futures = self._writes.pop(storage.file_key(filename), [])
+        for future in futures:
+            future.result()
+
+    def flush(self) -> None:
+        """
+        Wait until all pending writes are finished. The first error of the writes is raised
+        """
+        with self._lock:
+            futures = [future for futures in self._writes.values() for future in futures]
+            self._writes.clear()
+        errors = [error for error in (future.exception() for future in futures) if error is not None]
+        if errors:
+            raise errors[0]
+
+    def close(self) -> None:
+        """
+        Finish all pending writes and stop the background threads
+        """
+        try:
+            self.flush()
+        finally:
+            self._prefetch_executor.shutdown(wait=True)
+            self._write_executor.shutdown(wait=True)
+            self._prefetched.clear()
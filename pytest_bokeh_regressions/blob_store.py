@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing a content-addressed store for the arrays in test files. Each array is
+stored once as a .npy file named after the hash of its (rounded) content, so that test files
+for different bokeh versions (see ``--bokeh-with-version``) share identical arrays
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from .chunks import iter_chunks, process_chunk
+from .storage import BLOB_TYPE, _write_npy
+
+_DIGEST_PATTERN = re.compile(r"\b[0-9a-f]{64}\b")
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def array_digest(array: "np.ndarray", fp_precision: int, chunk_size: Optional[int] = None) -> str:
+    """
+    Compute the hash identifying an array in the blob store. The hash is computed from the
+    dtype, the shape and the bytes written to the .npy file, i.e. after rounding floating point arrays
+
+    :param array: the array
+    :param fp_precision: number of digits to use in floating point rounding
+    :param chunk_size: number of array elements hashed at once
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f"{array.dtype.newbyteorder('<').str}{array.shape}".encode("utf-8"))
+    for chunk in iter_chunks(array, chunk_size):
+        hasher.update(process_chunk(chunk, fp_precision).data)
+    return hasher.hexdigest()
+
+
+class BlobStore:
+    """
+    Directory of arrays stored under the hash of their content. Arrays read from the
+    store are kept in a LRU cache, so that arrays shared between multiple test files
+    are only read once per process
+
+    :param directory: directory of the store
+    :param max_bytes: size limit of the cache in bytes. Arrays larger than the limit are not cached
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 100 * 2**20) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, digest: str) -> Path:
+        """
+        Get the path of the .npy file of the blob with the given hash
+
+        :param digest: hash of the blob
+        """
+        return self.directory / digest[:2] / f"{digest}.npy"
+
+    def put(self, array: "np.ndarray", fp_precision: int, chunk_size: Optional[int] = None) -> str:
+        """
+        Add an array to the store, rounding floating point arrays. The array is only
+        written if no blob with the same hash exists
+
+        :param array: the array to store
+        :param fp_precision: number of digits to use in floating point rounding
+        :param chunk_size: number of array elements hashed and written at once
+
+        :returns: hash of the blob
+        """
+        digest = array_digest(array, fp_precision, chunk_size)
+        path = self.path(digest)
+        if not path.exists():
+            # Concurrent writers produce identical files, which are replaced atomically
+            _write_npy(path, array, fp_precision, chunk_size)
+        return digest
+
+    def get(self, digest: str) -> "np.ndarray":
+        """
+        Read the array of the blob with the given hash. The returned array is read-only,
+        since it is shared with other callers through the cache
+
+        :param digest: hash of the blob
+        """
+        import numpy as np
+
+        with self._lock:
+            array = self._cache.get(digest)
+            if array is not None:
+                self.hits += 1
+                self._cache.move_to_end(digest)
+                return array
+
+        try:
+            array = np.load(self.path(digest), allow_pickle=False)
+        except FileNotFoundError:
+            raise FileNotFoundError(  # pylint: disable=raise-missing-from
+                f"The blob {digest} referenced in the test file does not exist in the blob store {self.directory}"
+            )
+        array.setflags(write=False)
+
+        with self._lock:
+            self.misses += 1
+            if array.nbytes <= self.max_bytes and digest not in self._cache:
+                self._cache[digest] = array
+                self.nbytes += array.nbytes
+                while self.nbytes > self.max_bytes:
+                    self.nbytes -= self._cache.popitem(last=False)[1].nbytes
+        return array
+
+    def iter_blobs(self) -> Iterator[Tuple[str, Path]]:
+        """
+        Iterate over the hashes and paths of all blobs in the store
+        """
+        for path in sorted(self.directory.glob("*/*.npy")):
+            yield path.stem, path
+
+    def collect_garbage(self, test_files: Iterable[Path], dry_run: bool = False) -> List[Path]:
+        """
+        Remove the blobs not referenced in any of the given test files. All test files using
+        the store have to be given, since the blobs only referenced by other files are removed
+
+        :param test_files: paths to the test files using the store
+        :param dry_run: if True the unreferenced blobs are only returned, not removed
+
+        :returns: paths of the removed blobs
+        """
+        referenced: Set[str] = set()
+        for filename in test_files:
+            referenced |= _referenced_in_file(filename)
+
+        removed = []
+        for digest, path in self.iter_blobs():
+            if digest not in referenced:
+                removed.append(path)
+                if not dry_run:
+                    path.unlink()
+                    if not any(path.parent.iterdir()):
+                        path.parent.rmdir()
+        return removed
+
+
+def _referenced_in_file(filename: Path) -> Set[str]:
+    """
+    Get the hashes of all blobs referenced in a test file. Files without the shape of
+    a bokeh test file reference no blobs. For files, which cannot be parsed (e.g. test files
+    with merge conflicts), all hashes found in their content are treated as referenced
+
+    :param filename: path to the file
+    """
+    from .storage import is_document, load, read_content
+
+    try:
+        data = load(filename)
+    except Exception:  # pylint: disable=broad-except
+        try:
+            content = read_content(filename)
+        except Exception:  # pylint: disable=broad-except
+            content = filename.read_bytes()
+        return set(_DIGEST_PATTERN.findall(content.decode("latin-1")))
+    return referenced_blobs(data) if is_document(data) else set()
+
+
+def referenced_blobs(data: Any) -> Set[str]:
+    """
+    Get the hashes of all blobs referenced in the data loaded from a test file
+
+    :param data: data loaded from a test file
+    """
+    digests = set()
+    stack = [data]
+    while stack:
+        entry = stack.pop()
+        if isinstance(entry, dict):
+            if entry.get("type") == BLOB_TYPE:
+                digests.add(entry["sha256"])
+            else:
+                stack.extend(entry.values())
+        elif isinstance(entry, list):
+            stack.extend(entry)
+    return digests
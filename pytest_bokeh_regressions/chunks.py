@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the chunked processing of arrays, which is shared by the writing of
+arrays to test files (see :py:mod:`~pytest_bokeh_regressions.storage`), the blob store,
+the summaries and the comparison of arrays, so that large arrays are never copied as a whole
+"""
+from typing import Iterator, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DEFAULT_CHUNK_SIZE = 2**20
+
+
+def iter_chunks(array: "np.ndarray", chunk_size: Optional[int] = None) -> "Iterator[np.ndarray]":
+    """
+    Iterate over the elements of an array (in C order) in chunks of the given size.
+    For contiguous arrays (including memory-mapped ones) the chunks are views
+
+    :param array: array to iterate over
+    :param chunk_size: number of elements in each chunk
+    """
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    flat = array.reshape(-1)
+    for start in range(0, flat.size, chunk_size):
+        yield flat[start : start + chunk_size]
+
+
+def process_chunk(chunk: "np.ndarray", fp_precision: int) -> "np.ndarray":
+    """
+    Round a chunk of a floating point array and convert it to little-endian contiguous memory.
+    Chunks of arrays carrying their own precision (see :py:func:`~pytest_bokeh_regressions.rules.with_precision`)
+    are rounded to that precision
+
+    :param chunk: part of an array
+    :param fp_precision: number of digits to use in floating point rounding
+    """
+    import numpy as np
+    from .rules import array_precision
+
+    if chunk.dtype.kind == "f":
+        chunk = np.around(chunk, decimals=array_precision(chunk, fp_precision))
+    return np.ascontiguousarray(chunk, dtype=chunk.dtype.newbyteorder("<"))
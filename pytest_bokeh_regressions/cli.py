@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Command line interface for maintaining the test files of the bokeh regression fixtures
+without running the tests
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from . import maintenance
+
+
+def _gc(args: argparse.Namespace) -> int:
+    """
+    Remove the blobs not referenced by any test file
+    """
+    from .blob_store import BlobStore
+
+    store = BlobStore(args.store)
+    # Blobs are shared between all test files using the store, so only scanning
+    # a part of them would remove blobs still referenced by the other test files
+    parent = store.directory.resolve().parent
+    if not any(parent == path.resolve() or path.resolve() in parent.parents for path in args.paths):
+        print(
+            f"The given paths do not contain the directory {parent} of the blob store. All test files "
+            "using the store have to be scanned, since the blobs not referenced in them are removed",
+            file=sys.stderr,
+        )
+        return 1
+    removed = store.collect_garbage(maintenance.iter_test_files(args.paths), dry_run=args.dry_run)
+    for path in removed:
+        print(f"{'would remove' if args.dry_run else 'removed'} {path}")
+    print(f"{len(removed)} unreferenced blob(s) {'found' if args.dry_run else 'removed'} in {store.directory}")
+    return 0
+
+
+def _verify(args: argparse.Namespace) -> int:
+    """
+    Check that all test files can be parsed and the referenced arrays exist
+    """
+    # Files, which cannot be parsed, do not have the shape of a test file, but are reported
+    filenames = list(maintenance.iter_test_files(args.paths, check_content=False))
+    errors = [
+        error
+        for file_errors in maintenance.run_parallel(maintenance.verify_file, filenames, args.blob_store, jobs=args.jobs)
+        for error in file_errors
+    ]
+    for error in errors:
+        print(error)
+    print(f"{len(filenames)} test file(s) checked, {len(errors)} error(s)")
+    return 1 if errors else 0
+
+
+def _reclean(args: argparse.Namespace) -> int:
+    """
+    Round the floating point values in existing test files to a new precision
+    """
+    filenames = list(maintenance.iter_test_files(args.paths))
+    changed = maintenance.run_parallel(
+        maintenance.reclean_file, filenames, args.fp_precision, args.blob_store, jobs=args.jobs
+    )
+    for filename, file_changed in zip(filenames, changed):
+        if file_changed:
+            print(f"rewritten {filename}")
+    print(f"{sum(changed)} of {len(filenames)} test file(s) rewritten with fp precision {args.fp_precision}")
+    return 0
+
+
+def _convert(args: argparse.Namespace) -> int:
+    """
+    Rewrite test files with another codec
+    """
+    filenames = list(maintenance.iter_test_files(args.paths))
+    targets = maintenance.run_parallel(maintenance.convert_file, filenames, args.codec, jobs=args.jobs)
+    for filename, target in zip(filenames, targets):
+        if target is not None:
+            print(f"converted {filename} -> {target.name}")
+    print(f"{sum(target is not None for target in targets)} of {len(filenames)} test file(s) converted to {args.codec}")
+    return 0
+
+
+def _migrate(args: argparse.Namespace) -> int:
+    """
+    Move test files of bokeh 2 or older into versioned folders
+    """
+    filenames = list(maintenance.iter_test_files(args.paths))
+    is_v2 = maintenance.run_parallel(maintenance.is_v2_file, filenames, jobs=args.jobs)
+    v2_files = [filename for filename, v2_file in zip(filenames, is_v2) if v2_file]
+    moved = maintenance.migrate_files(v2_files, args.version, dry_run=args.dry_run)
+    for source, target in moved:
+        print(f"{'would move' if args.dry_run else 'moved'} {source} -> {target}")
+    print(
+        f"{len(v2_files)} test file(s) in the format of bokeh 2 found. Generate the test files for bokeh 3 "
+        "with --bokeh-with-version --bokeh-add-version"
+    )
+    return 0
+
+
+def _prune(args: argparse.Namespace) -> int:
+    """
+    Remove bokeh-<version> folders, which are not used for supported versions
+    """
+    removed = maintenance.prune_version_dirs(args.paths, args.min_version, dry_run=args.dry_run)
+    for path in removed:
+        print(f"{'would remove' if args.dry_run else 'removed'} {path}")
+    print(f"{len(removed)} stale version folder(s) {'found' if args.dry_run else 'removed'}")
+    return 0
+
+
+def _stats(args: argparse.Namespace) -> int:
+    """
+    Show size statistics of the test files
+    """
+    filenames = list(maintenance.iter_test_files(args.paths))
+    maintenance.print_stats(filenames, maintenance.run_parallel(maintenance.file_stats, filenames, jobs=args.jobs))
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Entry point of the ``bokeh-regressions`` command
+
+    :param argv: command line arguments (default: ``sys.argv[1:]``)
+    """
+    parser = argparse.ArgumentParser(
+        prog="bokeh-regressions", description="Maintain the test files of the bokeh regression fixtures"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    files_parser = argparse.ArgumentParser(add_help=False)
+    files_parser.add_argument(
+        "paths", type=Path, nargs="*", default=[Path(".")], help="test files or directories containing them"
+    )
+    jobs_parser = argparse.ArgumentParser(add_help=False)
+    jobs_parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="number of processes (default: number of CPUs)"
+    )
+    blob_parser = argparse.ArgumentParser(add_help=False)
+    blob_parser.add_argument("--blob-store", type=Path, default=None, help="directory of the blob store")
+    dry_run_parser = argparse.ArgumentParser(add_help=False)
+    dry_run_parser.add_argument("--dry-run", action="store_true", help="only list the changes")
+
+    gc_parser = subparsers.add_parser(
+        "gc", help="Remove blobs in a blob store not referenced by any test file", parents=[dry_run_parser]
+    )
+    gc_parser.add_argument("store", type=Path, help="directory of the blob store")
+    gc_parser.add_argument(
+        "paths",
+        type=Path,
+        nargs="+",
+        help="directories containing all test files using the blob store (at least the parent directory of the store)",
+    )
+    gc_parser.set_defaults(func=_gc)
+
+    verify_parser = subparsers.add_parser(
+        "verify",
+        help="Check that test files can be parsed and the arrays referenced in them exist",
+        parents=[files_parser, jobs_parser, blob_parser],
+    )
+    verify_parser.set_defaults(func=_verify)
+
+    reclean_parser = subparsers.add_parser(
+        "reclean",
+        help="Round the floating point values in test files to a new (lower) precision",
+        parents=[files_parser, jobs_parser, blob_parser],
+    )
+    reclean_parser.add_argument("--fp-precision", type=int, required=True, help="number of digits to round to")
+    reclean_parser.set_defaults(func=_reclean)
+
+    convert_parser = subparsers.add_parser(
+        "convert",
+        help="Rewrite test files with another codec (YAML or canonical JSON), keeping their compression format",
+        parents=[files_parser, jobs_parser],
+    )
+    convert_parser.add_argument("--codec", required=True, choices=("yaml", "json"), help="codec of the test files")
+    convert_parser.set_defaults(func=_convert)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate",
+        help="Move test files in the format of bokeh 2 or older into bokeh-<version> folders. The model "
+        "structure of these files cannot be converted, since the IDs of the models are removed when cleaning",
+        parents=[files_parser, jobs_parser, dry_run_parser],
+    )
+    migrate_parser.add_argument(
+        "--version", required=True, help="bokeh version used for producing the test files (e.g. 2.4.3)"
+    )
+    migrate_parser.set_defaults(func=_migrate)
+
+    prune_parser = subparsers.add_parser(
+        "prune",
+        help="Remove bokeh-<version> folders of versions older than --min-version, whose test files "
+        "are all available for newer versions",
+        parents=[files_parser, dry_run_parser],
+    )
+    prune_parser.add_argument("--min-version", required=True, help="oldest bokeh version to keep test files for")
+    prune_parser.set_defaults(func=_prune)
+
+    stats_parser = subparsers.add_parser(
+        "stats", help="Show size statistics of test files grouped by bokeh version", parents=[files_parser, jobs_parser]
+    )
+    stats_parser.set_defaults(func=_stats)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the codecs of the test files of the bokeh_json_regression fixture.
+
+- ``yaml``: the format of the data_regression fixture (``.yml``). The libyaml based C loader and
+  dumper of PyYAML are used if available, which produce the same files as the pure python implementation
+- ``json``: canonical JSON (``.json``) with sorted keys, an indentation of two spaces and floating point
+  values written as their shortest representation (``repr``). Files are read with orjson if it is installed
+
+The codec of a test file is given by its extension, so that test files of both codecs can be used side by side
+"""
+from pathlib import Path
+from typing import IO, Any, Dict, Optional
+
+
+class YAMLCodec:
+    """
+    Codec for YAML test files in the same format as written by the data_regression fixture
+    """
+
+    name = "yaml"
+    extension = ".yml"
+
+    def __init__(self) -> None:
+        self._dumper: Optional[type] = None
+
+    @property
+    def dumper(self) -> type:
+        """
+        Dumper class producing the same output as the ``RegressionYamlDumper`` of pytest-regressions.
+        The C emitter of libyaml is used if PyYAML was built with it. Representers registered
+        for the ``RegressionYamlDumper`` are used by both dumpers
+        """
+        if self._dumper is not None:
+            return self._dumper
+
+        import yaml
+        from pytest_regressions.data_regression import RegressionYamlDumper
+
+        dumper: type = RegressionYamlDumper
+        if getattr(yaml, "__with_libyaml__", False):
+            from yaml.cyaml import CEmitter
+
+            # pylint: disable-next=too-many-ancestors
+            class CRegressionYamlDumper(CEmitter, RegressionYamlDumper):  # type: ignore[misc]
+                """
+                ``RegressionYamlDumper`` emitting with libyaml
+                """
+
+                __init__ = yaml.CSafeDumper.__init__
+
+            dumper = CRegressionYamlDumper
+        self._dumper = dumper
+        return dumper
+
+    def dump(self, data: Any, stream: IO[bytes]) -> None:
+        """
+        Write data to a binary stream
+
+        :param data: the data to write
+        :param stream: binary stream
+        """
+        import yaml
+
+        yaml.dump_all(
+            [data],
+            stream,
+            Dumper=self.dumper,
+            default_flow_style=False,
+            allow_unicode=True,
+            indent=2,
+            encoding="utf-8",
+        )
+
+    @staticmethod
+    def load(stream: IO[bytes]) -> Any:
+        """
+        Read data from a binary stream
+
+        :param stream: binary stream
+        """
+        import yaml
+
+        return yaml.load(stream, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+class JSONCodec:
+    """
+    Codec for canonical JSON test files. The same data always gives the same file
+    """
+
+    name = "json"
+    extension = ".json"
+
+    @staticmethod
+    def dump(data: Any, stream: IO[bytes]) -> None:
+        """
+        Write data to a binary stream
+
+        :param data: the data to write
+        :param stream: binary stream
+        """
+        import json
+
+        stream.write(json.dumps(data, sort_keys=True, indent=2, ensure_ascii=False).encode("utf-8"))
+        stream.write(b"\n")
+
+    @staticmethod
+    def load(stream: IO[bytes]) -> Any:
+        """
+        Read data from a binary stream
+
+        :param stream: binary stream
+        """
+        import json
+
+        content = stream.read()
+        try:
+            import orjson
+        except ImportError:
+            return json.loads(content)
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # orjson does not support NaN and infinite values and integers beyond 64 bit
+            return json.loads(content)
+
+
+#: Supported codecs by their name
+CODECS: Dict[str, Any] = {YAMLCodec.name: YAMLCodec(), JSONCodec.name: JSONCodec()}
+
+DEFAULT_CODEC = "yaml"
+
+
+def get_codec(name: Optional[str]) -> Any:
+    """
+    Get the codec with the given name
+
+    :param name: name of the codec (None for the default codec)
+    """
+    if name is None:
+        name = DEFAULT_CODEC
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec {name!r}. Supported codecs: {', '.join(CODECS)}")
+    return CODECS[name]
+
+
+def codec_of(filename: Path) -> Any:
+    """
+    Get the codec of a test file from its extension. The suffix of a compression format
+    has to be removed beforehand. Files with other extensions are treated as YAML files
+
+    :param filename: path to the test file
+    """
+    for codec in CODECS.values():
+        if filename.name.endswith(codec.extension):
+            return codec
+    return CODECS[DEFAULT_CODEC]
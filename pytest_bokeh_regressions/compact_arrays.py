@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing a compact encoding of the arrays stored in the test files. Rounded floating point
+arrays are stored as integers scaled by ``10**fp_precision`` in the narrowest fitting integer dtype.
+Monotonic arrays (e.g. x values or indices) are stored as the differences of consecutive values
+and constant arrays only by their value.
+
+An array is only encoded if decoding gives exactly the same values as the rounded array,
+otherwise it is stored in the usual serialized form
+"""
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+COMPACT_TYPE = "compact"
+
+#: Integers with a larger absolute value are not encoded (no exact conversion to 64-bit integers)
+_MAX_INTEGER = 2**62
+
+
+def _narrowest(values: "np.ndarray") -> "np.ndarray":
+    """
+    Convert integers to the narrowest integer dtype containing all of them
+
+    :param values: 64-bit integer array
+    """
+    import numpy as np
+
+    minimum, maximum = int(values.min()), int(values.max())
+    for dtype in (np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= minimum and maximum <= info.max:
+            return values.astype(np.dtype(dtype).newbyteorder("<"))
+    return values.astype(np.dtype(np.int64).newbyteorder("<"))
+
+
+def _to_integers(array: "np.ndarray", fp_precision: int) -> "Optional[np.ndarray]":
+    """
+    Get the integers representing the (rounded) values of a flat array
+
+    :param array: flat integer or rounded floating point array
+    :param fp_precision: number of digits the array is rounded to
+
+    :returns: 64-bit integer array or None if the array has no integer representation
+    """
+    import numpy as np
+
+    if array.dtype.kind == "f":
+        if fp_precision < 0 or not np.all(np.isfinite(array)):
+            return None
+        array = np.rint(array * 10.0**fp_precision)
+    if array.min() <= -_MAX_INTEGER or array.max() >= _MAX_INTEGER:
+        return None
+    return array.astype(np.int64)
+
+
+def encode_compact(array: "np.ndarray", fp_precision: int) -> Optional[Dict[str, Any]]:
+    """
+    Encode a rounded array compactly. The integers (or differences of the integers for
+    monotonic arrays) are serialized into the bokeh representation of arrays
+
+    :param array: the array, floating point arrays have to be rounded already
+    :param fp_precision: number of digits the floating point values are rounded to
+
+    :returns: dict of the encoded array, which can be written to the test files, or None
+        if the array cannot be encoded losslessly in less space
+    """
+    from bokeh.core.serialization import Serializer
+    import numpy as np
+
+    if array.dtype.kind not in "iuf" or array.size == 0:
+        return None
+
+    flat = array.reshape(-1)
+    encoded: Dict[str, Any] = {"type": COMPACT_TYPE, "dtype": array.dtype.name, "shape": list(array.shape)}
+    if flat.size > 1 and np.all(flat == flat[0]):
+        encoded["constant"] = flat[0].item()
+        return encoded
+
+    integers = _to_integers(flat, fp_precision)
+    if integers is None:
+        return None
+    if array.dtype.kind == "f":
+        encoded["scale"] = fp_precision
+
+    differences = np.diff(integers)
+    if integers.size > 2 and (np.all(differences >= 0) or np.all(differences <= 0)):
+        encoded["start"] = int(integers[0])
+        if np.all(differences == differences[0]):
+            encoded["step"] = int(differences[0])
+        else:
+            encoded["data"] = _narrowest(differences)
+    else:
+        encoded["data"] = _narrowest(integers)
+
+    if "data" in encoded and encoded["data"].itemsize >= array.itemsize:
+        return None
+    # Only lossless encodings are used
+    if not np.array_equal(decode_compact(encoded), array):
+        return None
+    if "data" in encoded:
+        encoded["data"] = Serializer(deferred=False).serialize(encoded["data"]).content
+    return encoded
+
+
+def decode_compact(entry: Dict[str, Any]) -> "np.ndarray":
+    """
+    Decode an array encoded with :py:func:`encode_compact`
+
+    :param entry: dict of the encoded array (the integers may be serialized or numpy arrays)
+    """
+    from bokeh.core.serialization import Deserializer
+    import numpy as np
+
+    dtype = np.dtype(entry["dtype"])
+    shape = tuple(entry["shape"])
+    if "constant" in entry:
+        return np.full(shape, entry["constant"], dtype=dtype)
+
+    size = int(np.prod(shape))
+    if "step" in entry:
+        integers = entry["start"] + entry["step"] * np.arange(size, dtype=np.int64)
+    else:
+        data = entry["data"]
+        if isinstance(data, dict):
+            data = Deserializer().deserialize(data)
+        integers = np.asarray(data).astype(np.int64)
+        if "start" in entry:
+            integers = np.concatenate(([entry["start"]], entry["start"] + np.cumsum(integers)))
+
+    if "scale" in entry:
+        # Same operations as in np.around, so that the decoded values are identical to the rounded ones
+        return (integers.astype(dtype) / 10.0 ** entry["scale"]).astype(dtype, copy=False).reshape(shape)
+    return integers.astype(dtype).reshape(shape)
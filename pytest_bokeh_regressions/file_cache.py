@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the session wide cache of loaded test files, so that test files checked
+by several tests (e.g. parametrized tests using the same basename) are only read once. Decoded
+arrays of the cached test files are kept as well. The cache is bounded by a size limit
+(``bokeh_cache_size`` ini option), evicting the least recently used test files
+"""
+import os
+import re
+import sys
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, MutableMapping, Optional, Tuple
+
+import pytest
+
+#: Default size limit of the cache
+DEFAULT_CACHE_SIZE = "100M"
+
+_SIZE_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30}
+
+
+def parse_size(size: str) -> int:
+    """
+    Convert a size given in bytes with an optional suffix (K, M or G) to the number of bytes
+
+    :param size: the size, e.g. ``512K`` or ``100M``
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*([KMG]?)B?\s*", str(size), flags=re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid size {size!r}. Expected a number of bytes with an optional suffix K, M or G")
+    return int(match.group(1)) * _SIZE_UNITS[match.group(2).upper()]
+
+
+def estimate_size(data: Any) -> int:
+    """
+    Estimate the memory used by data loaded from a test file, i.e. by its nested dicts, lists and values
+
+    :param data: data loaded from a test file
+    """
+    nbytes = 0
+    stack = [data]
+    while stack:
+        entry = stack.pop()
+        nbytes += sys.getsizeof(entry)
+        if isinstance(entry, dict):
+            stack.extend(entry.keys())
+            stack.extend(entry.values())
+        elif isinstance(entry, list):
+            stack.extend(entry)
+    return nbytes
+
+
+def _file_state(filename: Path) -> Tuple[int, int]:
+    """
+    Get the modification time and size of a file, used to detect changes of cached test files
+
+    :param filename: path to the file
+    """
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class CachedFile:
+    """
+    Data of a cached test file and the arrays decoded from its entries
+
+    :param state: modification time and size of the test file when it was read
+    :param data: data loaded from the test file
+    :param nbytes: estimated size of the loaded data (see :py:func:`estimate_size`)
+    """
+
+    __slots__ = ("state", "data", "nbytes", "arrays")
+
+    def __init__(self, state: Tuple[int, int], data: MutableMapping, nbytes: int) -> None:
+        self.state = state
+        self.data = data
+        self.nbytes = nbytes
+        self.arrays: Dict[int, Tuple[Any, Any]] = {}
+
+
+class FileCache:
+    """
+    Least recently used cache of loaded test files keyed by their resolved path. Cached
+    test files are only used if their modification time and size did not change.
+    The cached data is shared between the checks, so it must not be modified
+
+    :param max_bytes: size limit of the cache. The size of cached test files is estimated from
+        the loaded data (see :py:func:`estimate_size`) plus the size of the decoded arrays kept in memory
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._files: "OrderedDict[Path, CachedFile]" = OrderedDict()
+
+    def _get(self, filename: Path) -> Optional[CachedFile]:
+        """
+        Get the cached test file if it did not change since it was read
+
+        :param filename: path to the test file
+        """
+        key = filename.resolve()
+        cached = self._files.get(key)
+        if cached is None:
+            return None
+        try:
+            state = _file_state(filename)
+        except OSError:
+            state = None
+        if state != cached.state:
+            self._remove(key)
+            return None
+        self._files.move_to_end(key)
+        return cached
+
+    def _remove(self, key: Path) -> None:
+        cached = self._files.pop(key)
+        self.nbytes -= cached.nbytes
+
+    def _evict(self) -> None:
+        """
+        Remove the least recently used test files until the cache is within its size limit
+        """
+        while self.nbytes > self.max_bytes and self._files:
+            self._remove(next(iter(self._files)))
+            self.evictions += 1
+
+    def __contains__(self, filename: Path) -> bool:
+        return self._get(filename) is not None
+
+    def load(self, filename: Path, load_fn: Callable[[Path], MutableMapping]) -> MutableMapping:
+        """
+        Get the data of a test file from the cache or load it with the given function
+
+        :param filename: path to the test file
+        :param load_fn: function loading the test file
+        """
+        cached = self._get(filename)
+        if cached is not None:
+            self.hits += 1
+            return cached.data
+
+        self.misses += 1
+        state = _file_state(filename)
+        data = load_fn(filename)
+        nbytes = estimate_size(data)
+        if nbytes <= self.max_bytes:
+            cached = CachedFile(state, data, nbytes)
+            self._files[filename.resolve()] = cached
+            self.nbytes += cached.nbytes
+            self._evict()
+        return data
+
+    def load_array(self, filename: Path, entry: Any, load_fn: Callable[[Any], Any]) -> Any:
+        """
+        Get the array decoded from an entry of a cached test file or decode it with the given function.
+        Arrays kept in the cache are read-only
+
+        :param filename: path to the test file
+        :param entry: entry of the data loaded from the test file
+        :param load_fn: function decoding the entry, returning None if the entry is no array
+        """
+        import numpy as np
+
+        cached = self._get(filename)
+        if cached is None:
+            return load_fn(entry)
+        # The entry is stored along with the array, so that the id of the entry is not reused
+        _, array = cached.arrays.get(id(entry), (None, None))
+        if array is not None:
+            return array
+
+        array = load_fn(entry)
+        # Memory-mapped arrays are not kept, so that no files stay open
+        if isinstance(array, np.ndarray) and not isinstance(array, np.memmap):
+            array.flags.writeable = False
+            cached.arrays[id(entry)] = (entry, array)
+            cached.nbytes += array.nbytes
+            self.nbytes += array.nbytes
+            self._evict()
+        return array
+
+
+class FileCacheReporter:
+    """
+    Plugin collecting the hits and misses of the cache of test files from the test reports
+    (also of pytest-xdist workers) and reporting them in the terminal summary
+
+    :param config: pytest config object
+    """
+
+    def __init__(self, config: pytest.Config) -> None:
+        self.config = config
+        self.counts: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        """
+        Collect the counts attached to the report of a test
+        """
+        for key, value in getattr(report, "bokeh_cache", {}).items():
+            self.counts[key] += value
+
+    def summary(self) -> List[str]:
+        """
+        Get the lines of the terminal summary
+        """
+        lookups = self.counts["hits"] + self.counts["misses"]
+        if lookups == 0:
+            return []
+        size = self.config.getini("bokeh_cache_size") or DEFAULT_CACHE_SIZE
+        return [
+            f"bokeh test file cache: {self.counts['hits']} hits, {self.counts['misses']} misses "
+            f"({100 * self.counts['hits'] / lookups:.1f}% hits), {self.counts['evictions']} evictions "
+            f"with a size limit of {size} (bokeh_cache_size)"
+        ]
+
+    def pytest_terminal_summary(self, terminalreporter: pytest.TerminalReporter) -> None:
+        """
+        Show the hits and misses of the cache
+        """
+        for line in self.summary():
+            terminalreporter.write_line(line)
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+Hook specifications of the pytest-bokeh-regressions plugin
+"""
+
+
+def pytest_bokeh_check_plot_timing(config, nodeid, timing):  # pylint: disable=unused-argument
+    """
+    Called for each ``check_plot`` call of the bokeh_json_regression fixture after the
+    test finished. When running with pytest-xdist this is called in the controller process.
+    The timings are only collected if an implementation of this hook is registered when
+    the test session starts (e.g. in a plugin or an initial conftest.py file)
+
+    :param config: pytest config object
+    :param nodeid: node ID of the test
+    :param timing: :py:class:`~pytest_bokeh_regressions.timing.CheckPlotTiming` with the
+        durations of the stages of the check and the size of the checked document
+    """
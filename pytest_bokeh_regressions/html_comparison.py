@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the HTML report of failed bokeh regression checks, showing the
+expected model (rebuilt from the test file) and the obtained model side by side
+"""
+import html
+import itertools
+import json
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, MutableMapping, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .blob_store import BlobStore
+
+REPORT_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Bokeh regression comparison</title>
+{resources}
+<style>
+body {{ font-family: sans-serif; margin: 1em 2em; }}
+section {{ border-top: 1px solid #ccc; padding: 0.5em 0; }}
+.comparison {{ display: flex; gap: 2em; }}
+.comparison > div {{ flex: 1; min-width: 0; }}
+.error {{ color: #b00; white-space: pre-wrap; }}
+</style>
+</head>
+<body>
+<h1>Bokeh regression comparison</h1>
+<p>{n_comparisons} failed check(s). Bokeh version: {bokeh_version}</p>
+{sections}
+</body>
+</html>
+"""
+
+SECTION_TEMPLATE = """<section>
+<h2>{title}</h2>
+<p>Test file: <code>{filename}</code></p>
+<div class="comparison">
+<div><h3>Expected</h3>{expected}</div>
+<div><h3>Obtained</h3>{obtained}</div>
+</div>
+<script type="text/javascript">{script}</script>
+</section>
+"""
+
+
+def rebuild_model(data: MutableMapping, filename: Path, blob_store: "Optional[BlobStore]" = None) -> Any:
+    """
+    Rebuild a bokeh model from the cleaned JSON data in a test file. The IDs removed
+    during cleaning are replaced by new ones. References to models appearing multiple times
+    are removed by the cleaning, so the corresponding properties have their default values.
+    Arrays stored only as summaries are replaced by empty arrays.
+    Only supported for bokeh 3 or newer
+
+    :param data: data loaded from the test file
+    :param filename: path to the test file (used for loading arrays stored in .npy files)
+    :param blob_store: store containing the arrays referenced by hash
+
+    :returns: the rebuilt bokeh model
+    """
+    from bokeh.core.serialization import Deserializer, Serializer
+    import numpy as np
+    from . import storage
+    from .compact_arrays import COMPACT_TYPE
+    from .summary import SUMMARY_TYPE
+
+    serializer = Serializer(deferred=False)
+    prefix = uuid.uuid4().hex[:8]
+    counter = itertools.count()
+
+    def _rebuild(entry):
+        if isinstance(entry, dict):
+            if entry.get("type") in (storage.SIDECAR_TYPE, storage.BLOB_TYPE, COMPACT_TYPE):
+                return serializer.serialize(storage.load_array(entry, filename, blob_store)).content
+            if entry.get("type") == SUMMARY_TYPE:
+                return serializer.serialize(np.zeros(0, dtype=entry["dtype"])).content
+            entry = {key: _rebuild(val) for key, val in entry.items()}
+            if entry.get("type") == "object" and "id" not in entry:
+                entry["id"] = f"expected-{prefix}-{next(counter)}"
+            return entry
+        if isinstance(entry, list):
+            return [_rebuild(val) for val in entry]
+        return entry
+
+    return Deserializer().deserialize(_rebuild(data))
+
+
+def render_comparison(
+    nodeid: str, basename: str, obtained: Dict[str, Any], filename: Path, blob_store: "Optional[BlobStore]" = None
+) -> Dict[str, Any]:
+    """
+    Prepare the comparison of a failed check for the HTML report. The expected model is
+    rebuilt from the test file and converted in the same way as the obtained model
+
+    :param nodeid: node ID of the test
+    :param basename: basename of the test file
+    :param obtained: the obtained model converted with ``bokeh.embed.json_item``
+    :param filename: path to the test file
+    :param blob_store: store containing the arrays referenced by hash
+
+    :returns: dict with the items to embed in the report or error messages if the
+        expected model could not be rebuilt
+    """
+    from bokeh.embed import json_item
+    from . import storage
+    from .json_comparison import BOKEH_LT_3
+
+    comparison = {
+        "nodeid": nodeid,
+        "basename": basename,
+        "filename": str(filename),
+        "obtained": obtained,
+        "expected": None,
+        "error": None,
+    }
+    if BOKEH_LT_3:
+        comparison["error"] = "Rebuilding the expected model is only supported for bokeh 3 or newer"
+        return comparison
+
+    try:
+        comparison["expected"] = json_item(rebuild_model(storage.load(filename), filename, blob_store))
+    except Exception as exc:  # pylint: disable=broad-except
+        comparison["error"] = f"Could not rebuild the expected model from the test file: {exc!r}"
+    return comparison
+
+
+class HTMLComparisonWriter:
+    """
+    Prepares the comparisons of failed checks on a background thread pool and writes
+    them to a directory. The comparisons are combined into a single report at the end
+    of the test session using :py:func:`write_report`
+
+    :param directory: directory for the comparisons
+    :param max_workers: number of threads used for rebuilding the expected models and writing the files
+    :param blob_store: store containing the arrays referenced by hash in the test files
+    """
+
+    def __init__(self, directory: Path, max_workers: int = 2, blob_store: "Optional[BlobStore]" = None) -> None:
+        self.directory = directory
+        self.blob_store = blob_store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bokeh-html-comparison")
+        self._futures: List[Future] = []
+
+    def submit(self, nodeid: str, basename: str, model: Any, filename: Path) -> None:
+        """
+        Schedule the comparison of the given model against the test file.
+        The model is converted immediately, so that later changes of the model in the test
+        do not affect the comparison
+
+        :param nodeid: node ID of the test
+        :param basename: basename of the test file
+        :param model: the obtained bokeh model
+        :param filename: path to the test file
+        """
+        from bokeh.embed import json_item
+
+        obtained = json_item(model)
+        self._futures.append(self._executor.submit(self._write, nodeid, basename, obtained, filename))
+
+    def _write(self, nodeid: str, basename: str, obtained: Dict[str, Any], filename: Path) -> None:
+        """
+        Prepare the comparison and write it to the directory
+
+        :param nodeid: node ID of the test
+        :param basename: basename of the test file
+        :param obtained: the obtained model converted with ``bokeh.embed.json_item``
+        :param filename: path to the test file
+        """
+        from .storage import atomic_write
+
+        comparison = render_comparison(nodeid, basename, obtained, filename, self.blob_store)
+        atomic_write(self.directory / f"{uuid.uuid4().hex}.json", json.dumps(comparison).encode("utf-8"))
+
+    def close(self) -> None:
+        """
+        Wait until all scheduled comparisons are written
+        """
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+        self._futures.clear()
+
+
+def _embed(item: Optional[Dict[str, Any]], target_id: str) -> str:
+    """
+    Get the script embedding the given item into the element with the given ID
+
+    :param item: model converted with ``bokeh.embed.json_item``
+    :param target_id: ID of the element
+    """
+    if item is None:
+        return ""
+    # Prevent closing the script tag inside the JSON data
+    data = json.dumps(item).replace("</", "<\\/")
+    return f"Bokeh.embed.embed_item({data}, {json.dumps(target_id)});"
+
+
+def write_report(directory: Path, filename: Path) -> Optional[int]:
+    """
+    Combine the comparisons written by :py:class:`HTMLComparisonWriter` (possibly from multiple
+    processes) into a single HTML file, which loads the BokehJS resources only once
+
+    :param directory: directory containing the rendered comparisons
+    :param filename: path of the HTML file
+
+    :returns: number of comparisons in the report or None if there are no comparisons
+    """
+    if not directory.is_dir():
+        return None
+
+    comparisons = [json.loads(path.read_text(encoding="utf-8")) for path in directory.glob("*.json")]
+    if not comparisons:
+        return None
+
+    from bokeh.resources import CDN
+    from .versioning import get_bokeh_version
+
+    comparisons.sort(key=lambda comparison: (comparison["nodeid"], comparison["basename"]))
+
+    sections = []
+    for index, comparison in enumerate(comparisons):
+        expected_id, obtained_id = f"bk-comparison-{index}-expected", f"bk-comparison-{index}-obtained"
+        expected = f'<div id="{expected_id}"></div>'
+        if comparison["error"] is not None:
+            expected = f'<p class="error">{html.escape(comparison["error"])}</p>'
+        sections.append(
+            SECTION_TEMPLATE.format(
+                title=html.escape(f"{comparison['nodeid']} [{comparison['basename']}]"),
+                filename=html.escape(comparison["filename"]),
+                expected=expected,
+                obtained=f'<div id="{obtained_id}"></div>',
+                script=_embed(comparison["expected"], expected_id) + _embed(comparison["obtained"], obtained_id),
+            )
+        )
+
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    filename.write_text(
+        REPORT_TEMPLATE.format(
+            resources=CDN.render(),
+            n_comparisons=len(comparisons),
+            bokeh_version=html.escape(get_bokeh_version()),
+            sections="\n".join(sections),
+        ),
+        encoding="utf-8",
+    )
+    return len(comparisons)
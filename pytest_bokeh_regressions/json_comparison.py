@@ -2,23 +2,43 @@
 """
 Module providing the BokehJSONComparisonFixture class used in the bokeh_json_regression fixture
 """
-from typing import Callable, Optional, TYPE_CHECKING, MutableSequence, MutableMapping, Set
-from packaging.version import Version
+import re
+import sys
+from functools import partial
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    TYPE_CHECKING,
+    MutableSequence,
+    MutableMapping,
+    Set,
+    Tuple,
+)
 
 import pytest
 
 if TYPE_CHECKING:
+    import numpy as np
+    from .timing import CheckPlotTiming
+    from .html_comparison import HTMLComparisonWriter
+    from .rules import CleaningRules
+    from .blob_store import BlobStore
+    from .background_io import BackgroundIO
+    from .file_cache import FileCache
     from pytest_regressions.data_regression import DataRegressionFixture
     from pytest_datadir import LazyDataDir
+    import bokeh.models
 
-try:
-    import bokeh
+from .array_check import ArrayCheckMixin, ArrayCheckOptions
+from .versioning import get_bokeh_version, is_bokeh_lt_3
 
-    BOKEH_VERSION = bokeh.__version__
-    BOKEH_LT_3 = Version(BOKEH_VERSION) < Version("3.0.0")
-except ImportError:
-    BOKEH_VERSION = "unknown"
-    BOKEH_LT_3 = False
+BOKEH_VERSION = get_bokeh_version()
+BOKEH_LT_3 = is_bokeh_lt_3()
 
 
 def _clean_sequence(
@@ -42,56 +62,220 @@ def _clean_sequence(
     return sequence
 
 
-def _clean_bokeh_json_v3(data: MutableMapping, fp_precision: int) -> MutableMapping:
+def _remove_empty_entries(visited: List[Tuple[Any, bool]]) -> None:
+    """
+    Remove the empty entries of cleaned containers in place: entries of dicts, which are None or
+    empty lists/dicts, and empty dicts in lists, if requested for the list
+
+    :param visited: cleaned containers and whether empty dicts are removed from them (for lists)
+        in the order in which they were visited, i.e. parents before their children
+    """
+
+    def _is_empty(entry):
+        return entry is None or (isinstance(entry, (list, dict)) and not entry)
+
+    # Children are always visited after their parents, so going through the
+    # visited containers in reverse order filters out nested empty entries first
+    for cleaned, filter_empty_dicts in reversed(visited):
+        if isinstance(cleaned, dict):
+            for key in [key for key, val in cleaned.items() if _is_empty(val)]:
+                del cleaned[key]
+        elif filter_empty_dicts and any(isinstance(val, dict) and not val for val in cleaned):
+            cleaned[:] = [val for val in cleaned if not (isinstance(val, dict) and not val)]
+
+
+# The helpers of the single pass share the state of the traversal (stack, memo, rules) as closures
+def _clean_bokeh_json_v3(  # pylint: disable=too-many-locals,too-many-statements
+    data: MutableMapping,
+    fp_precision: int,
+    keep_arrays: bool = False,
+    memo: Optional[Dict[int, Tuple]] = None,
+    rules: "Optional[CleaningRules]" = None,
+) -> MutableMapping:
     """
     Clean JSON data produced by converting bokeh models to JSON in versions
     of bokeh of 3.0 or newer
 
+    The document is walked once using an explicit stack, so that arbitrarily deep
+    documents can be cleaned and the runtime stays linear in the size of the document.
+    Cleaned containers are created when their parent is visited and are filtered
+    (removal of empty entries) once all their children are processed
+
     :param data: data to clean
     :param fp_precision: number of digits to use in floating point rounding
+    :param keep_arrays: if True binary encoded arrays are returned as numpy arrays instead
+        of their serialized form. Floating point arrays are not rounded in this case and the
+        arrays are views of the serialized data where possible
+    :param memo: dict for reusing the cleaned representations of models between multiple calls.
+        Representations of models are only cleaned once, if the same object appears in the data
+        passed to multiple calls (see :py:class:`~pytest_bokeh_regressions.memo_serialization.BatchSerializer`).
+        Has to be used with the same arguments in each call
+    :param rules: compiled rules for dropping attributes of models and entries of dict attributes
+        and for using a different precision for them (see :py:class:`~pytest_bokeh_regressions.rules.CleaningRules`).
+        Dropped entries are skipped before their arrays are decoded. Arrays kept as numpy arrays
+        carry the precision of the rule, which is used when they are rounded later
     """
     from bokeh.core.serialization import Buffer, Deserializer, Serializer
     import numpy as np
     import numbers
+    from .rules import DROP, with_precision
+
+    rules = rules or None
 
-    def _clean_basic_entry_v3(entry, fp_precision):
+    serializer = Serializer(deferred=False)
+    deserializer = Deserializer()
+    float_dtypes = {np.dtype(char).name for char in np.typecodes["AllFloat"]}
+
+    def _clean_basic_entry_v3(entry, precision):
         if isinstance(entry, Buffer):
             return entry.to_base64()
         if isinstance(entry, str):
             return str(entry)
         if isinstance(entry, numbers.Real) and not isinstance(entry, numbers.Integral):
-            return round(float(entry), fp_precision)
+            return round(float(entry), precision)
         return entry
 
-    if data.get("type") == "ndarray":
-        array = Deserializer().deserialize(data)
-        if array.dtype.char in np.typecodes["AllFloat"]:
-            array = np.around(array, decimals=fp_precision)
-            data = Serializer().serialize(array).content
-    if data.get("type") == "typed_array" and data.get("dtype") in ("float32", "float64"):
-        array = Deserializer().deserialize(data)
-        array = np.around(array, decimals=fp_precision)
-        data = Serializer().serialize(array).content
-
-    # Remove IDs
-    data = {key: val for key, val in data.items() if key not in ("id", "root_ids")}
+    def _view_array(entry):
+        # Arrays kept as numpy arrays are not copied, if the data is still in the buffer produced
+        # by the serializer. So for big arrays no additional memory is needed
+        data = entry["array"]
+        if not (isinstance(data, dict) and data.get("type") == "bytes" and isinstance(data.get("data"), Buffer)):
+            return np.asarray(deserializer.deserialize(entry))
+        array = np.frombuffer(data["data"].data, dtype=entry["dtype"])
+        if entry["order"] != sys.byteorder:
+            array = array.byteswap()
+        if len(entry.get("shape", [])) > 1:
+            array = array.reshape(entry["shape"])
+        return array
+
+    def _decode_array(entry):
+        if entry.get("type") == "ndarray" and entry.get("dtype") in float_dtypes:
+            return _view_array(entry) if keep_arrays else deserializer.deserialize(entry)
+        if entry.get("type") == "typed_array" and entry.get("dtype") in ("float32", "float64"):
+            return _view_array(entry) if keep_arrays else np.asarray(deserializer.deserialize(entry))
+        if keep_arrays and entry.get("type") == "ndarray" and entry.get("dtype") != "object":
+            return _view_array(entry)
+        return None
+
+    stack: list = []
+    visited: list = []
+
+    def _schedule(entry, filter_empty_dicts, precision, context=None):
+        if isinstance(entry, dict):
+            # Models inside entries with a different precision are not memoized, since
+            # their cleaned representation depends on it
+            if memo is not None and precision == fp_precision and entry.get("type") == "object":
+                memoized = memo.get(id(entry))
+                if memoized is not None and memoized[0] is entry:
+                    return memoized[1]
+                memo[id(entry)] = (entry, {})
+                stack.append((entry, memo[id(entry)][1], filter_empty_dicts, precision, None))
+                return memo[id(entry)][1]
+            array = _decode_array(entry)
+            if array is not None:
+                if keep_arrays:
+                    return array if precision == fp_precision else with_precision(array, precision)
+                entry = serializer.serialize(np.around(array, decimals=precision)).content
+            cleaned = {}
+        elif isinstance(entry, (list, tuple)):
+            cleaned = []
+        else:
+            return _clean_basic_entry_v3(entry, precision)
+        stack.append((entry, cleaned, filter_empty_dicts, precision, context))
+        return cleaned
 
-    for key, val in data.items():
-        if isinstance(val, dict):
-            data[key] = _clean_bokeh_json_v3(val, fp_precision=fp_precision)
-        elif isinstance(val, (list, tuple)):
-            val = _clean_sequence(_clean_bokeh_json_v3, _clean_basic_entry_v3, list(val), fp_precision)
-            # Filter out empty dictionaries
-            while {} in val:
-                val.remove({})
-            data[key] = val
+    def _schedule_attributes(entry, cleaned, precision, model):
+        # Rules are looked up before the attribute is scheduled, so dropped attributes are never decoded
+        for key, val in entry.items():
+            action = rules.attribute(model, key)
+            if action == DROP:
+                continue
+            context = ("map", model, key) if rules.has_keys(model, key) else None
+            cleaned[key] = _schedule(val, True, precision if action is None else action, context)
+
+    def _schedule_entries(entry, cleaned, precision, model, attribute):
+        for val in entry:
+            action = None
+            if isinstance(val, (list, tuple)) and len(val) == 2 and isinstance(val[0], str):
+                action = rules.key(model, attribute, val[0])
+            if action == DROP:
+                continue
+            cleaned.append(_schedule(val, False, precision if action is None else action))
+
+    root = _schedule(data, False, fp_precision)
+    while stack:
+        entry, cleaned, filter_empty_dicts, precision, context = stack.pop()
+        if context is not None and context[0] == "attributes":
+            _schedule_attributes(entry, cleaned, precision, context[1])
+        elif context is not None and context[0] == "entries":
+            _schedule_entries(entry, cleaned, precision, context[1], context[2])
+        elif isinstance(cleaned, dict):
+            child_contexts: Dict[str, tuple] = {}
+            if rules is not None and entry.get("type") == "object":
+                child_contexts["attributes"] = ("attributes", entry.get("name"))
+            elif context is not None and entry.get("type") == "map":
+                # Entries of dict attributes with rules for their keys
+                child_contexts["entries"] = ("entries", *context[1:])
+            for key, val in entry.items():
+                # Remove IDs
+                if key not in ("id", "root_ids"):
+                    # Only lists directly contained in dicts have empty dictionaries filtered out
+                    cleaned[key] = _schedule(val, True, precision, child_contexts.get(key))
         else:
-            data[key] = _clean_basic_entry_v3(val, fp_precision=fp_precision)
+            cleaned.extend(_schedule(val, False, precision) for val in entry)
+        visited.append((cleaned, filter_empty_dicts))
 
-    # Filter out empty entries
-    data = {key: val for key, val in data.items() if val not in (None, [], {})}
+    _remove_empty_entries(visited)
+    return root
 
-    return data
+
+def _normalize_list_of_dicts(list_of_dicts: List[dict]) -> List[dict]:
+    """
+    Sort a list of dicts into a canonical order, which does not depend on the order
+    in which bokeh produced the entries (used for cleaning JSON data of bokeh versions older than 3.0)
+
+    The sort key of each dict contains for each key found in any of the (nested) dicts
+    (``type`` first, then alphabetically) the values found under this key. The positions
+    of the keys are computed once, so that building the sort key is linear in the size of each dict
+
+    :param list_of_dicts: list of dicts to sort
+    """
+    contained_keys: Set[str] = set()
+    stack = list(list_of_dicts)
+    while stack:
+        dict_val = stack.pop()
+        contained_keys.update(dict_val.keys())
+        stack.extend(val for val in dict_val.values() if isinstance(val, dict))
+    contained_keys.discard("type")
+    key_positions = {key: position for position, key in enumerate(["type"] + sorted(contained_keys))}
+
+    def _add_sort_entries(dict_val, sort_key):
+        for key, val in dict_val.items():
+            entries = sort_key[key_positions[key]]
+            if isinstance(val, dict):
+                _add_sort_entries(val, sort_key)
+                entries.extend(sorted(val.keys()))
+                continue
+
+            if not isinstance(val, list):
+                val = [val]
+
+            for v in val:
+                if isinstance(v, dict):
+                    entries.extend(sorted(v.items()))
+                elif isinstance(v, (float, int)):
+                    entries.append(str(v))
+                else:
+                    entries.append(v)
+
+    def _sort_key(dict_val):
+        # The keys are the same for all positions, so only the list of values
+        # per position is needed for the comparison
+        sort_key: List[list] = [[] for _ in key_positions]
+        _add_sort_entries(dict_val, sort_key)
+        return sort_key
+
+    return sorted(list_of_dicts, key=_sort_key)
 
 
 def _clean_bokeh_json_v2(data, fp_precision):
@@ -105,45 +289,6 @@ def _clean_bokeh_json_v2(data, fp_precision):
     from bokeh.util.serialization import decode_base64_dict, encode_base64_dict  # pylint: disable=no-name-in-module
     import numpy as np
 
-    def get_contained_keys(dict_val):
-        keys = set(dict_val.keys())
-        for val in dict_val.values():
-            if isinstance(val, dict):
-                keys = keys.union(get_contained_keys(val))
-
-        return keys
-
-    def get_normalized_order(dict_val, key_order, normed=None):
-        if normed is None:
-            normed = [(key, []) for key in key_order]
-        for key, val in dict_val.items():
-            index = key_order.index(key)
-            if isinstance(val, dict):
-                normed = get_normalized_order(val, key_order, normed=normed)
-                normed[index][1].extend(sorted(val.keys()))
-            else:
-                if not isinstance(val, list):
-                    val = [val]
-
-                for v in val:
-                    if isinstance(v, dict):
-                        normed[index][1].extend(sorted(v.items()))
-                    elif isinstance(v, (float, int)):
-                        normed[index][1].append(str(v))
-                    else:
-                        normed[index][1].append(v)
-
-        return normed
-
-    def normalize_list_of_dicts(list_of_dicts: list[dict]) -> list[dict]:
-        contained_keys: Set[str] = set()
-        for data in list_of_dicts:
-            contained_keys = contained_keys.union(get_contained_keys(data))
-        contained_keys.discard("type")
-        key_order = ["type"] + sorted(contained_keys)
-
-        return sorted(list_of_dicts, key=lambda x: tuple(get_normalized_order(x, key_order)))
-
     def _clean_data_entry(entry, fp_precision):
         for key, val in entry.items():
             if "__ndarray__" in val:
@@ -168,11 +313,10 @@ def _clean_bokeh_json_v2(data, fp_precision):
             val = _clean_sequence(_clean_bokeh_json_v2, lambda x, fp_precision: x, list(val), fp_precision)
 
             # Filter out empty dictionaries
-            while {} in val:
-                val.remove({})
+            val = [x for x in val if x != {}]
 
             if all(isinstance(x, dict) for x in val):
-                data[key] = normalize_list_of_dicts(val)
+                data[key] = _normalize_list_of_dicts(val)
             else:
                 data[key] = val
         elif isinstance(val, float):
@@ -188,20 +332,91 @@ else:
     default_json_clean_fn = _clean_bokeh_json_v3
 
 
-class BokehJSONComparisonFixture:
+#: Engines producing the cleaned data: serializing and cleaning separately (``clean``) or
+#: producing the cleaned data while serializing (``serializer``, bokeh 3 or newer)
+ENGINES = ("clean", "serializer")
+
+
+class BokehJSONComparisonFixture(ArrayCheckMixin):  # pylint: disable=too-many-instance-attributes
     """
     Implementation of the bokeh_json_regression fixture
     """
 
-    def __init__(
-        self, data_regression: "LazyDataDir", request: pytest.FixtureRequest, clean_fn: Callable = default_json_clean_fn
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        data_regression: "DataRegressionFixture",
+        request: pytest.FixtureRequest,
+        clean_fn: Callable = default_json_clean_fn,
+        versioned_datadirs: Optional[Callable[[str], Tuple["LazyDataDir", Path]]] = None,
+        html_comparison: "Optional[HTMLComparisonWriter]" = None,
+        cleaning_rules: "Optional[CleaningRules]" = None,
+        blob_store: "Optional[BlobStore]" = None,
+        summary_threshold: Optional[int] = None,
+        compression: Optional[str] = None,
+        engine: str = "clean",
+        background_io: "Optional[BackgroundIO]" = None,
+        codec: Optional[str] = None,
+        file_cache: "Optional[FileCache]" = None,
+        collect_timings: bool = True,
     ) -> None:
+        from .codec import get_codec
+
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}. Supported engines: {', '.join(ENGINES)}")
+        get_codec(codec)
         self.data_regression = data_regression
         self.request = request
         self.clean_fn = clean_fn
-
-    def check_plot(
-        self, model: "bokeh.models.Model", basename: Optional[str] = None, fp_precision: Optional[int] = None
+        self.versioned_datadirs = versioned_datadirs
+        self.html_comparison = html_comparison
+        self.cleaning_rules = cleaning_rules
+        self.blob_store = blob_store
+        self.summary_threshold = summary_threshold
+        self.compression = compression
+        self.engine = engine
+        self.background_io = background_io
+        self.codec = codec
+        self.file_cache = file_cache
+        self.collect_timings = collect_timings
+        self._prefetched: Optional[Path] = None
+
+    def prefetch(self) -> None:
+        """
+        Start loading the test file of the test (i.e. the one used if no basename is given)
+        in the background, so that reading it overlaps with the construction of the plot in the test.
+        Test files are only prefetched if the options select the comparison keeping the arrays, since the other
+        checks only load the test file if it differs from the obtained file
+        """
+        from . import storage
+
+        if self.background_io is None or not self._array_options().keeps_arrays:
+            return
+        basename = self._basename(None)
+        original_datadir = Path(self.data_regression.original_datadir)
+        if self.versioned_datadirs is not None:
+            _, original_datadir = self.versioned_datadirs(f"{basename}.yml")
+        filename = storage.find_test_file(Path(original_datadir), basename)
+        if filename.is_file() and (self.file_cache is None or filename not in self.file_cache):
+            self.background_io.prefetch(filename)
+            self._prefetched = filename
+
+    def discard_prefetch(self) -> None:
+        """
+        Drop the test file prefetched by :py:meth:`prefetch` if it was not used by the checks of the test
+        (e.g. if the test failed before the check or used another basename)
+        """
+        if self._prefetched is not None and self.background_io is not None:
+            self.background_io.discard(self._prefetched)
+            self._prefetched = None
+
+    def check_plot(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        model: "bokeh.models.Model",
+        basename: Optional[str] = None,
+        fp_precision: Optional[int] = None,
+        rtol: Optional[float] = None,
+        atol: Optional[float] = None,
+        summary_threshold: Optional[int] = None,
     ) -> None:
         """
         Checks the given bokeh model against json data obtained from previous test runs using the data_regression
@@ -219,26 +434,500 @@ class BokehJSONComparisonFixture:
 
         :param fp_precision: If given, round all floats in the dict to the given number of digits.
 
+        :param rtol: If given (or ``atol`` is given), floating point arrays are not rounded but compared
+            to the arrays in the test file using ``np.allclose`` with this relative tolerance.
+            Only supported for bokeh 3 or newer.
+
+        :param atol: If given (or ``rtol`` is given), floating point arrays are not rounded but compared
+            to the arrays in the test file using ``np.allclose`` with this absolute tolerance.
+            Only supported for bokeh 3 or newer.
+
+        :param summary_threshold: If given, arrays with at least this number of elements are not stored
+            in the test file, but only their summary (dtype, shape, statistics, quantiles, number of NaN values
+            and a hash of the rounded data), which is compared instead of the data. With ``rtol``/``atol``
+            the statistics are compared using these tolerances and the hash is ignored. Overrides the threshold
+            given in the ``bokeh_summary`` marker. Only supported for bokeh 3 or newer.
+
         ``basename`` and ``fullpath`` are exclusive.
         """
         __tracebackhide__ = True  # pylint: disable=unused-variable
+        self._check_model(model, basename, self._array_options(fp_precision, rtol, atol, summary_threshold))
+
+    def check_plots(
+        self,
+        models: Mapping[str, "bokeh.models.Model"],
+        fp_precision: Optional[int] = None,
+        rtol: Optional[float] = None,
+        atol: Optional[float] = None,
+        summary_threshold: Optional[int] = None,
+    ) -> None:
+        """
+        Checks multiple bokeh models against json data obtained from previous test runs in the same
+        way as :py:meth:`check_plot`. Models shared between the given models (e.g. data sources used in
+        a grid of figures and each figure on its own) are only serialized and cleaned once (not with
+        the ``serializer`` engine).
+
+        All models are checked, if any of the checks fail the errors are raised together.
+
+        :param models: dict of the basenames of the test files and the bokeh models to check
+
+        :param fp_precision: If given, round all floats in the dict to the given number of digits.
+
+        :param rtol: relative tolerance for comparing floating point arrays (see :py:meth:`check_plot`)
+
+        :param atol: absolute tolerance for comparing floating point arrays (see :py:meth:`check_plot`)
+
+        :param summary_threshold: arrays with at least this number of elements are compared by their
+            summaries (see :py:meth:`check_plot`)
+        """
+        __tracebackhide__ = True  # pylint: disable=unused-variable
+
+        serialize: Callable[["bokeh.models.Model"], MutableMapping] = self._serialize
+        clean_memo: Optional[Dict[int, Tuple]] = None
+        if not BOKEH_LT_3:
+            from .memo_serialization import BatchSerializer, is_supported
+
+            # Without the memoization (unknown bokeh versions) the shared models are serialized for each model
+            if is_supported():
+                serialize = BatchSerializer(models.values()).serialize
+                clean_memo = {}
+
+        options = self._array_options(fp_precision, rtol, atol, summary_threshold)
+        differences, failures = [], []
+        for basename, model in models.items():
+            try:
+                self._check_model(model, basename, options, serialize=serialize, clean_memo=clean_memo)
+            except AssertionError as exc:
+                differences.append(str(exc))
+            except pytest.fail.Exception as exc:
+                failures.append(str(exc))
+
+        if differences:
+            raise AssertionError("\n\n".join(differences + failures))
+        if failures:
+            pytest.fail("\n\n".join(failures))
+
+    def _check_model(
+        self,
+        model: "bokeh.models.Model",
+        basename: Optional[str],
+        options: ArrayCheckOptions,
+        serialize: "Optional[Callable[[bokeh.models.Model], MutableMapping]]" = None,
+        clean_memo: Optional[Dict[int, Tuple]] = None,
+    ) -> None:
+        """
+        Check a single bokeh model against its test file, recording the durations of
+        the stages and the html comparison if the check fails
 
+        :param model: a bokeh model to check
+        :param basename: basename of the file. If not given the name of the test is used.
+        :param options: options of the check
+        :param serialize: function converting the model to its JSON representation
+        :param clean_memo: memo passed to the default cleaning function for bokeh 3 or newer
+        """
+        __tracebackhide__ = True  # pylint: disable=unused-variable
+        from .timing import CheckPlotTiming
+
+        if self.versioned_datadirs is not None:
+            # Choose the bokeh-<version> subfolder containing this specific test file
+            self.data_regression.datadir, self.data_regression.original_datadir = self.versioned_datadirs(
+                f"{self._basename(basename)}.yml"
+            )
+
+        timing = CheckPlotTiming(self._basename(basename), with_document_stats=self.collect_timings)
+        try:
+            self._check_plot(model, timing, options, serialize=serialize or self._serialize, clean_memo=clean_memo)
+        except AssertionError:
+            # The data differs from the existing test file
+            if self.html_comparison is not None:
+                self.html_comparison.submit(
+                    self.request.node.nodeid,
+                    timing.basename,
+                    model,
+                    self._source_filename(timing.basename),
+                )
+            raise
+        finally:
+            if self.collect_timings:
+                node = self.request.node
+                if not hasattr(node, "_bokeh_timings"):
+                    node._bokeh_timings = []  # pylint: disable=protected-access
+                node._bokeh_timings.append(timing)  # pylint: disable=protected-access
+
+    def _check_plot(
+        self,
+        model: "bokeh.models.Model",
+        timing: "CheckPlotTiming",
+        options: ArrayCheckOptions,
+        serialize: "Optional[Callable[[bokeh.models.Model], MutableMapping]]" = None,
+        clean_memo: Optional[Dict[int, Tuple]] = None,
+    ) -> None:
+        """
+        Implementation of :py:meth:`check_plot` recording the durations of the stages.
+        With the ``serializer`` engine the cleaned data is produced while serializing, the given
+        serialize function and memo are not used in this case. Checks keeping the arrays as numpy arrays
+        (tolerances, .npy files, hashes, blob store, summaries, compact arrays) always serialize and clean separately
+
+        :param model: a bokeh model to check
+        :param timing: timing of the check, the test file is named after its basename
+        :param options: options of the check
+        :param serialize: function converting the model to its JSON representation
+        :param clean_memo: memo passed to the default cleaning function for bokeh 3 or newer
+        """
+        __tracebackhide__ = True  # pylint: disable=unused-variable
+
+        if options.keeps_arrays:
+            with timing.stage("serialize"):
+                json_to_check = (serialize or self._serialize)(model)
+            self._check_with_arrays(json_to_check, timing.basename, options, timing, clean_memo=clean_memo)
+            return
+
+        if self.engine == "serializer":
+            with timing.stage("serialize"):
+                json_to_check = self._serialize_cleaned(model, options.fp_precision)
+            timing.record_document(json_to_check)
+            self._check_data_regression(json_to_check, timing.basename, timing)
+            return
+
+        with timing.stage("serialize"):
+            json_to_check = (serialize or self._serialize)(model)
+
+        with timing.stage("clean"):
+            json_to_check = self._clean(json_to_check, options.fp_precision, clean_memo)
+
+        # Remove bokeh version entry
+        json_to_check.pop("version", None)
+        timing.record_document(json_to_check)
+
+        self._check_data_regression(json_to_check, timing.basename, timing)
+
+    def _clean(
+        self, json_to_check: MutableMapping, fp_precision: int, memo: Optional[Dict[int, Tuple]], **kwargs: Any
+    ) -> MutableMapping:
+        """
+        Clean the JSON data using the cleaning function of the fixture. The memo for reusing
+        cleaned models and the cleaning rules are only used with the default cleaning function
+        for bokeh 3 or newer, which is also required for keeping the arrays as numpy arrays
+
+        :param json_to_check: JSON data of the bokeh model
+        :param fp_precision: number of digits to use in floating point rounding
+        :param memo: memo for reusing cleaned models
+        """
+        if kwargs.get("keep_arrays") and BOKEH_LT_3:
+            raise ValueError(
+                "Comparing arrays with rtol/atol, storing them in .npy files, as summaries or compactly "
+                "is only supported for bokeh 3 or newer"
+            )
+        if kwargs.get("keep_arrays") and self.clean_fn is not _clean_bokeh_json_v3:
+            raise ValueError(
+                "Comparing arrays with rtol/atol, storing them in .npy files, in a blob store, as summaries, "
+                "compactly or with a hash is only supported with the default cleaning function"
+            )
+        if memo is not None and self.clean_fn is _clean_bokeh_json_v3:
+            kwargs["memo"] = memo
+        if self.cleaning_rules:
+            if self.clean_fn is not _clean_bokeh_json_v3:
+                raise ValueError(
+                    "Cleaning rules (bokeh_drop, bokeh_precision, bokeh_clean_rules marker) are only supported "
+                    "with the default cleaning function for bokeh 3 or newer"
+                )
+            kwargs["rules"] = self.cleaning_rules
+        return self.clean_fn(json_to_check, fp_precision=fp_precision, **kwargs)
+
+    def _serialize_cleaned(self, model: "bokeh.models.Model", fp_precision: int) -> MutableMapping:
+        """
+        Produce the cleaned JSON data while serializing the model (``serializer`` engine).
+        The result is identical to cleaning the serialized data with the default cleaning function,
+        but the document is not walked a second time
+
+        :param model: a bokeh model to convert
+        :param fp_precision: number of digits to use in floating point rounding
+        """
+        if BOKEH_LT_3 or self.clean_fn is not _clean_bokeh_json_v3 or self.cleaning_rules:
+            raise ValueError(
+                "The serializer engine is only supported for bokeh 3 or newer with the default cleaning function "
+                "and without cleaning rules (bokeh_drop, bokeh_precision, bokeh_clean_rules marker)"
+            )
+        from .normalizing_serialization import is_supported, serialize_cleaned
+
+        if not is_supported():
+            raise ValueError(f"The serializer engine is not supported for bokeh {BOKEH_VERSION}, use the clean engine")
+        return serialize_cleaned(model, fp_precision)
+
+    @staticmethod
+    def _serialize(model: "bokeh.models.Model") -> MutableMapping:
+        """
+        Convert the given bokeh model to its JSON representation
+
+        :param model: a bokeh model to convert
+        """
         if BOKEH_LT_3:
             from bokeh.io import curdoc
 
             curdoc().clear()
             curdoc().add_root(model)
-            json_to_check = curdoc().to_json()
+            return curdoc().to_json()
+
+        from bokeh.core.serialization import Serializer
+
+        return Serializer().serialize(model).content
+
+    def _basename(self, basename: Optional[str]) -> str:
+        """
+        Get the basename of the test file in the same way as the data_regression fixture
+
+        :param basename: basename of the file. If not given the name of the test is used.
+        """
+        if basename is not None:
+            return basename
+
+        try:
+            from pytest_regressions.common import resolve_check_paths
+        except ImportError:
+            # pytest-regressions < 2.11 has no function resolving the basename
+            basename = ""
+            with_test_class_names = self.data_regression.with_test_class_names or self.request.config.getoption(
+                "with_test_class_names", False
+            )
+            if self.request.node.cls is not None and with_test_class_names:
+                basename = re.sub(r"[\W]", "_", self.request.node.cls.__name__) + "_"
+            return basename + re.sub(r"[\W]", "_", self.request.node.name)
+
+        # The original data directory is passed as data directory, so that no file is copied
+        original_datadir = Path(self.data_regression.original_datadir)
+        return resolve_check_paths(
+            datadir=original_datadir,
+            original_datadir=original_datadir,
+            request=self.request,
+            extension="",
+            with_test_class_names=self.data_regression.with_test_class_names,
+        ).basename
+
+    def _source_filename(self, basename: Optional[str]) -> Path:
+        """
+        Get the path of the test file in the original data directory. Existing test files
+        are used in their format (codec and compression), new test files are written in the
+        codec and compression format of the fixture
+
+        :param basename: basename of the file. If not given the name of the test is used.
+        """
+        from . import storage
+
+        original_datadir = Path(self.data_regression.original_datadir)
+        if self.background_io is not None:
+            # Test files written in the background earlier in the session have to exist
+            self.background_io.wait(original_datadir / f"{self._basename(basename)}.yml")
+        return storage.find_test_file(original_datadir, self._basename(basename), self.compression, self.codec)
+
+    def _load(self, filename: Path) -> MutableMapping:
+        """
+        Get the data of a test file from the session wide cache if enabled, otherwise read it.
+        The data may be shared with other checks and must not be modified
+
+        :param filename: path to the test file
+        """
+        file_cache = self.file_cache
+        if file_cache is None:
+            return self._read(filename)
+        return self._with_cache_counts(file_cache, partial(file_cache.load, filename, self._read))
+
+    def _read(self, filename: Path) -> MutableMapping:
+        """
+        Read a test file, using the data prefetched in the background if available
+
+        :param filename: path to the test file
+        """
+        from . import storage
+
+        if self.background_io is None:
+            return storage.load(filename)
+        return self.background_io.load(filename)
+
+    def _load_array(self, filename: Path, entry: Any, load_fn: Callable) -> "Optional[np.ndarray]":
+        """
+        Get the array decoded from an entry of a test file, which is kept in the session wide cache if enabled
+
+        :param filename: path to the test file
+        :param entry: entry of the data loaded from the test file
+        :param load_fn: function decoding the entry, returning None if the entry is no array
+        """
+        file_cache = self.file_cache
+        if file_cache is None:
+            return load_fn(entry)
+        return self._with_cache_counts(file_cache, partial(file_cache.load_array, filename, entry, load_fn))
+
+    def _with_cache_counts(self, file_cache: "FileCache", fn: Callable[[], Any]) -> Any:
+        """
+        Call a function using the session wide cache and record the hits, misses and evictions
+        of the cache in the node of the test, so that they are attached to its report
+
+        :param file_cache: the session wide cache
+        :param fn: function without arguments
+        """
+        counts = (file_cache.hits, file_cache.misses, file_cache.evictions)
+        result = fn()
+        node = self.request.node
+        if not hasattr(node, "_bokeh_cache"):
+            node._bokeh_cache = {"hits": 0, "misses": 0, "evictions": 0}  # pylint: disable=protected-access
+        for key, count in zip(("hits", "misses", "evictions"), counts):
+            node._bokeh_cache[key] += getattr(file_cache, key) - count  # pylint: disable=protected-access
+        return result
+
+    def _write(self, filename: Path, dump_fn: Callable[[Path], None], background: bool = False) -> None:
+        """
+        Write a file, in the background if enabled and requested. Only data not changed
+        afterwards (e.g. not containing views of arrays in the tested models) can be written in the background
+
+        :param filename: path to the file
+        :param dump_fn: function writing the data to the given file
+        :param background: whether the file can be written in the background
+        """
+        if background and self.background_io is not None:
+            self.background_io.write(filename, dump_fn)
         else:
-            from bokeh.core.serialization import Serializer
+            dump_fn(filename)
 
-            json_to_check = Serializer().serialize(model).content
+    def _write_source(self, filename: Path, dump_fn: Callable[[Path], None], background: bool = False) -> None:
+        """
+        Write a test file in the original data directory while holding a lock for it,
+        so that processes running in parallel (pytest-xdist) do not write the same file at the same time
 
-        fp_precision = fp_precision or self.request.config.getoption("bokeh_fp_precision")
+        :param filename: path to the test file
+        :param dump_fn: function writing the data to the given file
+        :param background: whether the file can be written in the background
+        """
+        from . import storage
 
-        json_to_check = self.clean_fn(json_to_check, fp_precision=fp_precision)
+        def _locked_dump_fn(filename: Path) -> None:
+            with storage.file_lock(filename):
+                dump_fn(filename)
 
-        # Remove bokeh version entry
-        json_to_check.pop("version", None)
+        self._write(filename, _locked_dump_fn, background=background)
+
+    def _check_data_regression(
+        self, json_to_check: MutableMapping, basename: Optional[str], timing: "CheckPlotTiming"
+    ) -> None:
+        """
+        Check the cleaned JSON data in the same way as the ``check`` method of the data_regression fixture,
+        but writing the test files atomically. The cleaned data only contains immutable entries, so the
+        test files are written in the background if enabled
+
+        :param json_to_check: cleaned JSON data
+        :param basename: basename of the file. If not given the name of the test is used.
+        :param timing: timing of the check recording the durations of writing and comparing the test files
+        """
+        __tracebackhide__ = True  # pylint: disable=unused-variable
+        import difflib
+        from pytest_regressions.common import perform_regression_check
+        from . import storage
+        from .array_diff import compare_documents, decode_array
+        from .codec import codec_of
+
+        source_filename = self._source_filename(basename)
+        extension = codec_of(storage.plain_filename(source_filename)).extension
+
+        def dump_fn(filename: Path) -> None:
+            with timing.stage("dump"):
+                if filename == source_filename:
+                    self._write_source(filename, partial(storage.dump, json_to_check), background=True)
+                else:
+                    self._write(filename, partial(storage.dump, json_to_check), background=True)
+
+        if self.request.config.getoption("bokeh_regen_incremental"):
+
+            def is_unchanged(filename: Path) -> bool:
+                # The loaded data is compared instead of the text, so that formatting changes are ignored
+                with timing.stage("load"):
+                    expected = self._load(filename)
+                with timing.stage("compare"):
+                    return not compare_documents(
+                        json_to_check, expected, partial(self._load_array, filename, load_fn=decode_array)
+                    )
+
+            self._regen_incremental(
+                source_filename, is_unchanged, partial(storage.dump, json_to_check), timing, background=True
+            )
+            return
+
+        def check_fn(obtained_filename: Path, expected_filename: Path) -> None:
+            __tracebackhide__ = True  # pylint: disable=unused-variable
+            with timing.stage("compare"):
+                if self.background_io is not None:
+                    self.background_io.wait(obtained_filename)
+                # Identical files are detected without parsing the test file and decoding its arrays
+                obtained_content = obtained_filename.read_bytes()
+                expected_content = storage.read_content(expected_filename)
+                if obtained_content == expected_content:
+                    return
+            with timing.stage("load"):
+                # The copy in the temporary data directory is identical to the test file
+                # in the original data directory, which might have been prefetched
+                expected = self._load(source_filename)
+            # The files differ, the differences of the arrays are described using numpy
+            # and the rest of the data is compared as text
+            with timing.stage("compare"):
+                differences = compare_documents(
+                    json_to_check, expected, partial(self._load_array, source_filename, load_fn=decode_array)
+                )
+                if not differences:
+                    differences = [
+                        "The data is equal, but the files are written differently:",
+                        *difflib.unified_diff(
+                            expected_content.decode("utf-8").splitlines(),
+                            obtained_content.decode("utf-8").splitlines(),
+                            "expected",
+                            "obtained",
+                            lineterm="",
+                        ),
+                    ]
+            raise AssertionError(
+                "\n".join(["FILES DIFFER:", str(expected_filename), str(obtained_filename), *differences])
+            )
+
+        perform_regression_check(
+            datadir=self.data_regression.datadir,
+            original_datadir=self.data_regression.original_datadir,
+            request=self.request,
+            check_fn=check_fn,
+            dump_fn=dump_fn,
+            # Compressed test files have the extension .yml.<suffix>, the obtained files are not compressed
+            extension=source_filename.name[len(self._basename(basename)) :],
+            basename=basename,
+            force_regen=self.data_regression.force_regen,
+            with_test_class_names=self.data_regression.with_test_class_names,
+            obtained_filename=self.data_regression.datadir / f"{self._basename(basename)}.obtained{extension}",
+        )
+
+    def _regen_incremental(
+        self,
+        source_filename: Path,
+        is_unchanged: Callable[[Path], bool],
+        dump_fn: Callable[[Path], None],
+        timing: "Optional[CheckPlotTiming]" = None,
+        background: bool = False,
+    ) -> None:
+        """
+        Regenerate the test file only if its data changed. The status of the test file
+        (changed, added or unchanged) is recorded on the test item for the terminal summary
+
+        :param source_filename: path to the test file
+        :param is_unchanged: function checking whether the given test file contains the obtained data
+        :param dump_fn: function writing the obtained data to the given file
+        :param timing: if given, the duration of writing the test file is recorded
+        :param background: whether the test file can be written in the background
+        """
+        status = "added"
+        if source_filename.is_file():
+            status = "unchanged" if is_unchanged(source_filename) else "changed"
+
+        if status != "unchanged":
+            if timing is None:
+                self._write_source(source_filename, dump_fn, background=background)
+            else:
+                with timing.stage("dump"):
+                    self._write_source(source_filename, dump_fn, background=background)
 
-        self.data_regression.check(json_to_check, basename=basename)
+        node = self.request.node
+        if not hasattr(node, "_bokeh_regen"):
+            node._bokeh_regen = []  # pylint: disable=protected-access
+        node._bokeh_regen.append((status, str(source_filename)))  # pylint: disable=protected-access
@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the operations of the ``bokeh-regressions`` command on trees of test files,
+which work directly on the stored data, i.e. without running the tests. The functions
+operating on a single test file are run in a process pool by :py:func:`run_parallel`
+"""
+import base64
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+from packaging.version import InvalidVersion, Version
+
+from . import storage
+
+T = TypeVar("T")
+
+VERSION_PREFIX = "bokeh-"
+
+
+def iter_test_files(paths: Iterable[Path], check_content: bool = True) -> Iterator[Path]:
+    """
+    Iterate over the (plain or compressed) YAML and JSON test files in the given files/directories.
+    Files of failed checks (``*.obtained.yml``) are skipped
+
+    :param paths: files or directories to search
+    :param check_content: if False all files with the name of a test file are used, not only the
+        ones with the shape of a test file (see :py:func:`~pytest_bokeh_regressions.storage.is_test_file`)
+    """
+    for path in paths:
+        if path.is_dir():
+            yield from storage.glob_test_files(path, recursive=True, check_content=check_content)
+        else:
+            yield path
+
+
+def run_parallel(func: Callable[..., T], filenames: List[Path], *args: Any, jobs: Optional[int] = None) -> List[T]:
+    """
+    Apply the given function to all files using a process pool
+
+    :param func: function called with each file and the additional arguments (has to be picklable)
+    :param filenames: files to process
+    :param args: additional arguments passed to the function
+    :param jobs: number of processes. If 1 the files are processed in the current process
+
+    :returns: results in the order of the files
+    """
+    if jobs == 1 or len(filenames) <= 1:
+        return [func(filename, *args) for filename in filenames]
+
+    jobs = jobs or os.cpu_count() or 1
+    chunksize = max(1, len(filenames) // (4 * jobs))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(func, filenames, *([arg] * len(filenames) for arg in args), chunksize=chunksize))
+
+
+def _blob_store(directory: Optional[Path]) -> Any:
+    """
+    Create the blob store for the given directory (if given)
+
+    :param directory: directory of the blob store
+    """
+    if directory is None:
+        return None
+    from .blob_store import BlobStore
+
+    return BlobStore(directory, max_bytes=0)
+
+
+def verify_file(filename: Path, blob_store_dir: Optional[Path] = None) -> List[str]:
+    """
+    Check that a test file can be parsed and that the arrays referenced in it exist
+
+    :param filename: path to the test file
+    :param blob_store_dir: directory of the blob store used by the test file
+
+    :returns: list of the found errors
+    """
+    import numpy as np
+    from .compact_arrays import COMPACT_TYPE
+
+    try:
+        data = storage.load(filename)
+    except Exception as exc:  # pylint: disable=broad-except
+        return [f"{filename}: could not be parsed: {exc}"]
+
+    errors = []
+    blob_store = _blob_store(blob_store_dir)
+    for entry in _iter_dicts(data):
+        kind = entry.get("type")
+        array: Any
+        try:
+            if kind in (storage.SIDECAR_TYPE, COMPACT_TYPE):
+                array = storage.load_array(entry, filename)
+            elif kind == storage.BLOB_TYPE:
+                if blob_store is None:
+                    errors.append(f"{filename}: references blobs, but no blob store was given")
+                    break
+                array = np.load(blob_store.path(entry["sha256"]), mmap_mode="r", allow_pickle=False)
+            else:
+                continue
+        except Exception as exc:  # pylint: disable=broad-except
+            errors.append(f"{filename}: array {entry} could not be loaded: {exc}")
+            continue
+        if list(array.shape) != entry["shape"] or array.dtype.name != entry["dtype"]:
+            errors.append(f"{filename}: array {entry} has dtype {array.dtype.name} and shape {list(array.shape)}")
+    return errors
+
+
+def _iter_dicts(data: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over all dicts in the loaded data of a test file
+
+    :param data: data loaded from a test file
+    """
+    stack = [data]
+    while stack:
+        entry = stack.pop()
+        if isinstance(entry, dict):
+            yield entry
+            stack.extend(entry.values())
+        elif isinstance(entry, list):
+            stack.extend(entry)
+
+
+def _decode_base64(encoded: str, dtype: str, order: str) -> Any:
+    """
+    Decode a base64 encoded array
+
+    :param encoded: base64 encoded data
+    :param dtype: dtype of the array
+    :param order: byte order of the data (little or big)
+    """
+    import numpy as np
+
+    byteorder = "<" if order == "little" else ">"
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.dtype(dtype).newbyteorder(byteorder))
+
+
+def _round_base64(encoded: Any, entry: Dict[str, Any], round_array: Callable[[Any], Any]) -> Optional[str]:
+    """
+    Round a base64 encoded array
+
+    :param encoded: base64 encoded data (other values are not changed)
+    :param entry: entry of the array with its dtype and byte order
+    :param round_array: function rounding the decoded array, which returns None if it is not changed
+
+    :returns: base64 encoded data of the rounded array or None if the array is not changed
+    """
+    if not isinstance(encoded, str):
+        return None
+    rounded = round_array(_decode_base64(encoded, entry["dtype"], entry.get("order", "little")))
+    return None if rounded is None else base64.b64encode(rounded.tobytes()).decode()
+
+
+def reclean_file(filename: Path, fp_precision: int, blob_store_dir: Optional[Path] = None) -> bool:
+    """
+    Round the floating point values of an existing test file to the given precision.
+    Arrays serialized into the test file (in the format of bokeh 3 or older versions or compactly
+    encoded), arrays in .npy files and arrays in a blob store are rounded as well. Rounded
+    arrays in a blob store are added as new blobs (see the gc command for removing the old ones).
+    Note that values can only be rounded to a lower precision than the one used for the test file.
+    Files without the shape of a test file (e.g. files of the data_regression fixture) are not changed
+
+    :param filename: path to the test file
+    :param fp_precision: number of digits to use in floating point rounding
+    :param blob_store_dir: directory of the blob store used by the test file
+
+    :returns: True if the test file was changed
+    """
+    from bokeh.core.serialization import Serializer
+    import numpy as np
+    from .compact_arrays import COMPACT_TYPE, decode_compact, encode_compact
+
+    data = storage.load(filename)
+    if not storage.is_document(data):
+        return False
+    blob_store = _blob_store(blob_store_dir)
+    changed = False
+
+    def _round_array(array):
+        nonlocal changed
+        if array.dtype.kind != "f":
+            return None
+        rounded = np.around(array, decimals=fp_precision)
+        if np.array_equal(rounded, array, equal_nan=True):
+            return None
+        changed = True
+        return rounded
+
+    def _reclean_array(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Round the entry of an array, returns None for entries of other data
+        kind = entry.get("type")
+        if kind in ("ndarray", "typed_array") and isinstance(entry.get("array"), dict):
+            encoded = _round_base64(entry["array"].get("data"), entry, _round_array)
+            if encoded is not None:
+                entry = {**entry, "array": {**entry["array"], "data": encoded}}
+        elif "__ndarray__" in entry and isinstance(entry["__ndarray__"], str):
+            # Arrays in test files of bokeh 2 or older
+            encoded = _round_base64(entry["__ndarray__"], entry, _round_array)
+            if encoded is not None:
+                entry = {**entry, "__ndarray__": encoded}
+        elif kind == storage.SIDECAR_TYPE:
+            rounded = _round_array(np.asarray(storage.load_array(entry, filename)))
+            if rounded is not None:
+                storage._write_npy(  # pylint: disable=protected-access
+                    storage.sidecar_dir(filename) / f"{entry['index']}.npy", rounded, fp_precision
+                )
+        elif kind == COMPACT_TYPE:
+            rounded = _round_array(decode_compact(entry))
+            if rounded is not None:
+                compact = encode_compact(rounded, fp_precision)
+                entry = compact if compact is not None else Serializer(deferred=False).serialize(rounded).content
+        elif kind == storage.BLOB_TYPE:
+            if blob_store is None:
+                raise ValueError(f"{filename} references blobs, but no blob store was given")
+            rounded = _round_array(blob_store.get(entry["sha256"]))
+            if rounded is not None:
+                entry = {**entry, "sha256": blob_store.put(rounded, fp_precision)}
+        else:
+            return None
+        return entry
+
+    def _reclean(entry):
+        nonlocal changed
+        if isinstance(entry, float):
+            rounded = round(entry, fp_precision)
+            changed = changed or rounded != entry
+            return rounded
+        if isinstance(entry, list):
+            return [_reclean(val) for val in entry]
+        if not isinstance(entry, dict):
+            return entry
+        recleaned = _reclean_array(entry)
+        if recleaned is not None:
+            return recleaned
+        return {key: _reclean(val) for key, val in entry.items()}
+
+    data = _reclean(data)
+    if changed:
+        # The stored hash belongs to the data at the previous precision and is removed when writing
+        storage.dump(data, filename)
+    return changed
+
+
+def convert_file(filename: Path, codec: str) -> Optional[Path]:
+    """
+    Rewrite a test file with another codec, keeping its compression format. The stored hash
+    of the data is kept, since the data does not change
+
+    :param filename: path to the test file
+    :param codec: name of the codec (see :py:data:`~pytest_bokeh_regressions.codec.CODECS`)
+
+    :returns: path of the new test file or None if the test file already uses the codec
+    """
+    from .codec import codec_of, get_codec
+
+    plain = storage.plain_filename(filename)
+    old_extension, new_extension = codec_of(plain).extension, get_codec(codec).extension
+    if old_extension == new_extension:
+        return None
+    target = filename.with_name(f"{plain.name[: -len(old_extension)]}{new_extension}{filename.name[len(plain.name) :]}")
+
+    # The hash file also stores the hash of the content of the test file, which changes
+    digest = None
+    if storage.hash_filename(filename).is_file():
+        digest = storage.hash_filename(filename).read_text(encoding="utf-8").split()[0]
+        if not storage.hash_matches(filename, digest):
+            digest = None
+
+    storage.dump(storage.load(filename), target)
+    filename.unlink()
+    if digest is not None:
+        storage.write_hash(target, digest)
+    return target
+
+
+def is_v2_file(filename: Path) -> bool:
+    """
+    Whether the test file contains data in the format produced with bokeh 2 or older
+    (i.e. the cleaned JSON of a bokeh document)
+
+    :param filename: path to the test file
+    """
+    data = storage.load(filename)
+    return isinstance(data, dict) and isinstance(data.get("roots"), dict) and "references" in data["roots"]
+
+
+def _file_group(filename: Path) -> List[Path]:
+    """
+    Get the test file and the files stored next to it (.npy files, hash)
+
+    :param filename: path to the test file
+    """
+    related = [storage.sidecar_dir(filename), storage.hash_filename(filename)]
+    return [filename, *(path for path in related if path.exists())]
+
+
+def version_of(directory: Path) -> Optional[Version]:
+    """
+    Get the bokeh version of a folder named bokeh-<version>
+
+    :param directory: path to the folder
+    """
+    if not directory.name.startswith(VERSION_PREFIX):
+        return None
+    try:
+        return Version(directory.name[len(VERSION_PREFIX) :])
+    except InvalidVersion:
+        return None
+
+
+def migrate_files(filenames: List[Path], version: str, dry_run: bool = False) -> List[Tuple[Path, Path]]:
+    """
+    Move test files in the format of bokeh 2 or older, which are not in a versioned folder,
+    into the folder ``bokeh-<version>`` next to them, so that they are used for the old bokeh
+    version with ``--bokeh-with-version``
+
+    :param filenames: paths to test files in the format of bokeh 2 or older
+    :param version: the bokeh version used for producing the test files
+    :param dry_run: if True the files are not moved
+
+    :returns: list of the old and new paths of the moved files
+    """
+    moved = []
+    for filename in filenames:
+        if version_of(filename.parent) is not None:
+            continue
+        target_dir = filename.parent / f"{VERSION_PREFIX}{version}"
+        for path in _file_group(filename):
+            target = target_dir / path.name
+            moved.append((path, target))
+            if not dry_run:
+                target_dir.mkdir(exist_ok=True)
+                shutil.move(str(path), str(target))
+    return moved
+
+
+def prune_version_dirs(paths: Iterable[Path], min_version: str, dry_run: bool = False) -> List[Path]:
+    """
+    Remove the folders named ``bokeh-<version>`` of versions older than the given one,
+    if all their test files are also available in a folder of a version at least as new as the
+    given version, i.e. the folders are not used anymore for this or newer versions
+
+    :param paths: directories containing versioned folders (searched recursively)
+    :param min_version: oldest bokeh version, which should be supported
+    :param dry_run: if True the folders are not removed
+
+    :returns: paths of the removed folders
+    """
+    minimum = Version(min_version)
+    datadirs: Set[Path] = set()
+    for path in paths:
+        datadirs.update(
+            directory.parent for directory in path.rglob(f"{VERSION_PREFIX}*") if version_of(directory) is not None
+        )
+
+    # The files are only selected by their name, so that no file only available in an old folder is removed
+    removed = []
+    for datadir in sorted(datadirs):
+        all_versions = {directory: version_of(directory) for directory in datadir.iterdir() if directory.is_dir()}
+        versions = {directory: version for directory, version in all_versions.items() if version is not None}
+        supported: Set[str] = set()
+        for directory, version in versions.items():
+            if version >= minimum:
+                supported.update(
+                    storage.file_key(path).name for path in iter_test_files([directory], check_content=False)
+                )
+        for directory, version in sorted(versions.items(), key=lambda item: item[1]):
+            if version >= minimum:
+                continue
+            if all(
+                storage.file_key(path).name in supported for path in iter_test_files([directory], check_content=False)
+            ):
+                removed.append(directory)
+                if not dry_run:
+                    shutil.rmtree(directory)
+    return removed
+
+
+def file_stats(filename: Path) -> Tuple[int, int, int, int]:
+    """
+    Get the size statistics of a test file
+
+    :param filename: path to the test file
+
+    :returns: tuple of the size of the test file, the size of its .npy files,
+        the number of entries and the number of bytes of arrays serialized into it
+    """
+    from .timing import document_stats
+
+    sidecar_bytes = sum(path.stat().st_size for path in storage.sidecar_dir(filename).glob("*.npy"))
+    entries, array_bytes = document_stats(storage.load(filename))
+    return filename.stat().st_size, sidecar_bytes, entries, array_bytes
+
+
+def print_stats(filenames: List[Path], stats: List[Tuple[int, int, int, int]], file: Optional[IO[str]] = None) -> None:
+    """
+    Print the size statistics of test files grouped by the bokeh version of their folder
+
+    :param filenames: paths to the test files
+    :param stats: results of :py:func:`file_stats` for the files
+    :param file: stream to print to (default: ``sys.stdout``)
+    """
+    file = file or sys.stdout
+    widths = (10, 16, 16, 12, 16)
+    groups: Dict[str, List[int]] = {}
+    for filename, file_stat in zip(filenames, stats):
+        version = version_of(filename.parent)
+        group = groups.setdefault("unversioned" if version is None else str(version), [0, 0, 0, 0, 0])
+        group[0] += 1
+        for index, value in enumerate(file_stat):
+            group[index + 1] += value
+
+    header = f"{'version':<16}{'files':>10}{'yml bytes':>16}{'npy bytes':>16}{'entries':>12}{'array bytes':>16}"
+    print(header, file=file)
+    totals = [0, 0, 0, 0, 0]
+    for name in sorted(groups, key=lambda name: (name != "unversioned", Version(name) if name != "unversioned" else 0)):
+        values = groups[name]
+        totals = [total + value for total, value in zip(totals, values)]
+        print(f"{name:<16}" + "".join(f"{value:>{width}}" for value, width in zip(values, widths)), file=file)
+    print(f"{'total':<16}" + "".join(f"{value:>{width}}" for value, width in zip(totals, widths)), file=file)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the serialization of multiple bokeh models (bokeh 3 or newer), where the
+representations of models shared between them are only produced once.
+
+The memoization relies on internals of bokeh's ``Serializer`` (``add_ref`` being called for each
+model encoded in full and the ``_references`` dict of the encoded models by their id). It is only
+used for the bokeh versions, for which these internals are known (see :py:func:`is_supported`)
+"""
+from typing import Any, Dict, Iterable, List, MutableMapping, Set
+
+from bokeh.core.serialization import Serializer
+from bokeh.model import Model
+
+from .versioning import bokeh_version_in_range
+
+#: Range of bokeh versions (including the first, excluding the second) with known ``Serializer`` internals
+SUPPORTED_BOKEH_VERSIONS = ("3.0.0", "4.0.0")
+
+
+def is_supported() -> bool:
+    """
+    Whether the installed bokeh version is supported and its ``Serializer`` has the internals used
+    by the :py:class:`MemoizingSerializer`
+    """
+    if not bokeh_version_in_range(*SUPPORTED_BOKEH_VERSIONS):
+        return False
+    return all(callable(getattr(Serializer, name, None)) for name in ("add_ref", "has_ref", "get_ref")) and (
+        isinstance(getattr(Serializer(), "_references", None), dict)
+    )
+
+
+class _MemoEntry:
+    """
+    Representation of a shared model produced while serializing one of the models in a batch
+
+    :param rep: the representation of the model
+    :param added: models encoded in full (i.e. not as references) as part of the representation
+    :param external: IDs of models outside of the representation, which were encoded as references
+    """
+
+    __slots__ = ("rep", "added", "external")
+
+    def __init__(self, rep: Any, added: List[Model], external: Set[int]) -> None:
+        self.rep = rep
+        self.added = added
+        self.external = external
+
+
+class MemoizingSerializer(Serializer):  # type: ignore[misc]
+    """
+    Serializer reusing the representations of models, which were produced when serializing
+    other models of the same batch.
+
+    A representation of a model depends on the models already encoded before it in the same
+    serialization (these are encoded as references). So a representation is only reused if
+    the same models inside it are encoded in full and the same models are references,
+    i.e. the result is identical to the one of a new ``Serializer``
+
+    :param memo: dict shared between the serializers of all models in the batch
+    :param shared: IDs of the models, which are referenced by multiple models in the batch
+    """
+
+    def __init__(self, memo: Dict[int, _MemoEntry], shared: Set[int]) -> None:
+        super().__init__()
+        self._memo = memo
+        self._shared = shared
+        self._added: List[Model] = []
+        self._hits: List[int] = []
+
+    def add_ref(self, obj: Any, ref: Any) -> None:
+        super().add_ref(obj, ref)
+        self._added.append(obj)
+
+    def encode(self, obj: Any) -> Any:
+        ident = id(obj)
+        if ident not in self._shared:
+            if self.has_ref(obj):
+                self._hits.append(ident)
+            return super().encode(obj)
+
+        if self.has_ref(obj):
+            self._hits.append(ident)
+            return self.get_ref(obj)
+
+        entry = self._memo.get(ident)
+        if entry is not None and self._reusable(entry):
+            for model in entry.added:
+                self.add_ref(model, model.ref)
+            self._hits.extend(entry.external)
+            return entry.rep
+
+        n_added, n_hits = len(self._added), len(self._hits)
+        rep = super().encode(obj)
+        added = self._added[n_added:]
+        added_ids = {id(model) for model in added}
+        external = {hit for hit in self._hits[n_hits:] if hit not in added_ids}
+        self._memo[ident] = _MemoEntry(rep, added, external)
+        return rep
+
+    def _reusable(self, entry: _MemoEntry) -> bool:
+        """
+        Whether the representation in the given entry is identical to the one produced by
+        encoding the model with the current state of the serializer
+
+        :param entry: the entry to check
+        """
+        return all(id(model) not in self._references for model in entry.added) and all(
+            ident in self._references for ident in entry.external
+        )
+
+
+class BatchSerializer:
+    """
+    Serializes the models of a batch one after another, reusing the representations
+    of models shared between them. The result for each model is identical to the
+    one of ``Serializer().serialize(model).content``
+
+    :param models: all models of the batch
+    """
+
+    def __init__(self, models: Iterable[Model]) -> None:
+        seen: Set[int] = set()
+        self._shared: Set[int] = set()
+        for model in models:
+            references = {id(ref) for ref in model.references()}
+            self._shared |= seen & references
+            seen |= references
+        self._memo: Dict[int, _MemoEntry] = {}
+
+    def serialize(self, model: Model) -> MutableMapping:
+        """
+        Serialize a model of the batch
+
+        :param model: the model to serialize
+        """
+        return MemoizingSerializer(self._memo, self._shared).serialize(model).content
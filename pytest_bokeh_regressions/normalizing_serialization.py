@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing a serializer (bokeh 3 or newer), which produces the cleaned representation
+of bokeh models directly, i.e. without walking the serialized document a second time.
+
+The arrays are rounded by overriding the internal ``_encode_ndarray`` and ``_encode_typed_array`` methods
+of bokeh's ``Serializer``, so the serializer is only used for the bokeh versions, for which these
+internals are known (see :py:func:`is_supported`)
+"""
+import numbers
+from typing import Any, Dict, MutableMapping
+
+import numpy as np
+from bokeh.core.serialization import Serializer
+from bokeh.model import Model
+from bokeh.util.serialization import array_encoding_disabled, transform_array
+
+from .memo_serialization import SUPPORTED_BOKEH_VERSIONS
+from .versioning import bokeh_version_in_range
+
+
+def is_supported() -> bool:
+    """
+    Whether the installed bokeh version is supported and its ``Serializer`` has the internals
+    overridden by the :py:class:`NormalizingSerializer`
+    """
+    if not bokeh_version_in_range(*SUPPORTED_BOKEH_VERSIONS):
+        return False
+    return all(callable(getattr(Serializer, name, None)) for name in ("_encode_ndarray", "_encode_typed_array"))
+
+
+class NormalizingSerializer(Serializer):  # type: ignore[misc]
+    """
+    Serializer emitting the same data as ``_clean_bokeh_json_v3`` applied to the output
+    of ``Serializer().serialize(model).content``:
+
+        - IDs (``id``, ``root_ids``) are removed, so references to already encoded models are removed
+        - floating point values are rounded when they are encoded
+        - floating point arrays are rounded before their buffer is encoded (only once)
+        - empty entries of dicts and empty dicts in lists contained in dicts are removed
+
+    Each representation returned from ``encode`` is already normalized. Only the containers created
+    around them (e.g. the attributes of models) are normalized afterwards, without visiting the
+    normalized representations again
+
+    :param fp_precision: number of digits to use in floating point rounding
+    """
+
+    def __init__(self, fp_precision: int) -> None:
+        super().__init__(deferred=False)
+        self._fp_precision = fp_precision
+        self._float_dtypes = {np.dtype(char).name for char in np.typecodes["AllFloat"]}
+        # Normalized containers by their id. The containers are kept alive, so that their ids are not reused
+        self._normalized: Dict[int, Any] = {}
+
+    def encode(self, obj: Any) -> Any:
+        return self._normalize(super().encode(obj))
+
+    def _encode_ndarray(self, obj: np.ndarray) -> Any:
+        array = transform_array(obj)
+        if array.dtype.name in self._float_dtypes and not array_encoding_disabled(array):
+            array = np.around(array, decimals=self._fp_precision)
+        return super()._encode_ndarray(array)
+
+    def _encode_typed_array(self, obj: Any) -> Any:
+        if obj.typecode in ("f", "d"):
+            # Floating point typed arrays are written as rounded ndarrays
+            return self._encode_ndarray(np.around(np.asarray(obj), decimals=self._fp_precision))
+        return super()._encode_typed_array(obj)
+
+    def _normalize(self, entry: Any) -> Any:
+        """
+        Normalize a representation, whose nested representations produced by ``encode``
+        are already normalized
+
+        :param entry: the representation
+        """
+        if isinstance(entry, (dict, list, tuple)):
+            if self._normalized.get(id(entry)) is entry:
+                return entry
+            normalized: Any
+            if isinstance(entry, dict):
+                normalized = {}
+                for key, val in entry.items():
+                    if key in ("id", "root_ids"):
+                        continue
+                    val = self._normalize(val)
+                    if isinstance(val, list) and any(isinstance(x, dict) and not x for x in val):
+                        # Only lists directly contained in dicts have empty dictionaries filtered out
+                        val = [x for x in val if not (isinstance(x, dict) and not x)]
+                    if not (val is None or (isinstance(val, (list, dict)) and not val)):
+                        normalized[key] = val
+            else:
+                normalized = [self._normalize(val) for val in entry]
+            self._normalized[id(normalized)] = normalized
+            return normalized
+        if isinstance(entry, str):
+            return str(entry)
+        if isinstance(entry, numbers.Real) and not isinstance(entry, numbers.Integral):
+            return round(float(entry), self._fp_precision)
+        return entry
+
+
+def serialize_cleaned(model: Model, fp_precision: int) -> MutableMapping:
+    """
+    Serialize a bokeh model directly into its cleaned representation. The result is identical
+    to ``_clean_bokeh_json_v3(Serializer().serialize(model).content, fp_precision)``
+
+    :param model: the model to serialize
+    :param fp_precision: number of digits to use in floating point rounding
+    """
+    return NormalizingSerializer(fp_precision).serialize(model).content
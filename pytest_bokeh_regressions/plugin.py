@@ -2,23 +2,166 @@
 """
 Pytest plugin for bokeh model regression testing
 """
-import os
+import shutil
+import tempfile
 import warnings
-from typing import Optional
+from typing import TYPE_CHECKING, Optional, Tuple
 from pathlib import Path
-from packaging.version import Version
-
 
 import pytest
 
+if TYPE_CHECKING:
+    from pytest_datadir.plugin import LazyDataDir
+    from .versioning import BokehVersionIndex
+
 
 def pytest_report_header():
     """
-    Adds bokeh version to pytest header
+    Adds bokeh version to pytest header. The version is read from
+    the package metadata, so that bokeh is not imported when starting pytest
+    """
+    from .versioning import get_bokeh_version
+
+    return [f"Bokeh: {get_bokeh_version()}"]
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    """
+    Share the bokeh version and a directory for caches of the plugin with the workers when running with pytest-xdist
+    """
+    from .versioning import get_bokeh_version
+
+    node.workerinput["bokeh_session_dir"] = str(_get_session_dir(node.config))
+    node.workerinput["bokeh_version"] = get_bokeh_version()
+    node.workerinput["bokeh_timing"] = _timing_requested(node.config)
+
+
+def _timing_requested(config: pytest.Config) -> bool:
+    """
+    Whether the timings of the checks are reported, i.e. the --bokeh-durations or --bokeh-durations-json
+    options are given or the pytest_bokeh_check_plot_timing hook is implemented. The decision is taken
+    by the controller when running with pytest-xdist
+
+    :param config: pytest config object
+    """
+    workerinput = getattr(config, "workerinput", {})
+    if "bokeh_timing" in workerinput:
+        return workerinput["bokeh_timing"]
+    return (
+        config.getoption("bokeh_durations") is not None
+        or config.getoption("bokeh_durations_json") is not None
+        or bool(config.hook.pytest_bokeh_check_plot_timing.get_hookimpls())
+    )
+
+
+def _get_session_dir(config: pytest.Config) -> Path:
+    """
+    Get the directory for caches of the plugin, which is shared between
+    all processes of the test session when running with pytest-xdist
+
+    :param config: pytest config object
+    """
+    workerinput = getattr(config, "workerinput", {})
+    if "bokeh_session_dir" in workerinput:
+        return Path(workerinput["bokeh_session_dir"])
+
+    if not hasattr(config, "_bokeh_session_dir"):
+        config._bokeh_session_dir = tempfile.mkdtemp(prefix="pytest-bokeh-")  # pylint: disable=protected-access
+    return Path(config._bokeh_session_dir)  # pylint: disable=protected-access
+
+
+def pytest_addhooks(pluginmanager):
+    """
+    Add the hooks of the plugin
+    """
+    from . import hooks
+
+    pluginmanager.add_hookspecs(hooks)
+
+
+def pytest_configure(config):
+    """
+    Register the markers for cleaning rules and summaries of arrays and the plugins collecting the timings of the bokeh
+    regression checks and the hits of the test file cache. When running with pytest-xdist they are collected
+    in the controller process
+    """
+    from .file_cache import FileCacheReporter
+    from .regen import RegenReporter
+    from .timing import BokehTimingReporter
+
+    config.addinivalue_line(
+        "markers",
+        "bokeh_clean_rules(drop=(), precision=None): patterns of attributes to drop and dict of patterns "
+        "and floating point precisions used when cleaning the data of the bokeh regression checks of the test. "
+        "Extends the rules given in the bokeh_drop and bokeh_precision ini options",
+    )
+    config.addinivalue_line(
+        "markers",
+        "bokeh_summary(threshold=0): arrays with at least threshold elements are stored and compared only "
+        "by their summary (statistics, quantiles and hash) in the bokeh regression checks of the test",
+    )
+    if not hasattr(config, "workerinput"):
+        if _timing_requested(config):
+            config.pluginmanager.register(BokehTimingReporter(config), "bokeh-timing-reporter")
+        config.pluginmanager.register(FileCacheReporter(config), "bokeh-file-cache-reporter")
+        if config.getoption("bokeh_regen_incremental"):
+            config.pluginmanager.register(RegenReporter(config), "bokeh-regen-reporter")
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    """
+    Attach the timings of the bokeh regression checks of a test, the statuses of the regenerated test files
+    and the hits of the test file cache to its report, so that they are also available for tests run
+    in pytest-xdist workers
+    """
+    outcome = yield
+    if call.when != "call":
+        return
+    timings = getattr(item, "_bokeh_timings", None)
+    if timings:
+        outcome.get_result().bokeh_timings = [timing.to_dict() for timing in timings]
+    regen = getattr(item, "_bokeh_regen", None)
+    if regen:
+        outcome.get_result().bokeh_regen = list(regen)
+    cache_counts = getattr(item, "_bokeh_cache", None)
+    if cache_counts:
+        outcome.get_result().bokeh_cache = dict(cache_counts)
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_sessionfinish(session):
+    """
+    Combine the comparisons of the failed bokeh regression checks into a single HTML report
     """
-    import bokeh
+    config = session.config
+    if hasattr(config, "workerinput") or not config.getoption("bokeh_html_comparison"):
+        return
 
-    return [f"Bokeh: {bokeh.__version__}"]
+    from .html_comparison import write_report
+
+    filename = Path(config.getoption("bokeh_html_comparison_file")).absolute()
+    n_comparisons = write_report(_get_session_dir(config) / "html", filename)
+    if n_comparisons is not None:
+        config._bokeh_html_report = (filename, n_comparisons)  # pylint: disable=protected-access
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    """
+    Show the location of the HTML report of the failed bokeh regression checks
+    """
+    if hasattr(config, "_bokeh_html_report"):
+        filename, n_comparisons = config._bokeh_html_report  # pylint: disable=protected-access
+        terminalreporter.write_line(f"bokeh HTML comparison of {n_comparisons} failed check(s) written to {filename}")
+
+
+def pytest_unconfigure(config):
+    """
+    Remove the directory for caches shared with pytest-xdist workers
+    """
+    if hasattr(config, "_bokeh_session_dir"):
+        shutil.rmtree(config._bokeh_session_dir, ignore_errors=True)  # pylint: disable=protected-access
 
 
 def pytest_addoption(parser):
@@ -27,9 +170,15 @@ def pytest_addoption(parser):
     """
     group = parser.getgroup("bokeh regression tests")
 
-    msg = "Show a comparison of the produced bokeh plots as html"
+    msg = (
+        "Show a comparison of the expected and obtained bokeh plots of failed checks as html. "
+        "All comparisons are combined into a single file at the end of the test session"
+    )
     group.addoption("--bokeh-html-comparison", action="store_true", help=msg)
 
+    msg = "File to write the html comparison to (default: bokeh_comparison.html)"
+    group.addoption("--bokeh-html-comparison-file", default="bokeh_comparison.html", metavar="PATH", help=msg)
+
     msg = "Compare the test files in subfolders named bokeh-<version> indicating the version used to produce the files"
     group.addoption("--bokeh-with-version", action="store_true", help=msg)
 
@@ -42,14 +191,121 @@ def pytest_addoption(parser):
     msg = "Regenerate all test files produced by the bokeh regression fixtures"
     group.addoption("--bokeh-regen", action="store_true", help=msg)
 
+    msg = (
+        "Regenerate only the test files of the bokeh regression fixtures, whose data changed. The loaded data "
+        "is compared, so formatting differences are ignored. Tests do not fail because of regenerated files. "
+        "The changed, added and obsolete test files are listed in the terminal summary"
+    )
+    group.addoption("--bokeh-regen-incremental", action="store_true", help=msg)
+
     msg = "Default floating point precision used for rounding/hashing data entries appearing in the bokeh JSON data"
     group.addoption("--bokeh-fp-precision", default=5, type=int, help=msg)
 
+    msg = (
+        "Store arrays with at least the given number of elements in .npy files next to the test files "
+        "instead of embedding them in the YAML files. The .npy files are memory-mapped when comparing"
+    )
+    group.addoption("--bokeh-sidecar-threshold", default=None, type=int, help=msg)
+
+    msg = (
+        "Store a hash of the cleaned data next to the test files. If the hash of the data matches, "
+        "the comparison against the test file is skipped"
+    )
+    group.addoption("--bokeh-hash", action="store_true", help=msg)
+
+    msg = (
+        "Encode the arrays in the test files compactly, where this is lossless at the floating point precision: "
+        "values are stored as scaled integers of the narrowest integer dtype, monotonic arrays as differences "
+        "of consecutive values and constant arrays only by their value"
+    )
+    group.addoption("--bokeh-compact-arrays", action="store_true", help=msg)
+
+    msg = (
+        "Process arrays in chunks of the given number of elements, when rounding, hashing, comparing and "
+        "writing them. Arrays are not copied in this case, limiting the additional memory needed for large arrays"
+    )
+    group.addoption("--bokeh-chunk-size", default=None, type=int, help=msg)
+
+    msg = (
+        "Store arrays (with at least --bokeh-sidecar-threshold elements) once under the hash of their content "
+        "in the given directory (relative to the rootdir) and reference them from the test files. "
+        "Test files for different bokeh versions share the stored arrays"
+    )
+    group.addoption("--bokeh-blob-store", default=None, metavar="DIR", help=msg)
+    parser.addini("bokeh_blob_store", default=None, help="Directory of the blob store (see --bokeh-blob-store)")
+
+    msg = (
+        "Write new test files of the bokeh regression fixtures compressed in the given format (.yml.gz, .yml.zst "
+        "or .yml.lz4 files). Existing test files keep their format, which is detected when reading them. "
+        "zstd and lz4 require the zstandard and lz4 packages"
+    )
+    group.addoption("--bokeh-compression", default=None, choices=("none", "gzip", "zstd", "lz4"), help=msg)
+    parser.addini(
+        "bokeh_compression", default=None, help="Compression format of new test files (see --bokeh-compression)"
+    )
+
+    msg = (
+        "Codec of new test files of the bokeh regression fixtures: yaml (.yml files, default) or json (canonical "
+        ".json files, which are read with orjson if installed). Existing test files keep their codec, so that "
+        "test suites can be migrated gradually (see also bokeh-regressions convert)"
+    )
+    group.addoption("--bokeh-codec", default=None, choices=("yaml", "json"), help=msg)
+    parser.addini("bokeh_codec", default=None, help="Codec of new test files (see --bokeh-codec)")
+
+    msg = (
+        "Engine producing the cleaned data of the bokeh regression checks: clean (serialize the models and clean "
+        "the serialized data afterwards) or serializer (produce the cleaned data while serializing, bokeh 3 "
+        "or newer without cleaning rules). Both engines produce identical test files"
+    )
+    group.addoption("--bokeh-engine", default="clean", choices=("clean", "serializer"), help=msg)
+
+    msg = (
+        "Size limit of the session wide cache of the test files read by the bokeh regression checks, "
+        "e.g. 100M (default) or 1G. Test files used by several checks (e.g. in parametrized tests) are read "
+        "and decoded only once. The least recently used test files are removed from the cache if it is full. "
+        "0 disables the cache"
+    )
+    parser.addini("bokeh_cache_size", default=None, help=msg)
+
+    msg = (
+        "Read and write the test files of the bokeh regression fixtures in the test itself. By default test files "
+        "are loaded in the background when the fixture is set up and written in the background, so that the "
+        "disk I/O overlaps with the construction of the plots"
+    )
+    group.addoption("--bokeh-sync-io", action="store_true", help=msg)
+
+    msg = "Show the N slowest checks of the bokeh regression fixtures with the durations of their stages (N=0 for all)"
+    group.addoption("--bokeh-durations", default=None, type=int, metavar="N", help=msg)
+
+    msg = "Write the durations of the stages of all checks of the bokeh regression fixtures to the given JSON file"
+    group.addoption("--bokeh-durations-json", default=None, metavar="PATH", help=msg)
+
+    msg = (
+        "Patterns of attributes of bokeh models (<model>.<attribute>) or entries of their dict attributes "
+        "(<model>.<attribute>.<key>) dropped when cleaning the data of the bokeh regression checks. "
+        "<model> can be * for all models (bokeh 3 or newer)"
+    )
+    parser.addini("bokeh_drop", type="linelist", help=msg)
+
+    msg = (
+        "Floating point precision used for specific attributes of bokeh models or entries of their dict attributes "
+        "given as lines of the form <pattern> = <digits> (see bokeh_drop for the patterns)"
+    )
+    parser.addini("bokeh_precision", type="linelist", help=msg)
+
 
 @pytest.fixture
 def bokeh_json_regression(
-    request, bokeh_versioned_datadirs, lazy_datadir, original_datadir
-):  # pylint:disable=redefined-outer-name
+    request,
+    bokeh_version_index,
+    bokeh_html_comparison,
+    bokeh_cleaning_rules,
+    bokeh_blob_store,
+    bokeh_background_io,
+    bokeh_file_cache,
+    lazy_datadir,
+    original_datadir,
+):  # pylint:disable=redefined-outer-name,too-many-arguments,too-many-positional-arguments,too-many-locals
     """
     Fixture for regression tests of bokeh Models against data collected from previous test runs.
     Useful for testing visualization routines using the bokeh plotting framework.
@@ -61,45 +317,261 @@ def bokeh_json_regression(
     the ``data_regression`` fixture from the ``pytest-regressions``plugin.
 
     If the dicts are equal the test continues, otherwise an AssertionError is raised. To regenerate data for
-    failed tests pass the --bokeh-regen flag to pytest.
+    failed tests pass the --bokeh-regen flag to pytest. If the --bokeh-html-comparison flag is given
+    the expected and obtained plots of failed checks are shown side by side in a html file.
+
+    Attributes of models can be dropped or cleaned with a specific precision using the ``bokeh_drop``
+    and ``bokeh_precision`` ini options or the ``bokeh_clean_rules`` marker. Large arrays can be
+    compared only by their summaries using the ``bokeh_summary`` marker.
+
+    The test file of the test is loaded in the background when the fixture is set up
+    and test files are written in the background, unless the --bokeh-sync-io flag is given.
+    Loaded test files are kept in a session wide cache limited by the bokeh_cache_size ini option.
     """
     from .json_comparison import BokehJSONComparisonFixture
     from pytest_regressions.data_regression import DataRegressionFixture
 
+    versioned_datadirs = None
     if request.config.getoption("bokeh_with_version"):
-        lazy_datadir, original_datadir = bokeh_versioned_datadirs
+        unversioned_lazy_datadir, unversioned_datadir = lazy_datadir, original_datadir
+        lazy_datadir, original_datadir = _versioned_datadirs(
+            request, bokeh_version_index, lazy_datadir, original_datadir
+        )
+
+        def _resolve_datadirs(filename):
+            test_file_version = _get_test_file_version(
+                request, bokeh_version_index, unversioned_datadir, filename=filename
+            )
+            return (
+                _versioned_lazy_datadir(unversioned_lazy_datadir, test_file_version),
+                unversioned_datadir / f"bokeh-{test_file_version}",
+            )
+
+        versioned_datadirs = _resolve_datadirs
 
     data_regression = DataRegressionFixture(lazy_datadir, original_datadir, request)
     data_regression.force_regen = request.config.getoption("bokeh_regen") or request.config.getoption(
         "bokeh_add_version"
     )
+    if data_regression.force_regen:
+        # New test files (and version subfolders) are written in this case
+        request.addfinalizer(bokeh_version_index.invalidate)
+
+    cleaning_rules = bokeh_cleaning_rules
+    marker = request.node.get_closest_marker("bokeh_clean_rules")
+    if marker is not None:
+        cleaning_rules = cleaning_rules.extend(**marker.kwargs)
+
+    summary_threshold = None
+    marker = request.node.get_closest_marker("bokeh_summary")
+    if marker is not None:
+        summary_threshold = int(marker.kwargs.get("threshold", marker.args[0] if marker.args else 0))
+
+    compression = request.config.getoption("bokeh_compression") or request.config.getini("bokeh_compression")
+    codec = request.config.getoption("bokeh_codec") or request.config.getini("bokeh_codec")
+
+    if bokeh_background_io is not None and data_regression.force_regen and versioned_datadirs is not None:
+        # The version index has to see the written test files when it is invalidated
+        request.addfinalizer(bokeh_background_io.flush)
+
+    fixture = BokehJSONComparisonFixture(
+        data_regression,
+        request,
+        versioned_datadirs=versioned_datadirs,
+        html_comparison=bokeh_html_comparison,
+        cleaning_rules=cleaning_rules,
+        blob_store=bokeh_blob_store,
+        summary_threshold=summary_threshold,
+        compression=compression if compression not in (None, "", "none") else None,
+        engine=request.config.getoption("bokeh_engine"),
+        background_io=bokeh_background_io,
+        codec=codec or None,
+        file_cache=bokeh_file_cache,
+        collect_timings=_timing_requested(request.config),
+    )
+    if not (
+        data_regression.force_regen
+        or request.config.getoption("regen_all", False)
+        or request.config.getoption("force_regen", False)
+    ):
+        # Test files are not read if they are regenerated
+        fixture.prefetch()
+        # Prefetched data not used by the test (e.g. of failed tests) is not kept in memory
+        request.addfinalizer(fixture.discard_prefetch)
+    return fixture
+
+
+@pytest.fixture(scope="session")
+def bokeh_cleaning_rules(request):
+    """
+    Session wide rules for cleaning the data of the bokeh regression checks given
+    in the bokeh_drop and bokeh_precision ini options. The rules are compiled once per session
+    """
+    from .rules import CleaningRules
+
+    return CleaningRules.from_ini(request.config.getini("bokeh_drop"), request.config.getini("bokeh_precision"))
+
+
+@pytest.fixture(scope="session")
+def bokeh_blob_store(request):
+    """
+    Session wide store for arrays shared between test files (only if the --bokeh-blob-store
+    option or the bokeh_blob_store ini option is given). Arrays read from the store are
+    cached, so that each array is only read once per process
+    """
+    from .blob_store import BlobStore
+
+    directory = request.config.getoption("bokeh_blob_store") or request.config.getini("bokeh_blob_store")
+    if not directory:
+        return None
+    return BlobStore(request.config.rootpath / directory)
+
+
+@pytest.fixture(scope="session")
+def bokeh_background_io(request):
+    """
+    Session wide prefetching and writing of test files in the background (disabled
+    by the --bokeh-sync-io flag). Pending writes are finished at the end of the session
+    """
+    from .background_io import BackgroundIO
+
+    if request.config.getoption("bokeh_sync_io"):
+        return None
+
+    background_io = BackgroundIO()
+    request.addfinalizer(background_io.close)
+    return background_io
+
 
-    return BokehJSONComparisonFixture(data_regression, request)
+@pytest.fixture(scope="session")
+def bokeh_file_cache(request):
+    """
+    Session wide cache of the loaded test files and their decoded arrays, limited
+    by the bokeh_cache_size ini option (None if the size limit is 0)
+    """
+    from .file_cache import DEFAULT_CACHE_SIZE, FileCache, parse_size
+
+    max_bytes = parse_size(request.config.getini("bokeh_cache_size") or DEFAULT_CACHE_SIZE)
+    if max_bytes == 0:
+        return None
+    return FileCache(max_bytes)
+
+
+@pytest.fixture(scope="session")
+def bokeh_html_comparison(request, bokeh_blob_store):  # pylint:disable=redefined-outer-name
+    """
+    Session wide writer of the comparisons of failed checks for the html report
+    (only if the --bokeh-html-comparison flag is given)
+    """
+    from .html_comparison import HTMLComparisonWriter
+
+    if not request.config.getoption("bokeh_html_comparison"):
+        return None
 
+    writer = HTMLComparisonWriter(_get_session_dir(request.config) / "html", blob_store=bokeh_blob_store)
+    request.addfinalizer(writer.close)
+    return writer
 
-def _get_fallback_version(current_version: str, datadir: Path) -> Optional[str]:
+
+@pytest.fixture(scope="session")
+def bokeh_version_index(request):
+    """
+    Session wide index of the subfolders named bokeh-<version> in the data directories
+    used by the bokeh_versioned_datadirs fixture. When running with pytest-xdist the
+    version subfolders scanned by the first worker using a data directory are shared with the other workers
     """
-    Get the newest available bokeh version older than the current version
-    for which test files exist in the corresponding data directory
+    from .versioning import BokehVersionIndex, get_bokeh_version
 
-    :param current_version: string of the current version of the bokeh package
+    workerinput = getattr(request.config, "workerinput", {})
+    if "bokeh_version" in workerinput:
+        return BokehVersionIndex(workerinput["bokeh_version"], _get_session_dir(request.config) / "versions")
+
+    return BokehVersionIndex(get_bokeh_version())
+
+
+def _get_test_file_version(
+    request: pytest.FixtureRequest, version_index: "BokehVersionIndex", datadir: Path, filename: Optional[str] = None
+) -> str:
+    """
+    Get the bokeh version of the subfolder of the data directory, which should be used for the test files.
+
+    If no subfolder for the current version exists (or it does not contain the given file),
+    the newest version older than the current version with a subfolder (containing the given file)
+    is used, unless the --bokeh-strict-version or --bokeh-add-version flags are given
+
+    :param request: pytest request object
+    :param version_index: BokehVersionIndex of the test session
     :param datadir: Path to the directory to search for test files
+    :param filename: name of the test file
+    """
+    test_file_version = version_index.current_version
+
+    if request.config.getoption("bokeh_strict_version") or request.config.getoption("bokeh_add_version"):
+        return test_file_version
+
+    if filename is not None:
+        fallback_version = version_index.resolve(datadir, filename=filename)
+        if fallback_version is not None:
+            return fallback_version
+
+    fallback_version = version_index.resolve(datadir)
+    if fallback_version is not None:
+        return fallback_version
+    return test_file_version
+
+
+def _versioned_lazy_datadir(lazy_datadir: "LazyDataDir", version: str) -> "LazyDataDir":
+    """
+    Get the lazy data directory of the bokeh-<version> subfolder. Only the used test files
+    are copied, not the whole subfolder, which may contain files being written by other tests
+    (locks, temporary files of atomic writes), e.g. in parallel runs or by the background writer
+
+    :param lazy_datadir: lazy data directory of the test
+    :param version: the bokeh version of the subfolder
     """
-    fallback_version = Version("0.0.0")
+    from pytest_datadir.plugin import LazyDataDir
+
+    return LazyDataDir(
+        original_datadir=lazy_datadir.original_datadir / f"bokeh-{version}",
+        tmp_path=lazy_datadir.tmp_path / f"bokeh-{version}",
+    )
 
-    for f in os.scandir(datadir):
-        if f.is_dir() and f.name.startswith("bokeh-"):
-            _, _, version = f.name.partition("-")
-            version = Version(version)
-            if fallback_version < version <= Version(current_version):
-                fallback_version = version
-    if fallback_version != Version("0.0.0"):
-        return str(fallback_version)
-    return None
+
+def _versioned_datadirs(
+    request: pytest.FixtureRequest,
+    version_index: "BokehVersionIndex",
+    lazy_datadir: "LazyDataDir",
+    original_datadir: Path,
+) -> Tuple["LazyDataDir", Path]:
+    """
+    Get the lazy data directory and the original data directory of the bokeh-<version> subfolder
+    used for the test files of the test (see ``bokeh_versioned_datadirs``)
+
+    :param request: pytest request object
+    :param version_index: BokehVersionIndex of the test session
+    :param lazy_datadir: lazy data directory of the test
+    :param original_datadir: original data directory of the test
+    """
+    test_file_version = version_index.current_version
+
+    if version_index.has_version(original_datadir, test_file_version) and request.config.getoption("bokeh_add_version"):
+        warnings.warn(
+            f"The --bokeh-add-version flag was given but the test files for the current version ({test_file_version})"
+            "are already available. The test files will be regenerated in this test run"
+        )
+
+    test_file_version = _get_test_file_version(request, version_index, original_datadir)
+
+    return (
+        _versioned_lazy_datadir(lazy_datadir, test_file_version),
+        original_datadir / f"bokeh-{test_file_version}",
+    )
 
 
 @pytest.fixture
-def bokeh_versioned_datadirs(lazy_datadir, original_datadir, request):
+def bokeh_versioned_datadirs(
+    lazy_datadir, original_datadir, request, bokeh_version_index
+):  # pylint:disable=redefined-outer-name
     """
     Fixture to provide paths to test files for bokeh regression tests, which
     include subfolders declaring the used bokeh version for generating the contained test files.
@@ -116,26 +588,15 @@ def bokeh_versioned_datadirs(lazy_datadir, original_datadir, request):
            and thus generate test files for the current version
         2. If --bokeh-add-version flag the tests will be run generating test files in the subfolder
            corresponding to the current bokeh version
-    """
-    import bokeh
 
-    test_file_version = bokeh.__version__
-    folder_name = f"bokeh-{test_file_version}"
+    The ``check_plot`` method of the bokeh_json_regression fixture applies the same logic for each
+    test file, i.e. if the chosen subfolder does not contain the test file, older versions containing
+    it are used.
 
-    if (original_datadir / folder_name).is_dir() and request.config.getoption("bokeh_add_version"):
-        warnings.warn(
-            f"The --bokeh-add-version flag was given but the test files for the current version ({test_file_version})"
-            "are already available. The test files will be regenerated in this test run"
-        )
+    The subfolders of each data directory are only scanned once per test session (see ``bokeh_version_index``)
 
-    if (
-        not (original_datadir / folder_name).is_dir()
-        and not request.config.getoption("bokeh_strict_version")
-        and not request.config.getoption("bokeh_add_version")
-    ):
-        fallback_version = _get_fallback_version(test_file_version, original_datadir)
-        if fallback_version is not None:
-            test_file_version = fallback_version
-            folder_name = f"bokeh-{test_file_version}"
-
-    return lazy_datadir / f"bokeh-{test_file_version}", original_datadir / f"bokeh-{test_file_version}"
+    Returns the path of the copy of the subfolder in the temporary data directory and the path
+    of the subfolder in the original data directory
+    """
+    _, versioned_datadir = _versioned_datadirs(request, bokeh_version_index, lazy_datadir, original_datadir)
+    return lazy_datadir / versioned_datadir.name, versioned_datadir
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the report of the incremental regeneration of test files
+(``--bokeh-regen-incremental``), listing the test files which changed, were added
+or were not checked in the test session
+"""
+from pathlib import Path
+from typing import Dict, List, Set
+
+import pytest
+
+#: Statuses of test files in the order they are reported
+STATUSES = ("changed", "added", "unchanged")
+
+
+class RegenReporter:
+    """
+    Plugin collecting the statuses of the test files from the test reports
+    (also of pytest-xdist workers) and reporting them in the terminal summary
+
+    :param config: pytest config object
+    """
+
+    def __init__(self, config: pytest.Config) -> None:
+        self.config = config
+        self.statuses: Dict[str, List[str]] = {status: [] for status in STATUSES}
+        self.not_run: Set[Path] = set()
+
+    def _datadir(self, nodeid: str) -> Path:
+        """
+        Get the data directory of the module of a test (see pytest-datadir)
+
+        :param nodeid: node id of the test
+        """
+        return (self.config.rootpath / nodeid.split("::")[0]).with_suffix("")
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        """
+        Collect the statuses attached to the report of a test and the data directories of skipped tests
+        """
+        for status, filename in getattr(report, "bokeh_regen", []):
+            self.statuses[status].append(filename)
+        if report.skipped:
+            self.not_run.add(self._datadir(report.nodeid))
+
+    def pytest_deselected(self, items: List[pytest.Item]) -> None:
+        """
+        Collect the data directories of deselected tests
+        """
+        self.not_run.update(self._datadir(item.nodeid) for item in items)
+
+    def _selection_filtered(self) -> bool:
+        """
+        Whether only a part of the collected tests was run, in which case test files
+        not checked in the session are not necessarily obsolete
+        """
+        options = ("keyword", "markexpr", "deselect", "lf")
+        if any(self.config.getoption(option, None) for option in options):
+            return True
+        return any("::" in arg for arg in self.config.args)
+
+    def obsolete(self) -> List[str]:
+        """
+        Get the test files in the data directories of the checked test files, which were
+        not checked in this session. Data directories of modules with tests, which did not
+        run (e.g. skipped tests for other bokeh versions), are excluded
+        """
+        from . import storage
+
+        checked: Set[Path] = {Path(filename) for filenames in self.statuses.values() for filename in filenames}
+        obsolete = set()
+        for directory in {filename.parent for filename in checked}:
+            if any(datadir == directory or datadir in directory.parents for datadir in self.not_run):
+                continue
+            for path in storage.glob_test_files(directory, check_content=False):
+                # Only the files not checked are parsed to check whether they are test files
+                if path not in checked and storage.is_test_file(path):
+                    obsolete.add(str(path))
+        return sorted(obsolete)
+
+    def pytest_terminal_summary(self, terminalreporter: pytest.TerminalReporter) -> None:
+        """
+        Show the changed, added and obsolete test files
+        """
+        counts = ", ".join(f"{len(self.statuses[status])} {status}" for status in STATUSES)
+        terminalreporter.write_sep("=", f"bokeh regression test files: {counts}")
+        for status in ("changed", "added"):
+            for filename in sorted(self.statuses[status]):
+                terminalreporter.write_line(f"{status}: {filename}")
+
+        if self._selection_filtered():
+            terminalreporter.write_line("obsolete test files are not reported, since tests were deselected")
+            return
+        for filename in self.obsolete():
+            terminalreporter.write_line(f"obsolete: {filename}")
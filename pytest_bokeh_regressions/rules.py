@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the rules for cleaning the JSON data of bokeh models (bokeh 3 or newer),
+i.e. which attributes of models are dropped and the floating point precision used for
+specific attributes or entries of dict attributes (e.g. columns of a ColumnDataSource)
+
+Rules are given by patterns of the form ``<model>.<attribute>`` or ``<model>.<attribute>.<key>``,
+where ``<model>`` is the name of the bokeh model or ``*`` for all models and ``<key>`` is a key
+of a dict attribute. Examples::
+
+    *.name                        # drop the name attribute of all models
+    ToolbarIcon.icon              # drop the icon attribute of ToolbarIcon models
+    ColumnDataSource.data.random  # drop the column random of all data sources
+    ColumnDataSource.data.x = 2   # round the column x to 2 digits
+
+The rules are compiled into tables, which are looked up for each attribute during cleaning
+"""
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+#: Action for dropping an attribute/key
+DROP = "drop"
+
+Action = Union[str, int]
+
+
+class PrecisionArray(np.ndarray):  # type: ignore[misc]
+    """
+    Array (view) carrying the floating point precision used for rounding it, if it
+    differs from the global precision. Used for arrays kept as numpy arrays during cleaning
+    """
+
+    fp_precision: Optional[int] = None
+
+    def __array_finalize__(self, obj: Any) -> None:
+        self.fp_precision = getattr(obj, "fp_precision", None)
+
+
+def with_precision(array: np.ndarray, fp_precision: int) -> np.ndarray:
+    """
+    Get a view of the array carrying the given floating point precision
+
+    :param array: array to round later
+    :param fp_precision: number of digits to use in floating point rounding
+    """
+    view = array.view(PrecisionArray)
+    view.fp_precision = fp_precision
+    return view
+
+
+def array_precision(array: np.ndarray, fp_precision: int) -> int:
+    """
+    Get the floating point precision to use for the given array
+
+    :param array: the array
+    :param fp_precision: the global floating point precision
+    """
+    precision = getattr(array, "fp_precision", None)
+    return fp_precision if precision is None else precision
+
+
+def _parse_pattern(pattern: str) -> Tuple[str, ...]:
+    """
+    Split a pattern into the model name, the attribute and the key (if given)
+
+    :param pattern: the pattern to split
+    """
+    parts = tuple(part.strip() for part in pattern.strip().split(".", 2))
+    if len(parts) < 2 or not all(parts) or "*" in parts[1:]:
+        raise ValueError(
+            f"Invalid pattern {pattern!r} for cleaning bokeh JSON data. "
+            "Expected <model>.<attribute> or <model>.<attribute>.<key>"
+        )
+    return parts
+
+
+class CleaningRules:
+    """
+    Compiled rules for cleaning the JSON data of bokeh models
+
+    :param drop: patterns of the attributes/keys to drop
+    :param precision: dict of patterns and the floating point precision to use for them
+    """
+
+    def __init__(self, drop: Iterable[str] = (), precision: Optional[Mapping[str, int]] = None) -> None:
+        self.drop = tuple(drop)
+        self.precision = dict(precision or {})
+
+        self._attributes: Dict[Tuple[str, str], Action] = {}
+        self._keys: Dict[Tuple[str, str, str], Action] = {}
+        actions: List[Tuple[str, Action]] = [(pattern, int(digits)) for pattern, digits in self.precision.items()]
+        actions.extend((pattern, DROP) for pattern in self.drop)
+        for pattern, action in actions:
+            parts = _parse_pattern(pattern)
+            if len(parts) == 2:
+                self._attributes[(parts[0], parts[1])] = action
+            else:
+                self._keys[(parts[0], parts[1], parts[2])] = action
+
+        self.key_attributes = {(model, attribute) for model, attribute, _ in self._keys}
+        self._cache: Dict[Tuple, "CleaningRules"] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._attributes or self._keys)
+
+    def attribute(self, model: str, attribute: str) -> Optional[Action]:
+        """
+        Get the action for the given attribute of a model
+
+        :param model: name of the model
+        :param attribute: name of the attribute
+
+        :returns: :py:data:`DROP`, the precision or None if no rule applies
+        """
+        action = self._attributes.get((model, attribute))
+        return self._attributes.get(("*", attribute)) if action is None else action
+
+    def has_keys(self, model: str, attribute: str) -> bool:
+        """
+        Whether rules exist for the keys of the given dict attribute
+
+        :param model: name of the model
+        :param attribute: name of the attribute
+        """
+        return (model, attribute) in self.key_attributes or ("*", attribute) in self.key_attributes
+
+    def key(self, model: str, attribute: str, key: Any) -> Optional[Action]:
+        """
+        Get the action for the given key of a dict attribute
+
+        :param model: name of the model
+        :param attribute: name of the attribute
+        :param key: the key in the dict
+
+        :returns: :py:data:`DROP`, the precision or None if no rule applies
+        """
+        action = self._keys.get((model, attribute, key))
+        return self._keys.get(("*", attribute, key)) if action is None else action
+
+    def extend(self, drop: Iterable[str] = (), precision: Optional[Mapping[str, int]] = None) -> "CleaningRules":
+        """
+        Get the rules extended by the given ones (e.g. from a marker). Rules given here take
+        precedence. The compiled rules are cached
+
+        :param drop: patterns of the attributes/keys to drop
+        :param precision: dict of patterns and the floating point precision to use for them
+        """
+        drop = tuple(drop)
+        precision = dict(precision or {})
+        if not drop and not precision:
+            return self
+
+        cache_key = (drop, tuple(sorted(precision.items())))
+        if cache_key not in self._cache:
+            self._cache[cache_key] = CleaningRules(self.drop + drop, {**self.precision, **precision})
+        return self._cache[cache_key]
+
+    @classmethod
+    def from_ini(cls, drop: Iterable[str], precision: Iterable[str]) -> "CleaningRules":
+        """
+        Create the rules from the lines of the ini options ``bokeh_drop`` and ``bokeh_precision``
+
+        :param drop: lines with the patterns to drop
+        :param precision: lines of the form ``<pattern> = <digits>``
+        """
+        parsed = {}
+        for line in precision:
+            pattern, sep, digits = line.rpartition("=")
+            if not sep or not digits.strip().lstrip("-").isdigit():
+                raise ValueError(f"Invalid line {line!r} for bokeh_precision. Expected <pattern> = <digits>")
+            parsed[pattern.strip()] = int(digits)
+        return cls([line.strip() for line in drop if line.strip()], parsed)
@@ -0,0 +1,556 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the reading and writing of test files for the bokeh_json_regression fixture,
+which contain cleaned JSON data with arrays kept as numpy arrays. Large arrays can be stored
+in .npy files next to the YAML file, which are memory-mapped when reading, or in a
+content-addressed blob store (see :py:mod:`~pytest_bokeh_regressions.blob_store`).
+Large arrays can also be replaced by their summary (see :py:mod:`~pytest_bokeh_regressions.summary`).
+Arrays embedded in the test files can be encoded compactly (see :py:mod:`~pytest_bokeh_regressions.compact_arrays`).
+
+Test files can be written as YAML or canonical JSON files (see :py:mod:`~pytest_bokeh_regressions.codec`)
+and compressed (gzip, zstd or lz4). The format of existing test files is detected when reading them,
+so that test files of different formats can be used side by side
+"""
+import contextlib
+import os
+import tempfile
+from pathlib import Path
+from typing import IO, Any, BinaryIO, Iterator, List, Optional, MutableMapping, Set, TYPE_CHECKING, cast
+
+from .chunks import iter_chunks, process_chunk
+from .codec import CODECS, codec_of, get_codec
+
+if TYPE_CHECKING:
+    import numpy as np
+    from .blob_store import BlobStore
+
+SIDECAR_TYPE = "npy"
+BLOB_TYPE = "blob"
+
+#: Supported compression formats of test files and the suffixes appended to ``.yml``/``.json``
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "lz4": ".lz4"}
+
+#: Magic numbers at the start of compressed test files
+_MAGIC_NUMBERS = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd", b"\x04\x22\x4d\x18": "lz4"}
+
+
+def _lock_filename(filename: Path) -> Path:
+    """
+    Get the path of the lock file for the given file. Lock files are kept in the temporary
+    directory of the system, so that no lock files are left in the data directories
+
+    :param filename: path to the file to lock
+    """
+    import hashlib
+
+    key = hashlib.sha1(str(filename.resolve()).encode("utf-8")).hexdigest()
+    return Path(tempfile.gettempdir()) / "pytest-bokeh-regressions-locks" / f"{key}.lock"
+
+
+@contextlib.contextmanager
+def file_lock(filename: Path, timeout: float = 60.0) -> Iterator[None]:
+    """
+    Context manager holding a lock for writing the given file, which is
+    safe to use from multiple processes, e.g. when running tests with pytest-xdist.
+    The lock is released by the operating system if the process holding it dies
+
+    :param filename: path to the file to lock
+    :param timeout: time in seconds after which acquiring the lock fails
+    """
+    from filelock import FileLock, Timeout
+
+    lock_filename = _lock_filename(filename)
+    lock_filename.parent.mkdir(parents=True, exist_ok=True)
+    lock = FileLock(lock_filename, timeout=timeout)
+    try:
+        lock.acquire()
+    except Timeout as exc:
+        raise TimeoutError(f"Could not acquire the lock for writing {filename}") from exc
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+@contextlib.contextmanager
+def atomic_open(filename: Path) -> Iterator[BinaryIO]:
+    """
+    Context manager providing a binary file object writing to a temporary file, which
+    is renamed to the given file afterwards, so that other processes never see a partially written file
+
+    :param filename: path to the file
+    """
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_filename = tempfile.mkstemp(dir=filename.parent, prefix=f".{filename.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            yield file
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.unlink(tmp_filename)
+        raise
+
+
+def atomic_write(filename: Path, content: bytes) -> None:
+    """
+    Write the given content to a file atomically (see :py:func:`atomic_open`)
+
+    :param filename: path to the file
+    :param content: bytes to write
+    """
+    with atomic_open(filename) as file:
+        file.write(content)
+
+
+def _write_npy(filename: Path, array: "np.ndarray", fp_precision: int, chunk_size: Optional[int] = None) -> None:
+    """
+    Write an array to a .npy file chunk by chunk, rounding floating point values,
+    so that no rounded copy of the whole array is created
+
+    :param filename: path to the .npy file
+    :param array: array to write
+    :param fp_precision: number of digits to use in floating point rounding
+    :param chunk_size: number of elements written at once
+    """
+    from numpy.lib import format as npy_format
+
+    header = {"descr": array.dtype.newbyteorder("<").str, "fortran_order": False, "shape": array.shape}
+    with atomic_open(filename) as file:
+        npy_format.write_array_header_1_0(file, header)
+        for chunk in iter_chunks(array, chunk_size):
+            file.write(process_chunk(chunk, fp_precision).data)
+
+
+def compression_of(filename: Path) -> Optional[str]:
+    """
+    Get the compression format of a test file from its suffix
+
+    :param filename: path to the test file
+
+    :returns: name of the compression format or None for uncompressed test files
+    """
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if any(filename.name.endswith(f"{codec.extension}{suffix}") for codec in CODECS.values()):
+            return compression
+    return None
+
+
+def plain_filename(filename: Path) -> Path:
+    """
+    Get the path of a test file without the suffix of its compression format
+
+    :param filename: path to the test file
+    """
+    compression = compression_of(filename)
+    if compression is None:
+        return filename
+    return filename.with_name(filename.name[: -len(COMPRESSION_SUFFIXES[compression])])
+
+
+def is_test_file(filename: Path, check_content: bool = True) -> bool:
+    """
+    Whether the given file is a (plain or compressed) test file of any codec. Files of failed checks are excluded.
+    Existing files are only test files if their data has the shape of a test file (see :py:func:`is_document`),
+    since data directories often contain files of other tests (e.g. of the data_regression fixture)
+
+    :param filename: path to the file
+    :param check_content: if False only the name of the file is checked
+    """
+    name = plain_filename(filename).name
+    codec = next((codec for codec in CODECS.values() if name.endswith(codec.extension)), None)
+    if codec is None or name.endswith(f".obtained{codec.extension}"):
+        return False
+    if not check_content or not filename.is_file():
+        return True
+    try:
+        return is_document(load(filename))
+    except Exception:  # pylint: disable=broad-except
+        return False
+
+
+def file_key(filename: Path) -> Path:
+    """
+    Get the path identifying a test file independent of its codec and compression,
+    i.e. the path of the corresponding plain YAML test file
+
+    :param filename: path to the test file
+    """
+    filename = plain_filename(filename)
+    extension = codec_of(filename).extension
+    if not filename.name.endswith(extension):
+        return filename
+    return filename.with_name(f"{filename.name[: -len(extension)]}{get_codec(None).extension}")
+
+
+def glob_test_files(directory: Path, recursive: bool = False, check_content: bool = True) -> List[Path]:
+    """
+    Get the test files of all codecs in a directory, sorted by their path
+
+    :param directory: the directory
+    :param recursive: whether subdirectories are searched
+    :param check_content: if False the files are only selected by their name (see :py:func:`is_test_file`)
+    """
+    filenames: Set[Path] = set()
+    for codec in CODECS.values():
+        pattern = f"*{codec.extension}*"
+        filenames.update(directory.rglob(pattern) if recursive else directory.glob(pattern))
+    return sorted(filename for filename in filenames if is_test_file(filename, check_content))
+
+
+def find_test_file(
+    directory: Path, basename: str, compression: Optional[str] = None, codec: Optional[str] = None
+) -> Path:
+    """
+    Get the path of the test file with the given basename. An existing test file is used in its
+    format, otherwise the path of a new test file with the given codec and compression format is returned
+
+    :param directory: data directory of the test file
+    :param basename: basename of the test file
+    :param compression: compression format of new test files (None for uncompressed files)
+    :param codec: name of the codec of new test files (None for YAML files)
+    """
+    if compression is not None and compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(
+            f"Unknown compression format {compression!r}. Supported formats: {', '.join(COMPRESSION_SUFFIXES)}"
+        )
+    new_codec = get_codec(codec)
+    for existing_codec in CODECS.values():
+        filename = directory / f"{basename}{existing_codec.extension}"
+        if filename.is_file():
+            return filename
+        for suffix in COMPRESSION_SUFFIXES.values():
+            if filename.with_name(f"{filename.name}{suffix}").is_file():
+                return filename.with_name(f"{filename.name}{suffix}")
+    filename = directory / f"{basename}{new_codec.extension}"
+    if compression is None:
+        return filename
+    return filename.with_name(f"{filename.name}{COMPRESSION_SUFFIXES[compression]}")
+
+
+@contextlib.contextmanager
+def _compressed(file: BinaryIO, compression: Optional[str], mode: str) -> Iterator[IO[bytes]]:
+    """
+    Context manager providing a stream compressing the data written to the given file
+    or decompressing the data read from it. The given file is not closed
+
+    :param file: binary file object
+    :param compression: compression format (None for no compression)
+    :param mode: ``rb`` or ``wb``
+    """
+    if compression is None:
+        yield file
+    elif compression == "gzip":
+        import gzip
+
+        # No file name and modification time in the header, so that the same data gives identical files
+        with gzip.GzipFile(filename="", mode=mode, fileobj=file, compresslevel=6, mtime=0) as stream:
+            yield cast(IO[bytes], stream)
+    elif compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as exc:
+            raise ImportError("The zstandard package is required for test files compressed with zstd") from exc
+
+        if mode == "rb":
+            with zstandard.ZstdDecompressor().stream_reader(file, closefd=False) as stream:
+                yield stream
+        else:
+            with zstandard.ZstdCompressor().stream_writer(file, closefd=False) as stream:
+                yield stream
+    elif compression == "lz4":
+        try:
+            import lz4.frame
+        except ImportError as exc:
+            raise ImportError("The lz4 package is required for test files compressed with lz4") from exc
+
+        with lz4.frame.LZ4FrameFile(file, mode=mode) as stream:
+            yield stream
+    else:
+        raise ValueError(f"Unknown compression format {compression!r}")
+
+
+def sidecar_dir(filename: Path) -> Path:
+    """
+    Get the directory containing the .npy files of arrays referenced in the given test file
+
+    :param filename: path to the test file
+    """
+    return plain_filename(filename).with_suffix(".arrays")
+
+
+def to_stored_form(  # pylint: disable=too-many-arguments
+    data: Any,
+    filename: Path,
+    fp_precision: int,
+    *,
+    sidecar_threshold: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    blob_store: "Optional[BlobStore]" = None,
+    summary_threshold: Optional[int] = None,
+    compact: bool = False,
+) -> MutableMapping:
+    """
+    Convert cleaned JSON data, where arrays are kept as numpy arrays, to the form written to
+    the test files. Floating point arrays are rounded and either serialized into the bokeh
+    representation of arrays or written to .npy files if they are larger than the given threshold.
+    If a blob store is given, these arrays are added to the store instead
+
+    :param data: cleaned JSON data with arrays kept as numpy arrays
+    :param filename: path to the test file, the .npy files are written next to it
+    :param fp_precision: number of digits to use in floating point rounding
+    :param sidecar_threshold: arrays with at least this number of elements are written to .npy files.
+        If not given all arrays are serialized into the YAML file
+    :param chunk_size: number of elements of arrays written to .npy files at once
+    :param blob_store: store for arrays shared between test files. If given without a threshold
+        all arrays are added to the store
+    :param summary_threshold: arrays with at least this number of elements are replaced by their
+        summary (see :py:func:`~pytest_bokeh_regressions.summary.summarize_array`)
+    :param compact: if True arrays serialized into the test file are encoded compactly where possible
+        (see :py:func:`~pytest_bokeh_regressions.compact_arrays.encode_compact`)
+    """
+    from bokeh.core.serialization import Serializer
+    import numpy as np
+    from .compact_arrays import encode_compact
+    from .rules import array_precision
+    from .summary import summarize_array
+
+    serializer = Serializer(deferred=False)
+    directory = sidecar_dir(filename)
+    n_sidecars = 0
+
+    def _store_array(array):
+        nonlocal n_sidecars
+        if summary_threshold is not None and array.size >= summary_threshold:
+            return summarize_array(array, fp_precision, chunk_size)
+        if blob_store is not None and (sidecar_threshold is None or array.size >= sidecar_threshold):
+            digest = blob_store.put(array, array_precision(array, fp_precision), chunk_size)
+            return {"type": BLOB_TYPE, "sha256": digest, "dtype": array.dtype.name, "shape": list(array.shape)}
+        if sidecar_threshold is None or array.size < sidecar_threshold:
+            precision = array_precision(array, fp_precision)
+            if array.dtype.kind == "f":
+                array = np.around(array, decimals=precision)
+            encoded = encode_compact(np.asarray(array), precision) if compact else None
+            return encoded if encoded is not None else serializer.serialize(np.asarray(array)).content
+        _write_npy(directory / f"{n_sidecars}.npy", array, fp_precision, chunk_size)
+        n_sidecars += 1
+        return {"type": SIDECAR_TYPE, "index": n_sidecars - 1, "dtype": array.dtype.name, "shape": list(array.shape)}
+
+    def _convert(entry):
+        if isinstance(entry, np.ndarray):
+            return _store_array(entry)
+        if isinstance(entry, dict):
+            return {key: _convert(val) for key, val in entry.items()}
+        if isinstance(entry, list):
+            return [_convert(val) for val in entry]
+        return entry
+
+    stored = _convert(data)
+
+    # Remove .npy files of a previous version of the test file
+    if directory.is_dir():
+        for path in directory.glob("*.npy"):
+            if not path.stem.isdigit() or int(path.stem) >= n_sidecars:
+                path.unlink()
+
+    return stored
+
+
+def dump(data: MutableMapping, filename: Path) -> None:
+    """
+    Write the given data to a test file with the codec given by its extension. YAML test files have
+    the same format as the ones of the data_regression fixture. The file is replaced atomically.
+    Test files with the suffix of a compression format (e.g. ``.yml.gz``) are compressed while writing.
+    The hash stored for the previous data of the test file (see :py:func:`write_hash`) is removed
+
+    :param data: data in the form returned by :py:func:`to_stored_form`
+    :param filename: path to the test file
+    """
+    codec = codec_of(plain_filename(filename))
+    hash_filename(filename).unlink(missing_ok=True)
+    with atomic_open(filename) as file, _compressed(file, compression_of(filename), "wb") as stream:
+        codec.dump(data, stream)
+
+
+def detect_compression(file: BinaryIO) -> Optional[str]:
+    """
+    Detect the compression format of a file from its first bytes. The position
+    of the file is reset afterwards
+
+    :param file: binary file object at the start of the file
+
+    :returns: name of the compression format or None for plain files
+    """
+    start = file.read(4)
+    file.seek(0)
+    for magic, compression in _MAGIC_NUMBERS.items():
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def load(filename: Path) -> MutableMapping:
+    """
+    Read a test file with the codec given by its extension. Compressed test files
+    are detected by their content and decompressed while parsing
+
+    :param filename: path to the test file
+    """
+    codec = codec_of(plain_filename(filename))
+    with filename.open("rb") as file, _compressed(file, detect_compression(file), "rb") as stream:
+        return codec.load(stream)
+
+
+def read_content(filename: Path) -> bytes:
+    """
+    Read the (decompressed) content of a test file
+
+    :param filename: path to the test file
+    """
+    with filename.open("rb") as file, _compressed(file, detect_compression(file), "rb") as stream:
+        return stream.read()
+
+
+def is_document(data: Any) -> bool:
+    """
+    Whether the data loaded from a file has the shape of a test file, i.e. of a cleaned
+    bokeh model (bokeh 3 or newer) or of a cleaned bokeh document (bokeh 2 or older)
+
+    :param data: data loaded from the file
+    """
+    if not isinstance(data, dict):
+        return False
+    if isinstance(data.get("roots"), dict):
+        return "references" in data["roots"]
+    return data.get("type") == "object" and isinstance(data.get("name"), str)
+
+
+def load_array(entry: Any, filename: Path, blob_store: "Optional[BlobStore]" = None) -> "Optional[np.ndarray]":
+    """
+    Get the array stored in the given entry of a test file. Arrays stored
+    in .npy files are memory-mapped
+
+    :param entry: entry of the data loaded from the test file
+    :param filename: path to the test file
+    :param blob_store: store containing the arrays referenced by hash
+
+    :returns: the array or None if the entry does not represent an array
+    """
+    from .compact_arrays import COMPACT_TYPE, decode_compact
+
+    if not isinstance(entry, dict):
+        return None
+    if entry.get("type") == COMPACT_TYPE:
+        return decode_compact(entry)
+    if entry.get("type") == "ndarray":
+        from bokeh.core.serialization import Deserializer
+
+        return Deserializer().deserialize(entry)
+    if entry.get("type") == SIDECAR_TYPE:
+        import numpy as np
+
+        return np.load(sidecar_dir(filename) / f"{entry['index']}.npy", mmap_mode="r", allow_pickle=False)
+    if entry.get("type") == BLOB_TYPE:
+        if blob_store is None:
+            raise ValueError(f"The test file {filename} references arrays in a blob store. Use --bokeh-blob-store")
+        return blob_store.get(entry["sha256"])
+    return None
+
+
+def hash_filename(filename: Path) -> Path:
+    """
+    Get the path of the file containing the hash of the data in the given test file
+
+    :param filename: path to the test file
+    """
+    return plain_filename(filename).with_suffix(".sha256")
+
+
+class _HashKey:
+    """
+    Marker for dictionary keys in the stack of :py:func:`content_hash`
+    """
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: str) -> None:
+        self.key = str(key)
+
+
+def content_hash(data: Any, fp_precision: int, chunk_size: Optional[int] = None) -> str:
+    """
+    Compute a canonical hash of cleaned JSON data, where arrays are kept as numpy arrays.
+    The hash does not depend on the order of the keys in dictionaries. Arrays are hashed
+    chunk by chunk from their raw (little-endian) bytes after rounding floating point arrays
+
+    :param data: cleaned JSON data with arrays kept as numpy arrays
+    :param fp_precision: number of digits to use in floating point rounding
+    :param chunk_size: number of array elements hashed at once
+    """
+    import hashlib
+    import numpy as np
+
+    hasher = hashlib.sha256()
+    hasher.update(f"fp_precision:{fp_precision}".encode("utf-8"))
+
+    stack = [data]
+    while stack:
+        entry = stack.pop()
+        if isinstance(entry, np.ndarray):
+            hasher.update(f"a{entry.dtype.newbyteorder('<').str}{entry.shape}".encode("utf-8"))
+            for chunk in iter_chunks(entry, chunk_size):
+                hasher.update(process_chunk(chunk, fp_precision).data)
+        elif isinstance(entry, dict):
+            hasher.update(f"d{len(entry)}".encode("utf-8"))
+            for key in sorted(entry, reverse=True):
+                stack.append(entry[key])
+                stack.append(_HashKey(key))
+        elif isinstance(entry, list):
+            hasher.update(f"l{len(entry)}".encode("utf-8"))
+            stack.extend(reversed(entry))
+        elif isinstance(entry, _HashKey):
+            hasher.update(f"k{len(entry.key)}:{entry.key}".encode("utf-8"))
+        else:
+            hasher.update(f"{type(entry).__name__}:{entry!r};".encode("utf-8"))
+
+    return hasher.hexdigest()
+
+
+def file_digest(filename: Path) -> str:
+    """
+    Compute the SHA-256 hash of the content of a file, reading it in blocks
+
+    :param filename: path to the file
+    """
+    import hashlib
+
+    hasher = hashlib.sha256()
+    with filename.open("rb") as file:
+        for block in iter(lambda: file.read(2**20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def write_hash(filename: Path, digest: str) -> None:
+    """
+    Write the hash of the data in the given test file. The hash of the content of the test file
+    is stored along with it, so that hashes of test files modified by other means are ignored
+
+    :param filename: path to the test file, which has to exist
+    :param digest: hash of the data in the test file
+    """
+    atomic_write(hash_filename(filename), f"{digest} {file_digest(filename)}\n".encode("utf-8"))
+
+
+def hash_matches(filename: Path, digest: str) -> bool:
+    """
+    Check whether the hash stored for the given test file matches the given one. The test file
+    is only hashed, not parsed, to check that it did not change since the hash was written
+
+    :param filename: path to the test file
+    :param digest: hash of the data to compare
+    """
+    try:
+        stored_digest, stored_file_digest = hash_filename(filename).read_text(encoding="utf-8").split()
+        return stored_digest == digest and stored_file_digest == file_digest(filename)
+    except (OSError, ValueError):
+        return False
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing compact summaries of large arrays, which are stored in the test files
+instead of the data itself. Summaries contain the dtype, the shape, basic statistics,
+selected quantiles, the number of NaN values and a hash of the rounded data
+"""
+import hashlib
+import math
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from .chunks import iter_chunks, process_chunk
+
+if TYPE_CHECKING:
+    import numpy as np
+
+SUMMARY_TYPE = "summary"
+
+#: Quantiles contained in the summaries of numeric arrays
+QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+
+#: Entries of the summaries compared using the tolerances for floating point arrays
+STATISTICS = ("min", "max", "mean", "std")
+
+
+def _round(value: Any, dtype: "np.dtype", fp_precision: int) -> Any:
+    """
+    Convert a statistic to a plain python number, rounding floating point values
+
+    :param value: the statistic
+    :param dtype: dtype of the summarized array
+    :param fp_precision: number of digits to use in floating point rounding
+    """
+    import numpy as np
+
+    if value is None or not np.isfinite(value):
+        return None if value is None else float(value)
+    if dtype.kind in "iu" and float(value).is_integer():
+        return int(value)
+    return round(float(value), fp_precision)
+
+
+class _RunningStatistics:
+    """
+    Minimum, maximum, mean and standard deviation of the non-NaN values of an array, which are updated
+    chunk by chunk. The mean and standard deviation of the chunks are combined pairwise
+    """
+
+    __slots__ = ("count", "nan_count", "minimum", "maximum", "mean", "m2")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.nan_count = 0
+        self.minimum: Any = None
+        self.maximum: Any = None
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    @property
+    def std(self) -> Optional[float]:
+        """
+        Standard deviation of the values or None if there are no values
+        """
+        return (self.m2 / self.count) ** 0.5 if self.count else None
+
+    def update(self, chunk: "np.ndarray") -> None:
+        """
+        Add the values of a chunk of a numeric array
+
+        :param chunk: the chunk
+        """
+        import numpy as np
+
+        if chunk.dtype.kind == "f":
+            nans = np.isnan(chunk)
+            n_nans = int(np.count_nonzero(nans))
+            if n_nans:
+                self.nan_count += n_nans
+                chunk = chunk[~nans]
+        if chunk.size == 0:
+            return
+        values = chunk.astype(np.float64)
+        chunk_mean = float(np.mean(values))
+        chunk_m2 = float(np.sum((values - chunk_mean) ** 2))
+        chunk_min, chunk_max = chunk.min(), chunk.max()
+        self.minimum = chunk_min if self.minimum is None else min(self.minimum, chunk_min)
+        self.maximum = chunk_max if self.maximum is None else max(self.maximum, chunk_max)
+
+        total = self.count + values.size
+        delta = chunk_mean - self.mean
+        self.mean += delta * values.size / total
+        self.m2 += chunk_m2 + delta**2 * self.count * values.size / total
+        self.count = total
+
+
+def summarize_array(array: "np.ndarray", fp_precision: int, chunk_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Compute the summary of an array. The array is processed chunk by chunk, computing the hash
+    and the statistics of the rounded data in a single pass (the mean and standard deviation of the
+    chunks are combined pairwise). Only the quantiles are computed from the whole array
+
+    :param array: the array
+    :param fp_precision: number of digits to use in floating point rounding. Arrays carrying their
+        own precision (see :py:func:`~pytest_bokeh_regressions.rules.with_precision`) use that precision
+    :param chunk_size: number of array elements processed at once
+
+    :returns: dict of the summary, which can be written to the test files
+    """
+    import numpy as np
+    from .rules import array_precision
+
+    fp_precision = array_precision(array, fp_precision)
+    is_numeric = array.dtype.kind in "iuf"
+
+    # Same hash as the one used for identifying arrays in the blob store
+    hasher = hashlib.sha256()
+    hasher.update(f"{array.dtype.newbyteorder('<').str}{array.shape}".encode("utf-8"))
+
+    statistics = _RunningStatistics()
+    for chunk in iter_chunks(array, chunk_size):
+        chunk = process_chunk(chunk, fp_precision)
+        hasher.update(chunk.data)
+        if is_numeric:
+            statistics.update(chunk)
+
+    summary: Dict[str, Any] = {
+        "type": SUMMARY_TYPE,
+        "dtype": array.dtype.name,
+        "shape": list(array.shape),
+        "sha256": hasher.hexdigest(),
+    }
+    if not is_numeric:
+        return summary
+
+    quantiles: List[Any] = [None] * len(QUANTILES)
+    if statistics.count:
+        # The inverted_cdf method gives values contained in the data, so the quantiles of
+        # the rounded data are the rounded quantiles
+        quantiles = np.nanquantile(array, QUANTILES, method="inverted_cdf").tolist()
+
+    summary.update(
+        {
+            "nan_count": statistics.nan_count,
+            "min": _round(statistics.minimum, array.dtype, fp_precision),
+            "max": _round(statistics.maximum, array.dtype, fp_precision),
+            "mean": _round(statistics.mean if statistics.count else None, array.dtype, fp_precision),
+            "std": _round(statistics.std, np.dtype(float), fp_precision),
+            "quantiles": {
+                f"p{round(level * 100):g}": _round(value, array.dtype, fp_precision)
+                for level, value in zip(QUANTILES, quantiles)
+            },
+        }
+    )
+    return summary
+
+
+def _is_nan(value: Any) -> bool:
+    """
+    Whether a statistic of a summary is NaN (statistics can also be None or integers)
+
+    :param value: the statistic
+    """
+    return isinstance(value, float) and math.isnan(value)
+
+
+def compare_summaries(
+    path: str,
+    obtained: Dict[str, Any],
+    expected: Dict[str, Any],
+    rtol: Optional[float] = None,
+    atol: Optional[float] = None,
+) -> Optional[str]:
+    """
+    Compare the summary of an obtained array against the summary in the test file.
+    If a tolerance is given the statistics and quantiles are compared using ``np.isclose``
+    and the hashes are ignored, otherwise all entries have to be equal
+
+    :param path: path of the array in the data
+    :param obtained: summary of the obtained array
+    :param expected: summary loaded from the test file
+    :param rtol: relative tolerance for comparing the statistics of floating point arrays
+    :param atol: absolute tolerance for comparing the statistics of floating point arrays
+
+    :returns: description of the differences or None if the summaries are equal
+    """
+    import numpy as np
+
+    if obtained["dtype"] != expected.get("dtype") or obtained["shape"] != expected.get("shape"):
+        return (
+            f"{path}: expected array of {expected.get('dtype')}{tuple(expected.get('shape', ()))}, "
+            f"got {obtained['dtype']}{tuple(obtained['shape'])}"
+        )
+
+    use_tolerance = (rtol is not None or atol is not None) and np.dtype(obtained["dtype"]).kind == "f"
+    obtained_values = {key: obtained.get(key) for key in ("nan_count", *STATISTICS)}
+    expected_values = {key: expected.get(key) for key in ("nan_count", *STATISTICS)}
+    for key, value in obtained.get("quantiles", {}).items():
+        obtained_values[f"quantile {key}"] = value
+        expected_values[f"quantile {key}"] = expected.get("quantiles", {}).get(key)
+
+    differences = []
+    for key, value in obtained_values.items():
+        expected_value = expected_values[key]
+        if use_tolerance and key != "nan_count" and None not in (value, expected_value):
+            equal = np.isclose(value, expected_value, rtol=rtol or 0.0, atol=atol or 0.0, equal_nan=True)
+        else:
+            equal = value == expected_value or (_is_nan(value) and _is_nan(expected_value))
+        if not equal:
+            differences.append(f"{key} expected {expected_value!r}, got {value!r}")
+
+    if not use_tolerance and not differences and obtained["sha256"] != expected.get("sha256"):
+        differences.append("the statistics are equal, but the hash of the data differs")
+
+    if not differences:
+        return None
+    tolerance = f" within rtol={rtol}, atol={atol}" if use_tolerance else ""
+    return f"{path}: summary of the array differs{tolerance}: {'; '.join(differences)}"
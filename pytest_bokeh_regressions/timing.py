@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the timing of the stages of the ``check_plot`` method of the
+bokeh_json_regression fixture and the terminal/JSON report of the collected timings
+"""
+import contextlib
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pytest
+
+#: Stages of a check in the order they are reported
+STAGES = ("serialize", "clean", "hash", "load", "compare", "dump")
+
+
+class CheckPlotTiming:
+    """
+    Durations of the stages of a single ``check_plot`` call and the size of the checked document
+
+    :param basename: basename of the test file
+    :param with_document_stats: if False, the size of the checked document is not recorded,
+        which requires an additional walk of the document
+    """
+
+    def __init__(self, basename: str, with_document_stats: bool = True) -> None:
+        self.basename = basename
+        self.with_document_stats = with_document_stats
+        self.stages: Dict[str, float] = {}
+        self.document_entries = 0
+        self.array_bytes = 0
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Context manager adding the time spent inside it to the given stage
+
+        :param name: name of the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def total(self) -> float:
+        """
+        Total duration of all stages
+        """
+        return sum(self.stages.values())
+
+    def record_document(self, data: Any) -> None:
+        """
+        Record the number of entries and the size of the arrays in the cleaned document
+
+        :param data: cleaned JSON data
+        """
+        if self.with_document_stats:
+            self.document_entries, self.array_bytes = document_stats(data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the timing to a JSON serializable dict
+        """
+        return {
+            "basename": self.basename,
+            "total": self.total,
+            "stages": dict(self.stages),
+            "document_entries": self.document_entries,
+            "array_bytes": self.array_bytes,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CheckPlotTiming":
+        """
+        Create a timing from the dict produced by :py:meth:`to_dict`
+
+        :param data: dict with the timing information
+        """
+        timing = cls(data["basename"])
+        timing.stages = dict(data["stages"])
+        timing.document_entries = data["document_entries"]
+        timing.array_bytes = data["array_bytes"]
+        return timing
+
+
+def document_stats(data: Any) -> Tuple[int, int]:
+    """
+    Count the entries in cleaned JSON data and the number of bytes in the contained arrays.
+    Arrays are either numpy arrays or base64 encoded in the bokeh representation
+
+    :param data: cleaned JSON data
+
+    :returns: tuple of the number of entries and the number of bytes in arrays
+    """
+    import numpy as np
+
+    entries = 0
+    array_bytes = 0
+    stack = [data]
+    while stack:
+        entry = stack.pop()
+        entries += 1
+        if isinstance(entry, np.ndarray):
+            array_bytes += entry.nbytes
+        elif isinstance(entry, dict):
+            encoded = entry.get("__ndarray__")
+            if encoded is None and entry.get("type") == "bytes":
+                encoded = entry.get("data")
+            if isinstance(encoded, str):
+                array_bytes += len(encoded) * 3 // 4 - encoded[-2:].count("=")
+            else:
+                stack.extend(entry.values())
+        elif isinstance(entry, (list, tuple)):
+            stack.extend(entry)
+
+    return entries, array_bytes
+
+
+class BokehTimingReporter:
+    """
+    Plugin collecting the timings of the ``check_plot`` calls from the test reports
+    (also of pytest-xdist workers), reporting the slowest checks in the terminal summary
+    and exporting them to a JSON file
+
+    :param config: pytest config object
+    """
+
+    def __init__(self, config: pytest.Config) -> None:
+        self.config = config
+        self.timings: List[Tuple[str, CheckPlotTiming]] = []
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        """
+        Collect the timings attached to the report of a test
+        """
+        for data in getattr(report, "bokeh_timings", []):
+            timing = CheckPlotTiming.from_dict(data)
+            self.timings.append((report.nodeid, timing))
+            self.config.hook.pytest_bokeh_check_plot_timing(config=self.config, nodeid=report.nodeid, timing=timing)
+
+    def pytest_sessionfinish(self) -> None:
+        """
+        Write the collected timings to the file given with --bokeh-durations-json
+        """
+        filename: Optional[str] = self.config.getoption("bokeh_durations_json")
+        if filename is None:
+            return
+        Path(filename).write_text(
+            json.dumps([{"nodeid": nodeid, **timing.to_dict()} for nodeid, timing in self.timings], indent=2),
+            encoding="utf-8",
+        )
+
+    def pytest_terminal_summary(self, terminalreporter: pytest.TerminalReporter) -> None:
+        """
+        Show the slowest checks with the durations of each stage if --bokeh-durations is given
+        """
+        n_durations: Optional[int] = self.config.getoption("bokeh_durations")
+        if n_durations is None:
+            return
+
+        timings = sorted(self.timings, key=lambda item: item[1].total, reverse=True)
+        if n_durations > 0:
+            title = f"slowest {n_durations} bokeh_json_regression checks"
+            timings = timings[:n_durations]
+        else:
+            title = "bokeh_json_regression check durations"
+        terminalreporter.write_sep("=", title)
+
+        for nodeid, timing in timings:
+            stages = ", ".join(f"{name} {timing.stages[name]:.3f}s" for name in STAGES if name in timing.stages)
+            terminalreporter.write_line(
+                f"{timing.total:.3f}s {nodeid} [{timing.basename}] ({stages}; "
+                f"{timing.document_entries} entries, {timing.array_bytes} array bytes)"
+            )
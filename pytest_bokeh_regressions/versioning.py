@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing the BokehVersionIndex class used for finding test files in subfolders
+named bokeh-<version>
+"""
+import os
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from packaging.version import Version, InvalidVersion
+
+
+@lru_cache(maxsize=None)
+def get_bokeh_version() -> str:
+    """
+    Get the version of the installed bokeh package from the package metadata,
+    i.e. without importing bokeh
+
+    :returns: the version string or ``"unknown"`` if bokeh is not installed
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("bokeh")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def bokeh_version_in_range(minimum: str, maximum: str) -> bool:
+    """
+    Whether the installed bokeh version is in the given range (including the minimum, excluding the maximum).
+    Unknown versions are not in the range
+
+    :param minimum: first version of the range
+    :param maximum: first version after the range
+    """
+    try:
+        return Version(minimum) <= Version(get_bokeh_version()) < Version(maximum)
+    except InvalidVersion:
+        return False
+
+
+def is_bokeh_lt_3() -> bool:
+    """
+    Whether the installed bokeh version is older than 3.0.0
+    """
+    try:
+        return Version(get_bokeh_version()) < Version("3.0.0")
+    except InvalidVersion:
+        return False
+
+
+def scan_version_folders(datadir: Path) -> Dict[str, List[str]]:
+    """
+    Find the subfolders named bokeh-<version> of the data directory and list their contents
+
+    :param datadir: Path to the data directory
+
+    :returns: dict of the names of the files in the subfolders by the version
+    """
+    if not datadir.is_dir():
+        return {}
+    return {
+        entry.name.partition("-")[2]: [child.name for child in os.scandir(entry.path)]
+        for entry in os.scandir(datadir)
+        if entry.is_dir() and entry.name.startswith("bokeh-")
+    }
+
+
+class BokehVersionIndex:
+    """
+    Session wide index of the subfolders named bokeh-<version> in data directories.
+
+    Each data directory is scanned only once and the found versions are kept sorted,
+    so that the newest version not newer than the installed bokeh version is found
+    by bisection. The contents of the version subfolders are also only listed once
+
+    If a shared directory is given (the directory for caches of the test session when running with
+    pytest-xdist), the first process using a data directory stores the result of :py:func:`scan_version_folders`
+    in it and all other processes use the stored result. So the decisions are taken once for the whole
+    test session, even if other processes write new test files in the meantime, and only the data directories
+    of tests actually using the index are scanned. The stored results are no longer used once the index is invalidated
+
+    :param current_version: version of the installed bokeh package
+    :param shared_dir: directory for the scanned version subfolders shared between processes
+    """
+
+    def __init__(self, current_version: str, shared_dir: Optional[Path] = None) -> None:
+        self.current_version = current_version
+        self.shared_dir = shared_dir
+        self._current = Version(current_version)
+        self._shared: Dict[Path, Dict[str, List[str]]] = {}
+        self._versions: Dict[Path, Tuple[List[Version], List[str]]] = {}
+        self._files: Dict[Path, Set[str]] = {}
+
+    def _scanned(self, datadir: Path) -> Optional[Dict[str, List[str]]]:
+        """
+        Get the version subfolders of the data directory and their contents stored in the shared directory.
+        If no other process stored them yet, the data directory is scanned and the result is stored
+
+        :param datadir: Path to the data directory
+        """
+        import hashlib
+        import json
+
+        from .storage import atomic_open, file_lock
+
+        if self.shared_dir is None:
+            return None
+        if datadir not in self._shared:
+            resolved = str(datadir.resolve())
+            filename = self.shared_dir / f"{hashlib.sha256(resolved.encode()).hexdigest()}.json"
+            with file_lock(filename):
+                if filename.exists():
+                    self._shared[datadir] = json.loads(filename.read_text(encoding="utf-8"))
+                else:
+                    self._shared[datadir] = scan_version_folders(datadir)
+                    with atomic_open(filename) as file:
+                        file.write(json.dumps(self._shared[datadir]).encode())
+        return self._shared[datadir]
+
+    def _scan(self, datadir: Path) -> Tuple[List[Version], List[str]]:
+        """
+        Get the sorted versions and the corresponding version strings of the folder names
+        for the given data directory
+
+        :param datadir: Path to the directory to search for test files
+        """
+        if datadir not in self._versions:
+
+            def scan():
+                if not datadir.is_dir():
+                    return []
+                return [
+                    entry.name.partition("-")[2]
+                    for entry in os.scandir(datadir)
+                    if entry.is_dir() and entry.name.startswith("bokeh-")
+                ]
+
+            scanned = self._scanned(datadir)
+            found = []
+            for version in scan() if scanned is None else scanned:
+                try:
+                    found.append((Version(version), version))
+                except InvalidVersion:
+                    continue
+            found.sort()
+            self._versions[datadir] = [version for version, _ in found], [name for _, name in found]
+        return self._versions[datadir]
+
+    def _contains(self, folder: Path, filename: str) -> bool:
+        """
+        Whether the given version subfolder contains the given file. Test files of all codecs
+        and compression formats are found under the name of the plain YAML test file
+
+        :param folder: Path to the version subfolder
+        :param filename: name of the file
+        """
+        from .storage import file_key
+
+        if folder not in self._files:
+
+            def scan():
+                return [entry.name for entry in os.scandir(folder)] if folder.is_dir() else []
+
+            scanned = self._scanned(folder.parent)
+            if scanned is None:
+                names = scan()
+            else:
+                names = scanned.get(folder.name.partition("-")[2], [])
+            self._files[folder] = {file_key(Path(name)).name for name in names}
+        return filename in self._files[folder]
+
+    def has_version(self, datadir: Path, version: str) -> bool:
+        """
+        Whether a subfolder for the given version exists in the data directory
+
+        :param datadir: Path to the directory to search for test files
+        :param version: string of the version
+        """
+        return version in self._scan(datadir)[1]
+
+    def resolve(self, datadir: Path, filename: Optional[str] = None) -> Optional[str]:
+        """
+        Get the newest available bokeh version not newer than the current version
+        for which test files exist in the data directory
+
+        :param datadir: Path to the directory to search for test files
+        :param filename: If given, only versions with subfolders containing this file are considered
+
+        :returns: the version string used in the name of the subfolder or None if no such version exists
+        """
+        versions, names = self._scan(datadir)
+        index = bisect_right(versions, self._current)
+        if filename is None:
+            return names[index - 1] if index > 0 else None
+
+        for name in reversed(names[:index]):
+            if self._contains(datadir / f"bokeh-{name}", filename):
+                return name
+        return None
+
+    def invalidate(self, datadir: Optional[Path] = None) -> None:
+        """
+        Remove the cached information for the given data directory, e.g. after new
+        test files were written. The version subfolders stored in the shared directory are not used afterwards
+
+        :param datadir: Path to the data directory. If not given all cached information is removed
+        """
+        self.shared_dir = None
+        if datadir is None:
+            self._versions.clear()
+            self._files.clear()
+            return
+
+        self._versions.pop(datadir, None)
+        for folder in [folder for folder in self._files if folder.parent == datadir]:
+            del self._files[folder]
@@ -3,4 +3,7 @@
 Testing configuration
 """
 
+# numpy cannot be imported again in the pytester runs, so it is imported once before the snapshots of sys.modules
+import numpy  # pylint: disable=unused-import
+
 pytest_plugins = ["pytester"]
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the comparison of cleaned JSON data, where arrays are compared with numpy
+"""
+from packaging.version import Version
+import numpy as np
+import pytest
+
+import bokeh
+
+from pytest_bokeh_regressions.array_diff import compare_documents, describe_array_difference, values_differ
+
+BOKEH_LT_3 = Version(bokeh.__version__) < Version("3.0.0")
+
+
+def test_describe_array_difference():
+    """
+    Test the summary of the differences of two arrays
+    """
+    expected = np.linspace(0, 1, 11)
+    obtained = expected.copy()
+    assert describe_array_difference("/x", obtained, expected) is None
+
+    obtained[[3, 7]] += [0.5, -0.1]
+    assert describe_array_difference("/x", obtained, expected, chunk_size=4) == (
+        "/x: arrays are not equal: 2 of 11 elements differ (float64(11,)), first at 3, 7; "
+        "max abs error 0.5, max rel error 1.66667"
+    )
+    assert describe_array_difference("/x", obtained, expected, atol=0.2).startswith(
+        "/x: arrays are not equal within rtol=None, atol=0.2: 1 of 11 elements differ"
+    )
+    assert describe_array_difference("/x", obtained.astype(np.float32), expected) == (
+        "/x: expected array of float64(11,), got float32(11,)"
+    )
+
+    expected = np.arange(12).reshape(3, 4)
+    obtained = expected.copy()
+    obtained[2, 1] = 0
+    assert describe_array_difference("/y", obtained, expected) == (
+        "/y: arrays are not equal: 1 of 12 elements differ (int64(3, 4)), first at (2, 1); "
+        "max abs error 9, max rel error 1"
+    )
+
+
+@pytest.mark.skipif(BOKEH_LT_3, reason="Test for bokeh version 3 or newer")
+def test_compare_documents():
+    """
+    Test that arrays are compared separately and only the remaining data is compared as text
+    """
+    from bokeh.core.serialization import Serializer
+    from bokeh.models import ColumnDataSource
+    from pytest_bokeh_regressions.json_comparison import _clean_bokeh_json_v3
+
+    def _cleaned(y, name="source"):
+        source = ColumnDataSource(data={"x": np.linspace(0, 1, 1000), "y": y}, name=name)
+        return _clean_bokeh_json_v3(Serializer().serialize(source).content, fp_precision=5)
+
+    y = np.linspace(0, 1, 1000) ** 2
+    expected = _cleaned(y)
+    assert not compare_documents(_cleaned(y), expected)
+
+    differences = compare_documents(_cleaned(y + 0.5), expected)
+    assert len(differences) == 1
+    assert differences[0].startswith(
+        "/attributes/data/entries/1[y]/1: arrays are not equal: 1000 of 1000 elements differ"
+    )
+
+    differences = compare_documents(_cleaned(y, name="changed"), expected)
+    assert "-  name: source" in differences
+    assert "+  name: changed" in differences
+    assert not any("AAAA" in line for line in differences)
+
+
+def test_type_changes():
+    """
+    Test that values of different types are differences, although they are equal in Python
+    """
+    assert not values_differ(2, 2)
+    assert values_differ(2, 2.0)
+    assert values_differ(True, 1)
+    assert values_differ(0, False)
+    assert not values_differ("a", "a")
+
+    expected = {"attributes": {"line_width": 2, "visible": True}, "name": "Line", "type": "object"}
+    assert not compare_documents(expected, expected)
+    differences = compare_documents({**expected, "attributes": {"line_width": 2.0, "visible": True}}, expected)
+    assert "-  line_width: 2" in differences
+    assert "+  line_width: 2.0" in differences
+    differences = compare_documents({**expected, "attributes": {"line_width": 2, "visible": 1}}, expected)
+    assert "-  visible: true" in differences
+    assert "+  visible: 1" in differences
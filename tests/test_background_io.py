@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of prefetching and writing test files in the background
+"""
+import os
+
+import numpy as np  # pylint: disable=unused-import # numpy cannot be imported again in the pytester runs
+import pytest
+
+from pytest_bokeh_regressions import storage
+from pytest_bokeh_regressions.background_io import BackgroundIO
+
+TEST_PLOT = """
+from bokeh.plotting import figure
+
+def test_plot(bokeh_json_regression):
+    p = figure(title="{title}")
+    p.line([1, 2, 3], [4, 5, 6])
+    bokeh_json_regression.check_plot(p)
+"""
+
+
+def test_prefetch(tmp_path, monkeypatch):
+    """
+    Test that prefetched data is used only if the file did not change afterwards
+    """
+    filename = tmp_path / "test.yml"
+    storage.dump({"a": 1}, filename)
+
+    background_io = BackgroundIO()
+    try:
+        background_io.prefetch(filename)
+        background_io._prefetched[filename].result()  # pylint: disable=protected-access
+        with monkeypatch.context() as context:
+            context.setattr(storage, "load", lambda filename: pytest.fail("File read again"))
+            assert background_io.load(filename) == {"a": 1}
+
+        background_io.prefetch(filename)
+        background_io._prefetched[filename].result()  # pylint: disable=protected-access
+        storage.dump({"a": 22}, filename)
+        # Make sure that the modification time changes
+        os.utime(filename, ns=(0, 0))
+        assert background_io.load(filename) == {"a": 22}
+
+        # Without a prefetch the file is read
+        assert background_io.load(filename) == {"a": 22}
+
+        # Discarded prefetches are not kept
+        background_io.prefetch(filename)
+        background_io.discard(filename)
+        assert not background_io._prefetched  # pylint: disable=protected-access
+        background_io.discard(filename)
+    finally:
+        background_io.close()
+
+
+def test_background_write(tmp_path):
+    """
+    Test that writes are finished before the file is read and errors are raised when flushing
+    """
+    filename = tmp_path / "test.yml"
+
+    background_io = BackgroundIO()
+    try:
+        background_io.prefetch(filename)
+        background_io.write(filename, lambda filename: storage.dump({"b": 2}, filename))
+        assert background_io.load(filename) == {"b": 2}
+
+        def _fail(filename):
+            raise OSError(f"Cannot write {filename.name}")
+
+        background_io.write(tmp_path / "other.yml", _fail)
+        with pytest.raises(OSError, match="Cannot write other.yml"):
+            background_io.flush()
+        background_io.flush()
+    finally:
+        background_io.close()
+
+
+@pytest.mark.parametrize("args", [(), ("--bokeh-sync-io",)])
+def test_background_io_check(pytester, args):
+    """
+    Test the regression checks with and without background I/O
+    """
+    pytester.makepyfile(test_plots=TEST_PLOT.format(title="Line"))
+
+    result = pytester.runpytest(*args)
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*File not found in data directory, created:.*"])
+    yml_file = pytester.path / "test_plots" / "test_plot.yml"
+    assert yml_file.is_file()
+
+    result = pytester.runpytest(*args)
+    result.assert_outcomes(passed=1)
+
+    pytester.makepyfile(test_plots=TEST_PLOT.format(title="Changed"))
+    result = pytester.runpytest(*args)
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*FILES DIFFER.*", ".*text: Changed.*"])
+
+    result = pytester.runpytest("--force-regen", *args)
+    result.assert_outcomes(failed=1)
+    assert "text: Changed" in yml_file.read_text(encoding="utf-8")
+
+    result = pytester.runpytest(*args)
+    result.assert_outcomes(passed=1)
+
+
+def test_discard_prefetch(pytester):
+    """
+    Test that test files prefetched for tests, which fail before checking them, are not kept in memory
+    """
+    pytester.makepyfile(
+        test_plots="""
+        def test_fails(bokeh_json_regression):
+            assert False
+
+        def test_discarded(bokeh_background_io):
+            assert not bokeh_background_io._prefetched
+        """
+    )
+    (pytester.path / "test_plots").mkdir()
+    storage.dump({"a": 1}, pytester.path / "test_plots" / "test_fails.yml")
+
+    # Test files are only prefetched if they are compared keeping the arrays
+    result = pytester.runpytest("--bokeh-hash")
+    result.assert_outcomes(passed=1, failed=1)
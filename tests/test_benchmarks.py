@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Test that the benchmark of the bokeh regression fixture runs and produces valid output
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BENCHMARK = Path(__file__).parent.parent / "benchmarks" / "benchmark_check_plot.py"
+
+
+def test_benchmark_output(tmp_path):
+    """
+    Test the machine-readable output of the benchmark for small documents
+    """
+    output = tmp_path / "results.json"
+    subprocess.run(
+        [sys.executable, str(BENCHMARK), "--quick", "--repeat=1", "--axis=points", "--axis=shared", "-o", str(output)],
+        check=True,
+    )
+
+    results = json.loads(output.read_text(encoding="utf-8"))
+    assert {"bokeh", "cleaner", "pytest-bokeh-regressions"} <= set(results["metadata"])
+    assert {(result["axis"], result["size"]) for result in results["results"]} == {
+        ("points", 10),
+        ("points", 100),
+        ("shared", 1),
+        ("shared", 3),
+    }
+    for result in results["results"]:
+        stages = {"serialize", "dump", "load", "compare"}
+        if result["mode"] != "serializer":
+            stages.add("clean")
+        assert set(result["stages"]) == stages
+        assert all(stage["time"] >= 0 and stage["peak_memory"] > 0 for stage in result["stages"].values())
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of storing the arrays of test files in a content-addressed blob store
+"""
+from packaging.version import Version
+import numpy as np
+import pytest
+
+import bokeh
+
+from pytest_bokeh_regressions.blob_store import BlobStore
+from pytest_bokeh_regressions.cli import main
+
+BOKEH_VERSION = bokeh.__version__
+BOKEH_LT_3 = Version(BOKEH_VERSION) < Version("3.0.0")
+
+pytestmark = pytest.mark.skipif(BOKEH_LT_3, reason="Test for bokeh version 3 or newer")
+
+TEST_SHARED_ARRAYS = """
+import numpy as np
+from bokeh.plotting import figure
+
+def test_shared(bokeh_json_regression):
+    x = np.linspace(-1, 1, 100)
+
+    p = figure(title="Parabola")
+    p.line(x, x**2)
+    bokeh_json_regression.check_plot(p, basename="first")
+
+    p = figure(title="Shifted parabola")
+    p.line(x, x**2 + {shift})
+    bokeh_json_regression.check_plot(p, basename="second")
+"""
+
+
+def test_blob_store(pytester):
+    """
+    Test that identical arrays of different test files are stored once in the blob store
+    and that unreferenced blobs are removed by the gc command
+    """
+    pytester.makepyfile(test_plots=TEST_SHARED_ARRAYS.format(shift=1))
+
+    result = pytester.runpytest("--bokeh-blob-store=blobs", "--regen-all")
+    result.assert_outcomes(passed=1)
+
+    store = BlobStore(pytester.path / "blobs")
+    # x is shared between both test files
+    assert len(list(store.iter_blobs())) == 3
+    datadir = pytester.path / "test_plots"
+    assert "type: blob" in (datadir / "first.yml").read_text(encoding="utf-8")
+
+    result = pytester.runpytest("--bokeh-blob-store=blobs")
+    result.assert_outcomes(passed=1)
+
+    pytester.makepyfile(test_plots=TEST_SHARED_ARRAYS.format(shift=2))
+    result = pytester.runpytest("--bokeh-blob-store=blobs")
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*second.obtained.yml", ".*arrays are not equal.*"])
+
+    # The arrays of the obtained file of the failed check are not added to the store
+    assert len(list(store.iter_blobs())) == 3
+    (datadir / "second.yml").unlink()
+    # Files, which are no test files, are skipped
+    (datadir / "data.yml").write_text("values: [1, 2]\n", encoding="utf-8")
+    (pytester.path / "invalid.yml").write_text("key: [", encoding="utf-8")
+    assert main(["gc", str(store.directory), str(pytester.path), "--dry-run"]) == 0
+    assert len(list(store.iter_blobs())) == 3
+    # Only scanning a part of the test files using the store is refused
+    assert main(["gc", str(store.directory), str(datadir)]) == 1
+    assert len(list(store.iter_blobs())) == 3
+    assert main(["gc", str(store.directory), str(pytester.path)]) == 0
+    assert len(list(store.iter_blobs())) == 2
+
+    result = pytester.runpytest("--bokeh-blob-store=blobs")
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*File not found in data directory, created:", ".*second.yml"])
+    result = pytester.runpytest("--bokeh-blob-store=blobs")
+    result.assert_outcomes(passed=1)
+
+
+def test_blob_store_cache(tmp_path):
+    """
+    Test that arrays read from the blob store are cached
+    """
+    store = BlobStore(tmp_path, max_bytes=80)
+    first = store.put(np.linspace(0, 1, 10), fp_precision=2)
+    second = store.put(np.arange(10), fp_precision=2)
+    assert store.put(np.linspace(0, 1, 10) + 1e-6, fp_precision=2) == first
+
+    np.testing.assert_array_equal(store.get(first), np.around(np.linspace(0, 1, 10), 2))
+    assert store.get(first) is store.get(first)
+    assert (store.hits, store.misses) == (2, 1)
+
+    store.get(second)
+    store.get(first)
+    assert (store.hits, store.misses) == (2, 3)
+    assert store.nbytes == 80
+
+    # Arrays larger than the size limit are not cached
+    large = store.put(np.arange(20), fp_precision=2)
+    store.get(large)
+    store.get(first)
+    assert (store.hits, store.misses) == (3, 4)
+
+
+def test_gc_unparsable_file(tmp_path):
+    """
+    Test that the blobs referenced in test files, which cannot be parsed, are kept
+    """
+    store = BlobStore(tmp_path / "blobs")
+    digest = store.put(np.arange(10), fp_precision=2)
+    (tmp_path / "test.yml").write_text(
+        f"<<<<<<< HEAD\nattributes:\n  data: {{sha256: {digest}, type: blob}}\n", encoding="utf-8"
+    )
+    assert not store.collect_garbage([tmp_path / "test.yml"])
+    assert store.collect_garbage([]) == [store.path(digest)]
@@ -115,3 +115,123 @@ def test_add_version(pytester, cli, bokeh_version):
         result.assert_outcomes(failed=1)
 
     assert (pytester.path / "test_add_version" / f"bokeh-{BOKEH_VERSION}" / "test_example.yml").exists()
+
+
+def test_fallback_version_per_file(pytester):
+    """
+    Test that older versions are searched for the test file if the newest
+    older version does not contain the test file
+    """
+    path = pytester.path / "test_fallback_version_per_file"
+    (path / f"bokeh-{BOKEH_FALLBACK_TEST_VERSION}").mkdir(parents=True)
+    (path / "bokeh-0.0.2").mkdir(parents=True)
+
+    test_file_name = "test_example_v2.yml" if BOKEH_LT_3 else "test_example.yml"
+
+    shutil.copyfile(
+        Path(__file__).parent / "test_json_comparison" / test_file_name,
+        path / f"bokeh-{BOKEH_FALLBACK_TEST_VERSION}" / "test_example.yml",
+    )
+
+    pytester.makepyfile(
+        """
+    from bokeh.plotting import figure
+
+    def test_example(bokeh_json_regression):
+        x = [1,3,6,4,9]
+        y = [0,2,7,5,3]
+
+        p = figure(title="Minimal Example", x_axis_label='x', y_axis_label='y')
+        p.line(x,y,line_width=2)
+
+        bokeh_json_regression.check_plot(p)
+    """
+    )
+
+    result = pytester.runpytest("--bokeh-with-version")
+    result.assert_outcomes(passed=1)
+    assert not (path / "bokeh-0.0.2" / "test_example.yml").exists()
+
+
+def test_version_index(tmp_path):
+    """
+    Test of the BokehVersionIndex finding the fallback versions
+    """
+    from pytest_bokeh_regressions.versioning import BokehVersionIndex
+
+    for version in ("0.1.0", "1.0.0", "2.0.0", "invalid"):
+        (tmp_path / f"bokeh-{version}").mkdir()
+    (tmp_path / "bokeh-0.1.0" / "test.yml").touch()
+
+    index = BokehVersionIndex("1.5.0")
+
+    assert index.has_version(tmp_path, "1.0.0")
+    assert not index.has_version(tmp_path, "1.5.0")
+    assert index.resolve(tmp_path) == "1.0.0"
+    assert index.resolve(tmp_path, filename="test.yml") == "0.1.0"
+    assert index.resolve(tmp_path, filename="other.yml") is None
+    assert index.resolve(tmp_path / "missing") is None
+
+    (tmp_path / "bokeh-1.2.0").mkdir()
+    (tmp_path / "bokeh-1.2.0" / "test.yml").touch()
+    assert index.resolve(tmp_path) == "1.0.0"
+
+    index.invalidate(tmp_path)
+    assert index.resolve(tmp_path) == "1.2.0"
+    assert index.resolve(tmp_path, filename="test.yml") == "1.2.0"
+
+
+def test_version_index_shared(tmp_path):
+    """
+    Test that BokehVersionIndex instances sharing the scanned version subfolders (pytest-xdist workers)
+    take the same decisions, even if new folders are created in between, and only scan the used data directories
+    """
+    from pytest_bokeh_regressions.versioning import BokehVersionIndex, scan_version_folders
+
+    datadir = tmp_path / "data"
+    (datadir / "bokeh-0.1.0").mkdir(parents=True)
+    (datadir / "bokeh-0.1.0" / "test.yml").touch()
+    assert scan_version_folders(datadir) == {"0.1.0": ["test.yml"]}
+    assert not scan_version_folders(tmp_path / "missing")
+
+    shared_dir = tmp_path / "shared"
+    assert BokehVersionIndex("1.0.0", shared_dir).resolve(datadir) == "0.1.0"
+    assert len(list(shared_dir.glob("*.json"))) == 1
+
+    (datadir / "bokeh-1.0.0").mkdir()
+    (datadir / "bokeh-1.0.0" / "test.yml").touch()
+    index = BokehVersionIndex("1.0.0", shared_dir)
+    assert index.resolve(datadir) == "0.1.0"
+    assert index.resolve(datadir, filename="test.yml") == "0.1.0"
+    assert BokehVersionIndex("1.0.0").resolve(datadir) == "1.0.0"
+
+    index.invalidate()
+    assert index.resolve(datadir) == "1.0.0"
+    assert len(list(shared_dir.glob("*.json"))) == 1
+
+
+def test_add_version_xdist(pytester):
+    """
+    Test of the --bokeh-add-version flag when running the tests in parallel with pytest-xdist
+    """
+    pytest.importorskip("xdist")
+
+    pytester.makepyfile(
+        """
+    import pytest
+    from bokeh.plotting import figure
+
+    @pytest.mark.parametrize("index", range(8))
+    def test_example(bokeh_json_regression, index):
+        p = figure(title=f"Example {index % 2}")
+        p.line([1, 2, 3], [index, 2, 3], line_width=2)
+
+        bokeh_json_regression.check_plot(p, basename=f"example_{index % 4}")
+    """
+    )
+
+    result = pytester.runpytest("-n", "2", "--bokeh-with-version", "--bokeh-add-version")
+    result.assert_outcomes(failed=8)
+
+    folder = pytester.path / "test_add_version_xdist" / f"bokeh-{BOKEH_VERSION}"
+    assert sorted(path.name for path in folder.iterdir()) == [f"example_{index}.yml" for index in range(4)]
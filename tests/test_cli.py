@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the bokeh-regressions command for maintaining test files
+"""
+import shutil
+from pathlib import Path
+
+from packaging.version import Version
+import numpy as np  # pylint: disable=unused-import # numpy cannot be imported again in the pytester runs
+import pytest
+
+import bokeh
+
+from pytest_bokeh_regressions.cli import main
+
+BOKEH_LT_3 = Version(bokeh.__version__) < Version("3.0.0")
+
+TEST_PLOTS = """
+import numpy as np
+from bokeh.plotting import figure
+
+def test_plot(bokeh_json_regression):
+    x = np.linspace(0, 1, 101)
+    p = figure(title="Parabola")
+    p.line(x, x**2, line_width=1.23456)
+    bokeh_json_regression.check_plot(p)
+"""
+
+
+@pytest.mark.skipif(BOKEH_LT_3, reason="Test for bokeh version 3 or newer")
+@pytest.mark.parametrize("args", [(), ("--bokeh-sidecar-threshold=50",)])
+def test_verify_reclean_stats(pytester, capsys, args):
+    """
+    Test verifying test files, rounding them to a new precision and showing statistics
+    """
+    pytester.makepyfile(test_plots=TEST_PLOTS)
+    result = pytester.runpytest("--regen-all", *args)
+    result.assert_outcomes(passed=1)
+
+    datadir = pytester.path / "test_plots"
+    assert main(["verify", str(datadir), "-j", "2"]) == 0
+    assert "1 test file(s) checked, 0 error(s)" in capsys.readouterr().out
+
+    result = pytester.runpytest("--bokeh-fp-precision=2", *args)
+    result.assert_outcomes(failed=1)
+    for path in datadir.glob("*.obtained.yml"):
+        path.unlink()
+
+    # Files of the data_regression fixture are not rounded
+    (datadir / "data.yml").write_text("value: 1.23456\n", encoding="utf-8")
+    assert main(["reclean", str(datadir), "--fp-precision=2", "-j", "2"]) == 0
+    assert "1 of 1 test file(s) rewritten with fp precision 2" in capsys.readouterr().out
+    assert (datadir / "data.yml").read_text(encoding="utf-8") == "value: 1.23456\n"
+    result = pytester.runpytest("--bokeh-fp-precision=2", *args)
+    result.assert_outcomes(passed=1)
+    capsys.readouterr()
+
+    assert main(["stats", str(datadir)]) == 0
+    output = capsys.readouterr().out
+    assert "unversioned" in output
+    assert "total" in output
+
+    (datadir / "broken.yml").write_text("a: [", encoding="utf-8")
+    assert main(["verify", str(datadir)]) == 1
+    assert "broken.yml: could not be parsed" in capsys.readouterr().out
+
+
+def test_migrate(tmp_path, capsys):
+    """
+    Test moving test files in the format of bokeh 2 into a versioned folder
+    """
+    datadir = Path(__file__).parent / "test_json_comparison"
+    shutil.copy(datadir / "test_example_v2.yml", tmp_path)
+    shutil.copy(datadir / "test_example.yml", tmp_path)
+
+    assert main(["migrate", str(tmp_path), "--version=2.4.3", "-j", "1"]) == 0
+    assert "1 test file(s) in the format of bokeh 2 found" in capsys.readouterr().out
+    assert sorted(path.relative_to(tmp_path).as_posix() for path in tmp_path.rglob("*.yml")) == [
+        "bokeh-2.4.3/test_example_v2.yml",
+        "test_example.yml",
+    ]
+
+
+def test_prune(tmp_path, capsys):
+    """
+    Test removing versioned folders only used for versions older than the given one
+    """
+    for name in ("bokeh-2.4.3/a.yml", "bokeh-2.4.2/b.yml", "bokeh-3.1.0/a.yml", "bokeh-3.3.0/a.yml"):
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_text("{}", encoding="utf-8")
+
+    assert main(["prune", str(tmp_path), "--min-version=3.0", "--dry-run"]) == 0
+    assert "would remove" in capsys.readouterr().out
+    assert (tmp_path / "bokeh-2.4.3").is_dir()
+
+    assert main(["prune", str(tmp_path), "--min-version=3.0"]) == 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["bokeh-2.4.2", "bokeh-3.1.0", "bokeh-3.3.0"]
+
+
+@pytest.mark.skipif(BOKEH_LT_3, reason="Test for bokeh version 3 or newer")
+def test_convert(pytester, capsys):
+    """
+    Test rewriting test files with another codec
+    """
+    pytester.makepyfile(test_plots=TEST_PLOTS)
+    args = ("--bokeh-sidecar-threshold=50", "--bokeh-hash")
+    result = pytester.runpytest("--regen-all", "--bokeh-compression=gzip", *args)
+    result.assert_outcomes(passed=1)
+
+    datadir = pytester.path / "test_plots"
+    hash_file = datadir / "test_plot.sha256"
+    digest = hash_file.read_text(encoding="utf-8").split()[0]
+    assert main(["convert", str(datadir), "--codec=json", "-j", "1"]) == 0
+    assert "1 of 1 test file(s) converted to json" in capsys.readouterr().out
+    assert sorted(path.name for path in datadir.iterdir()) == [
+        "test_plot.arrays",
+        "test_plot.json.gz",
+        "test_plot.sha256",
+    ]
+    assert hash_file.read_text(encoding="utf-8").split()[0] == digest
+
+    result = pytester.runpytest(*args)
+    result.assert_outcomes(passed=1)
+    capsys.readouterr()
+
+    assert main(["convert", str(datadir), "--codec=yaml"]) == 0
+    assert "1 of 1 test file(s) converted to yaml" in capsys.readouterr().out
+    result = pytester.runpytest(*args)
+    result.assert_outcomes(passed=1)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the codecs of the test files (YAML and canonical JSON)
+"""
+import io
+import json
+from pathlib import Path
+
+from packaging.version import Version
+import numpy as np  # pylint: disable=unused-import # numpy cannot be imported again in the pytester runs
+import pytest
+import yaml
+
+import bokeh
+
+from pytest_bokeh_regressions import storage
+from pytest_bokeh_regressions.codec import CODECS, codec_of, get_codec
+
+BOKEH_LT_3 = Version(bokeh.__version__) < Version("3.0.0")
+
+TEST_PLOT = """
+from bokeh.plotting import figure
+
+def test_plot(bokeh_json_regression):
+    p = figure(title="{title}")
+    p.line([1, 2, 3], [4, 5.5, 6])
+    bokeh_json_regression.check_plot(p)
+"""
+
+
+def test_yaml_codec():
+    """
+    Test that the YAML codec writes the same files as the data_regression fixture
+    """
+    from pytest_regressions.data_regression import RegressionYamlDumper
+
+    filename = Path(__file__).parent / "test_json_comparison" / "test_example.yml"
+    data = yaml.safe_load(filename.read_text(encoding="utf-8"))
+    data["unicode"] = "äöü"
+    data["long"] = "x" * 300
+
+    stream = io.BytesIO()
+    CODECS["yaml"].dump(data, stream)
+    expected = yaml.dump_all(
+        [data], Dumper=RegressionYamlDumper, default_flow_style=False, allow_unicode=True, indent=2, encoding="utf-8"
+    )
+    assert stream.getvalue() == expected
+
+    stream.seek(0)
+    assert CODECS["yaml"].load(stream) == data
+
+
+def test_json_codec():
+    """
+    Test that the JSON codec writes canonical files and reads values not supported by orjson
+    """
+    data = {"b": [1, 0.1, 1e-05, "ä"], "a": {"y": None, "x": True}}
+    stream = io.BytesIO()
+    CODECS["json"].dump(data, stream)
+    assert (
+        stream.getvalue().decode("utf-8")
+        == json.dumps({"a": {"x": True, "y": None}, "b": [1, 0.1, 1e-05, "ä"]}, indent=2, ensure_ascii=False) + "\n"
+    )
+
+    reordered = io.BytesIO()
+    CODECS["json"].dump(dict(reversed(list(data.items()))), reordered)
+    assert reordered.getvalue() == stream.getvalue()
+
+    stream.seek(0)
+    assert CODECS["json"].load(stream) == data
+
+    loaded = CODECS["json"].load(io.BytesIO(b'{"nan": NaN, "large": 123456789012345678901234567890}'))
+    assert np.isnan(loaded["nan"])
+    assert loaded["large"] == 123456789012345678901234567890
+
+    with pytest.raises(ValueError, match="Unknown codec 'xml'"):
+        get_codec("xml")
+
+
+def test_codec_files(tmp_path):
+    """
+    Test finding test files of both codecs and writing/reading them
+    """
+    assert codec_of(Path("test.json")).name == "json"
+    assert codec_of(Path("test.yml")).name == "yaml"
+    assert storage.file_key(Path("a/test.json.gz")) == Path("a/test.yml")
+    assert storage.is_test_file(Path("test.json.gz"))
+    assert not storage.is_test_file(Path("test.obtained.json"))
+
+    assert storage.find_test_file(tmp_path, "test", codec="json").name == "test.json"
+    filename = storage.find_test_file(tmp_path, "test", "gzip", "json")
+    assert filename.name == "test.json.gz"
+    data = {"attributes": {"a": [1, 2]}, "name": "Plot", "type": "object"}
+    storage.dump(data, filename)
+    assert storage.load(filename) == data
+
+    # Existing test files are used in their format
+    assert storage.find_test_file(tmp_path, "test") == filename
+    storage.dump(data, tmp_path / "other.yml")
+    assert storage.find_test_file(tmp_path, "other", codec="json").name == "other.yml"
+    assert [path.name for path in storage.glob_test_files(tmp_path)] == ["other.yml", "test.json.gz"]
+
+    # Files of other tests are no test files
+    storage.dump({"a": [1, 2]}, tmp_path / "data.json")
+    storage.dump({"a": [1, 2]}, tmp_path / "data.yml")
+    (tmp_path / "invalid.json").write_text("{", encoding="utf-8")
+    assert not storage.is_test_file(tmp_path / "data.json")
+    assert not storage.is_test_file(tmp_path / "data.yml")
+    assert storage.is_test_file(tmp_path / "data.yml", check_content=False)
+    assert not storage.is_test_file(tmp_path / "invalid.json")
+    assert [path.name for path in storage.glob_test_files(tmp_path)] == ["other.yml", "test.json.gz"]
+
+
+@pytest.mark.skipif(BOKEH_LT_3, reason="Test for bokeh version 3 or newer")
+def test_json_check(pytester):
+    """
+    Test the regression checks with JSON test files next to YAML test files
+    """
+    pytester.makepyfile(test_plots=TEST_PLOT.format(title="Line"))
+
+    result = pytester.runpytest("--bokeh-codec=json")
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*File not found in data directory, created:.*"])
+    datadir = pytester.path / "test_plots"
+    json_file = datadir / "test_plot.json"
+    assert json.loads(json_file.read_text(encoding="utf-8"))["attributes"]["title"]["attributes"]["text"] == "Line"
+
+    # The codec of the existing test file is used
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1)
+
+    pytester.makepyfile(test_plots=TEST_PLOT.format(title="Changed"))
+    result = pytester.runpytest()
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*FILES DIFFER.*", r".*test_plot\.obtained\.json.*"])
+
+    json_file.unlink()
+    result = pytester.runpytest()
+    result.assert_outcomes(failed=1)
+    assert (datadir / "test_plot.yml").is_file()
+    result = pytester.runpytest("--bokeh-codec=json")
+    result.assert_outcomes(passed=1)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the compact encoding of arrays in the test files
+"""
+from packaging.version import Version
+import numpy as np
+import pytest
+
+import bokeh
+import bokeh.plotting  # pylint: disable=unused-import # bokeh models cannot be registered again in the pytester runs
+
+from pytest_bokeh_regressions.cli import main
+from pytest_bokeh_regressions.compact_arrays import decode_compact, encode_compact
+
+BOKEH_LT_3 = Version(bokeh.__version__) < Version("3.0.0")
+
+pytestmark = pytest.mark.skipif(BOKEH_LT_3, reason="Test for bokeh version 3 or newer")
+
+TEST_TIME_SERIES = """
+import numpy as np
+from bokeh.plotting import figure
+
+def test_time_series(bokeh_json_regression):
+    t = np.arange(2000) * 0.5
+    y = np.around(np.sin(t / 50), 3) + {shift}
+    p = figure(title="Time series")
+    p.line(t, y)
+    p.scatter(t, np.full(2000, 1.5))
+    bokeh_json_regression.check_plot(p)
+"""
+
+
+@pytest.mark.parametrize(
+    "array, expected",
+    [
+        (np.linspace(0, 1, 1001), {"scale": 5, "start": 0, "step": 100}),
+        (np.arange(500, dtype=np.int64), {"start": 0, "step": 1}),
+        (np.full((10, 3), 2.5), {"constant": 2.5}),
+        (np.random.default_rng(42).normal(size=(20, 50)), {"scale": 5, "data": "int32"}),
+        (np.cumsum(np.random.default_rng(42).integers(1, 100, size=1000)) * 0.01, {"scale": 5, "data": "uint32"}),
+    ],
+)
+def test_encode_compact(array, expected):
+    """
+    Test that arrays are encoded losslessly in the expected form
+    """
+    rounded = np.around(array, 5) if array.dtype.kind == "f" else array
+    encoded = encode_compact(rounded, 5)
+    assert encoded["dtype"] == array.dtype.name
+    assert encoded["shape"] == list(array.shape)
+    for key, value in expected.items():
+        if key == "data":
+            assert encoded["data"]["dtype"] == value
+        else:
+            assert encoded[key] == value
+
+    decoded = decode_compact(encoded)
+    assert decoded.dtype == array.dtype
+    assert np.array_equal(decoded, rounded)
+
+
+@pytest.mark.parametrize(
+    "array",
+    [
+        np.array([1.0, np.nan, 2.0]),
+        np.random.default_rng(42).normal(size=100).astype(np.float32),
+        np.random.default_rng(42).normal(size=100) * 1e15,
+        np.array(["a", "b"]),
+    ],
+)
+def test_encode_compact_not_possible(array):
+    """
+    Test that arrays without a smaller lossless encoding are not encoded
+    """
+    assert encode_compact(np.around(array, 5) if array.dtype.kind == "f" else array, 5) is None
+
+
+def test_compact_check(pytester, capsys):
+    """
+    Test that the test files are smaller with compact arrays and changes of the arrays are detected
+    """
+    pytester.makepyfile(test_plots=TEST_TIME_SERIES.format(shift=0))
+    datadir = pytester.path / "test_plots"
+    yml_file = datadir / "test_time_series.yml"
+
+    result = pytester.runpytest("--regen-all")
+    result.assert_outcomes(passed=1)
+    size = yml_file.stat().st_size
+
+    result = pytester.runpytest("--regen-all", "--bokeh-compact-arrays")
+    result.assert_outcomes(passed=1)
+    content = yml_file.read_text(encoding="utf-8")
+    assert "type: compact" in content
+    assert "constant: 1.5" in content
+    assert yml_file.stat().st_size * 3 < size
+
+    result = pytester.runpytest("--bokeh-compact-arrays")
+    result.assert_outcomes(passed=1)
+
+    pytester.makepyfile(test_plots=TEST_TIME_SERIES.format(shift=0.001))
+    result = pytester.runpytest("--bokeh-compact-arrays")
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*arrays are not equal: 2000 of 2000 elements differ.*"])
+    for path in datadir.glob("*.obtained.yml"):
+        path.unlink()
+
+    capsys.readouterr()
+    assert main(["verify", str(datadir)]) == 0
+    assert "1 test file(s) checked, 0 error(s)" in capsys.readouterr().out
+    assert main(["reclean", str(datadir), "--fp-precision=1"]) == 0
+    assert "1 of 1 test file(s) rewritten" in capsys.readouterr().out
+    pytester.makepyfile(test_plots=TEST_TIME_SERIES.format(shift=0))
+    result = pytester.runpytest("--bokeh-compact-arrays", "--bokeh-fp-precision=1")
+    result.assert_outcomes(passed=1)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the session wide cache of loaded test files
+"""
+import os
+import sys
+
+from packaging.version import Version
+import numpy as np
+import pytest
+
+import bokeh
+
+from pytest_bokeh_regressions import storage
+from pytest_bokeh_regressions.file_cache import FileCache, estimate_size, parse_size
+
+BOKEH_LT_3 = Version(bokeh.__version__) < Version("3.0.0")
+
+TEST_PARAMETRIZED = """
+import numpy as np
+import pytest
+from bokeh.plotting import figure
+
+@pytest.mark.parametrize("color", ["red", "blue", "green"])
+@pytest.mark.parametrize("mode", ["yaml", "arrays"])
+def test_plot(bokeh_json_regression, color, mode):
+    p = figure(title="Shared")
+    p.line(np.arange(100) * {scale}, np.arange(100))
+    if mode == "yaml":
+        bokeh_json_regression.check_plot(p, basename="shared")
+    else:
+        bokeh_json_regression.check_plot(p, basename="shared_arrays", rtol=1e-9)
+"""
+
+
+def test_parse_size():
+    """
+    Test parsing the size limit of the cache
+    """
+    assert parse_size("0") == 0
+    assert parse_size("512") == 512
+    assert parse_size("512K") == 512 * 1024
+    assert parse_size("100M") == 100 * 1024**2
+    assert parse_size("2gb") == 2 * 1024**3
+    with pytest.raises(ValueError, match="Invalid size '1T'"):
+        parse_size("1T")
+
+
+def test_estimate_size():
+    """
+    Test estimating the memory used by loaded test files
+    """
+    assert estimate_size({}) == sys.getsizeof({})
+    data = {"values": [1.5, "text"]}
+    assert estimate_size(data) == sum(sys.getsizeof(entry) for entry in (data, "values", data["values"], 1.5, "text"))
+
+
+def test_file_cache(tmp_path):
+    """
+    Test that test files are read once and read again if they change
+    """
+    filename = tmp_path / "test.yml"
+    storage.dump({"a": 1}, filename)
+    reads = []
+
+    def _load(filename):
+        reads.append(filename)
+        return storage.load(filename)
+
+    cache = FileCache(2**20)
+    assert cache.load(filename, _load) == {"a": 1}
+    assert cache.load(tmp_path / "." / "test.yml", _load) == {"a": 1}
+    assert filename in cache
+    assert len(reads) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    storage.dump({"a": 22}, filename)
+    # Make sure that the modification time changes
+    os.utime(filename, ns=(0, 0))
+    assert filename not in cache
+    assert cache.load(filename, _load) == {"a": 22}
+    assert len(reads) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_file_cache_arrays(tmp_path):
+    """
+    Test that decoded arrays are kept read-only and count towards the size limit
+    """
+    filename = tmp_path / "test.yml"
+    storage.dump({"a": 1}, filename)
+    entry = {"values": [1.0, 2.0]}
+    decoded = []
+
+    def _decode(entry):
+        decoded.append(entry)
+        return np.array(entry["values"]) if isinstance(entry, dict) else None
+
+    size = estimate_size(storage.load(filename))
+    cache = FileCache(size + 16)
+    cache.load(filename, storage.load)
+    array = cache.load_array(filename, entry, _decode)
+    assert not array.flags.writeable
+    assert cache.load_array(filename, entry, _decode) is array
+    assert cache.load_array(filename, "no array", _decode) is None
+    assert len(decoded) == 2
+    assert cache.nbytes == size + 16
+
+    cache.load_array(filename, {"values": [3.0]}, _decode)
+    assert filename not in cache
+    assert (cache.nbytes, cache.evictions) == (0, 1)
+
+
+def test_file_cache_eviction(tmp_path):
+    """
+    Test that the least recently used test files are removed if the cache is full
+    """
+    filenames = [tmp_path / f"test_{index}.yml" for index in range(3)]
+    for filename in filenames:
+        storage.dump({"values": list(range(100))}, filename)
+    size = estimate_size(storage.load(filenames[0]))
+    # The loaded data is larger than the test file
+    assert size > filenames[0].stat().st_size
+
+    cache = FileCache(2 * size)
+    cache.load(filenames[0], storage.load)
+    cache.load(filenames[1], storage.load)
+    cache.load(filenames[0], storage.load)
+    cache.load(filenames[2], storage.load)
+    assert filenames[0] in cache
+    assert filenames[1] not in cache
+    assert filenames[2] in cache
+    assert (cache.nbytes, cache.evictions) == (2 * size, 1)
+
+    # Test files larger than the cache are not kept
+    small_cache = FileCache(size - 1)
+    small_cache.load(filenames[0], storage.load)
+    assert filenames[0] not in small_cache
+    assert (small_cache.nbytes, small_cache.evictions) == (0, 0)
+
+
+@pytest.mark.skipif(BOKEH_LT_3, reason="Test for bokeh version 3 or newer")
+@pytest.mark.parametrize("args", [(), ("-n", "2")])
+def test_file_cache_check(pytester, args):
+    """
+    Test that test files shared by parametrized tests are read once and the hits are shown in the summary
+    """
+    pytester.makepyfile(test_plots=TEST_PARAMETRIZED.format(scale=0.5))
+    result = pytester.runpytest("--regen-all")
+    result.assert_outcomes(passed=6)
+    assert "bokeh test file cache" not in result.stdout.str()
+
+    # Test files identical to the obtained files are not loaded (except when comparing with tolerances)
+    result = pytester.runpytest(*args)
+    result.assert_outcomes(passed=6)
+    if args:
+        result.stdout.re_match_lines([r"bokeh test file cache: \d hits, [1-2] misses .*, 0 evictions.*100M.*"])
+    else:
+        result.stdout.re_match_lines([r"bokeh test file cache: 2 hits, 1 misses \(66\.7% hits\), 0 evictions.*"])
+
+    pytester.makeini("[pytest]\nbokeh_cache_size = 0")
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=6)
+    assert "bokeh test file cache" not in result.stdout.str()
+
+    pytester.makepyfile(test_plots=TEST_PARAMETRIZED.format(scale=0.25))
+    pytester.makeini("[pytest]\nbokeh_cache_size = 1M")
+    result = pytester.runpytest()
+    result.assert_outcomes(failed=6)
+    result.stdout.re_match_lines([r"bokeh test file cache: 4 hits, 2 misses .*limit of 1M.*"])
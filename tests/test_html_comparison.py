@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the html comparison of failed bokeh regression checks
+"""
+from pathlib import Path
+from packaging.version import Version
+import pytest
+
+import bokeh
+from bokeh.embed import json_item
+from bokeh.plotting import figure
+
+BOKEH_VERSION = bokeh.__version__
+BOKEH_LT_3 = Version(BOKEH_VERSION) < Version("3.0.0")
+
+TEST_PLOTS = """
+import numpy as np
+from bokeh.plotting import figure
+
+def test_line(bokeh_json_regression):
+    x = np.linspace(-1, 1, 100) + {shift}
+    p = figure(title="Parabola")
+    p.line(x, x**2)
+    bokeh_json_regression.check_plot(p)
+
+def test_scatter(bokeh_json_regression):
+    p = figure(title="Scatter")
+    p.scatter([1, 2, 3], [{shift}, 2, 3])
+    bokeh_json_regression.check_plot(p)
+
+def test_unchanged(bokeh_json_regression):
+    p = figure(title="Unchanged")
+    p.line([1, 2, 3], [4, 5, 6])
+    bokeh_json_regression.check_plot(p)
+"""
+
+
+@pytest.mark.parametrize("args", [(), ("-n", "2")])
+def test_html_comparison(pytester, args):
+    """
+    Test that the failed checks are combined into a single html file
+    """
+    if args:
+        pytest.importorskip("xdist")
+    pytester.makepyfile(test_plots=TEST_PLOTS.format(shift=0))
+    result = pytester.runpytest("--bokeh-html-comparison", *args)
+    result.assert_outcomes(failed=3)
+
+    # No comparisons for missing test files
+    report = pytester.path / "bokeh_comparison.html"
+    assert not report.exists()
+
+    pytester.makepyfile(test_plots=TEST_PLOTS.format(shift=0.5))
+    result = pytester.runpytest("--bokeh-html-comparison", *args)
+    result.assert_outcomes(failed=2, passed=1)
+    result.stdout.re_match_lines([f".*bokeh HTML comparison of 2 failed check.* written to {report}"])
+
+    content = report.read_text(encoding="utf-8")
+    assert content.count("Bokeh.embed.embed_item(") == (4 if not BOKEH_LT_3 else 2)
+    assert content.count("<section>") == 2
+    assert all(content.count(url) == 1 for url in bokeh.resources.CDN.js_files)
+    assert "test_plots.py::test_line [test_line]" in content
+    assert "test_plots.py::test_scatter [test_scatter]" in content
+    assert "test_unchanged" not in content
+    assert "Could not" not in content
+
+
+@pytest.mark.skipif(BOKEH_LT_3, reason="Test for bokeh version 3 or newer")
+def test_rebuild_model():
+    """
+    Test rebuilding bokeh models from test files
+    """
+    from pytest_bokeh_regressions import storage
+    from pytest_bokeh_regressions.html_comparison import rebuild_model
+
+    filename = Path(__file__).parent / "test_json_comparison" / "test_array.yml"
+    model = rebuild_model(storage.load(filename), filename)
+
+    assert isinstance(model, figure)
+    assert model.title.text == "Parabola"
+    assert len(model.renderers[0].data_source.data["x"]) == 100
+    json_item(model)
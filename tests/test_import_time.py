@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that loading the plugin at pytest startup stays cheap
+"""
+import subprocess
+import sys
+
+#: Budget for the cumulative import time of the plugin module (in microseconds)
+IMPORT_TIME_BUDGET = 50_000
+
+
+def test_plugin_import_time():
+    """
+    Test that importing the plugin module does not import bokeh and stays within the budget
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import pytest; import pytest_bokeh_regressions.plugin"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+    # The lines after importing pytest belong to the plugin
+    lines = result.stderr.splitlines()
+    lines = lines[next(index for index, line in enumerate(lines) if line.endswith("| pytest")) + 1 :]
+    modules = {line.split("|")[-1].strip() for line in lines}
+    assert "bokeh" not in modules
+
+    cumulative = next(int(line.split("|")[1]) for line in lines if line.endswith("| pytest_bokeh_regressions.plugin"))
+    assert cumulative < IMPORT_TIME_BUDGET
+
+
+def test_no_bokeh_import(pytester):
+    """
+    Test that bokeh is not imported by the plugin in test runs not using the bokeh regression fixtures
+    """
+    pytester.makepyfile(
+        """
+        import sys
+
+        def test_no_bokeh():
+            assert "bokeh" not in sys.modules
+        """
+    )
+    result = pytester.runpytest_subprocess()
+    result.assert_outcomes(passed=1)
+    result.stdout.re_match_lines(["Bokeh: .*"])
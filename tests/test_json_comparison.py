@@ -5,6 +5,7 @@ Tests of the bokeh_json_regression fixture
 from packaging.version import Version
 
 import pytest
+import yaml
 import bokeh
 from bokeh.plotting import figure
 
@@ -96,6 +97,167 @@ def test_array(bokeh_json_regression):
     bokeh_json_regression.check_plot(p, basename=basename)
 
 
+@bokehv3_test
+def test_check_plots(bokeh_json_regression):
+    """
+    Test of checking multiple models at once against the test files of the individual checks
+    """
+    import numpy as np
+
+    example = figure(title="Minimal Example", x_axis_label="x", y_axis_label="y")
+    example.line([1, 3, 6, 4, 9], [0, 2, 7, 5, 3], line_width=2)
+
+    x = np.linspace(-1, 1, 100)
+    array = figure(title="Parabola", x_axis_label="x", y_axis_label="y")
+    array.line(x, x**2, line_width=2)
+
+    bokeh_json_regression.check_plots({"test_example": example, "test_array": array})
+
+
+TEST_SHARED_MODELS = """
+import numpy as np
+from bokeh.layouts import gridplot
+from bokeh.models import ColumnDataSource
+from bokeh.plotting import figure
+
+def make_models():
+    source = ColumnDataSource(data={"x": np.linspace(0, 1, 500), "y": np.linspace(0, 1, 500) ** 2})
+    figures = []
+    for index in range(3):
+        p = figure(title=f"Figure {index}", **({"x_range": figures[0].x_range} if figures else {}))
+        p.line("x", "y", source=source)
+        figures.append(p)
+    return {"grid": gridplot([figures]), **{f"figure_{index}": p for index, p in enumerate(figures)}}
+
+def test_batch(bokeh_json_regression):
+    bokeh_json_regression.check_plots({f"batch_{name}": model for name, model in make_models().items()})
+
+def test_single(bokeh_json_regression):
+    for name, model in make_models().items():
+        bokeh_json_regression.check_plot(model, basename=f"single_{name}")
+"""
+
+
+@bokehv3_test
+def test_check_plots_shared_models(pytester):
+    """
+    Test that checking multiple models sharing sub-models at once produces the same test files
+    as checking them one by one and that all failures are reported together
+    """
+    pytester.makepyfile(test_plots=TEST_SHARED_MODELS)
+
+    result = pytester.runpytest("--regen-all")
+    result.assert_outcomes(passed=2)
+
+    datadir = pytester.path / "test_plots"
+    for name in ("grid", "figure_0", "figure_1", "figure_2"):
+        batch = (datadir / f"batch_{name}.yml").read_text(encoding="utf-8")
+        assert batch == (datadir / f"single_{name}.yml").read_text(encoding="utf-8")
+
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=2)
+
+    (datadir / "batch_figure_0.yml").unlink()
+    (datadir / "batch_figure_2.yml").write_text("changed", encoding="utf-8")
+    result = pytester.runpytest("-k", "batch")
+    result.assert_outcomes(failed=1, deselected=1)
+    result.stdout.re_match_lines([".*batch_figure_2.obtained.yml", ".*File not found in data directory.*"])
+
+
+TEST_CLEANING_RULES = """
+import numpy as np
+import pytest
+from bokeh.plotting import figure
+
+def make_plot():
+    rng = np.random.default_rng()
+    x = np.arange(1.0, 21.0)
+    y = 0.1 * x + rng.uniform(-0.02, 0.02, x.size)
+    p = figure(title=str(rng.integers(1000)), name=str(rng.integers(1000)))
+    p.scatter(x="x", y="y", source={"x": x, "y": y, "noise": rng.normal(size=x.size)})
+    return p
+
+@pytest.mark.bokeh_clean_rules(drop=["Title.text"])
+def test_rules(bokeh_json_regression):
+    bokeh_json_regression.check_plot(make_plot())
+"""
+
+
+@bokehv3_test
+@pytest.mark.parametrize("options", [(), ("--bokeh-hash",)])
+def test_cleaning_rules(pytester, options):
+    """
+    Test that the attributes given in the ini options and the marker are dropped
+    and that the precision given for a column of the data source is used
+    """
+    pytester.makeini(
+        """
+        [pytest]
+        bokeh_drop =
+            *.name
+            ColumnDataSource.data.noise
+        bokeh_precision =
+            ColumnDataSource.data.y = 1
+        """
+    )
+    pytester.makepyfile(test_plots=TEST_CLEANING_RULES)
+
+    result = pytester.runpytest("--regen-all", *options)
+    result.assert_outcomes(passed=1)
+
+    content = (pytester.path / "test_plots" / "test_rules.yml").read_text(encoding="utf-8")
+    assert "noise" not in content
+    assert "name" not in yaml.safe_load(content)["attributes"]
+
+    for _ in range(2):
+        result = pytester.runpytest(*options)
+        result.assert_outcomes(passed=1)
+
+
+@bokehv3_test
+def test_cleaning_rules_invalid_pattern(pytester):
+    """
+    Test that invalid patterns in the ini options are reported
+    """
+    pytester.makeini(
+        """
+        [pytest]
+        bokeh_drop = name
+        """
+    )
+    pytester.makepyfile(test_plots=TEST_CLEANING_RULES)
+
+    result = pytester.runpytest()
+    result.assert_outcomes(errors=1)
+    result.stdout.fnmatch_lines(["*Invalid pattern 'name'*"])
+
+
+@bokehv3_test
+def test_clean_json_v3_rules():
+    """
+    Test that the cleaning rules drop attributes and dict entries and set their precision
+    """
+    import numpy as np
+    from bokeh.core.serialization import Serializer
+    from bokeh.models import ColumnDataSource
+    from pytest_bokeh_regressions.json_comparison import _clean_bokeh_json_v3
+    from pytest_bokeh_regressions.rules import CleaningRules
+
+    source = ColumnDataSource(data={"x": np.array([1.23456]), "y": np.array([1.23456]), "z": [1]}, name="source")
+    rules = CleaningRules(drop=["*.name", "ColumnDataSource.data.z"], precision={"ColumnDataSource.data.x": 1})
+
+    data = _clean_bokeh_json_v3(Serializer().serialize(source).content, fp_precision=3, keep_arrays=True, rules=rules)
+    assert "name" not in data["attributes"]
+    columns = dict(data["attributes"]["data"]["entries"])
+    assert set(columns) == {"x", "y"}
+    assert columns["x"].fp_precision == 1
+    assert not hasattr(columns["y"], "fp_precision")
+
+    data = _clean_bokeh_json_v3(Serializer().serialize(source).content, fp_precision=3, rules=rules)
+    columns = dict(data["attributes"]["data"]["entries"])
+    assert columns["x"] == Serializer(deferred=False).serialize(np.array([1.2])).content
+
+
 def test_array_fp_precision(bokeh_json_regression):
     """
     Test of the fixture when the JSON data contains numpy array data and an fp_precision argument is passed
@@ -119,3 +281,273 @@ def test_array_fp_precision(bokeh_json_regression):
         p.line(x, y, line_width=2)
 
         bokeh_json_regression.check_plot(p, fp_precision=2, basename=basename)
+
+
+@bokehv3_test
+def test_clean_json_v3():
+    """
+    Test of the cleaning function for bokeh 3 removing IDs and empty entries and rounding floats
+    """
+    from pytest_bokeh_regressions.json_comparison import _clean_bokeh_json_v3
+
+    data = {
+        "id": "p1001",
+        "root_ids": ["p1001"],
+        "a": [{"id": "p1002"}, 1.23456, [{}, {"id": "p1003"}]],
+        "b": {"c": None, "d": [], "e": {"id": "p1004"}},
+        "f": (2.34567, "text"),
+    }
+
+    assert _clean_bokeh_json_v3(data, fp_precision=2) == {"a": [1.23, [{}, {}]], "f": [2.35, "text"]}
+
+
+@bokehv3_test
+def test_clean_json_v3_keep_arrays():
+    """
+    Test that arrays kept as numpy arrays by the cleaning function are not copied
+    """
+    import numpy as np
+    from bokeh.core.serialization import Serializer
+    from bokeh.models import ColumnDataSource
+    from pytest_bokeh_regressions.json_comparison import _clean_bokeh_json_v3
+
+    x = np.linspace(0, 1, 1000).reshape(10, 100)
+    source = ColumnDataSource(data={"x": x})
+
+    data = _clean_bokeh_json_v3(Serializer().serialize(source).content, fp_precision=2, keep_arrays=True)
+    array = data["attributes"]["data"]["entries"][0][1]
+    assert np.shares_memory(array, x)
+    assert array.shape == (10, 100)
+
+
+@bokehv3_test
+def test_clean_json_v3_deeply_nested():
+    """
+    Test that the cleaning function for bokeh 3 is not limited by the recursion depth
+    """
+    import sys
+    from pytest_bokeh_regressions.json_comparison import _clean_bokeh_json_v3
+
+    depth = 2 * sys.getrecursionlimit()
+    data = {"value": 1.23456}
+    for _ in range(depth):
+        data = {"id": "p1001", "child": [data]}
+
+    cleaned = _clean_bokeh_json_v3(data, fp_precision=2)
+    for _ in range(depth):
+        cleaned = cleaned["child"][0]
+
+    assert cleaned == {"value": 1.23}
+
+
+@bokehv3_test
+def test_normalizing_serializer():
+    """
+    Test that the data produced by the normalizing serializer is identical to the cleaned serialized data
+    """
+    import array
+    import datetime
+    import numpy as np
+    from bokeh.core.serialization import Serializer
+    from bokeh.layouts import gridplot
+    from bokeh.models import ColumnDataSource, HoverTool
+    from pytest_regressions.data_regression import RegressionYamlDumper
+    from pytest_bokeh_regressions.json_comparison import _clean_bokeh_json_v3
+    from pytest_bokeh_regressions.normalizing_serialization import serialize_cleaned
+
+    x = np.linspace(0, 1, 101)
+    source = ColumnDataSource(
+        data={
+            "x": x,
+            "y": np.sin(x).astype(np.float32),
+            "i": np.arange(x.size),
+            "t": [datetime.datetime(2020, 1, 1) + datetime.timedelta(hours=hours) for hours in range(x.size)],
+            "nan": np.where(x > 0.5, np.nan, x),
+            "typed": array.array("d", x),
+            "float16": x.astype(np.float16),
+        }
+    )
+    p1 = figure(title="Datetime", x_axis_type="datetime", y_range=(0.123456789, 2.3333333))
+    p1.line("t", "y", source=source, line_width=1.23456789)
+    p1.scatter("t", "nan", source=source)
+    p1.add_tools(HoverTool(tooltips=[("x", "@x{0.000}")]))
+    p2 = figure(title="Shared source")
+    p2.line("x", "i", source=source)
+
+    for model in (p1, gridplot([[p1, p2]]), source):
+        expected = _clean_bokeh_json_v3(Serializer().serialize(model).content, fp_precision=3)
+        obtained = serialize_cleaned(model, fp_precision=3)
+        assert obtained == expected
+        assert yaml.dump(obtained, Dumper=RegressionYamlDumper) == yaml.dump(expected, Dumper=RegressionYamlDumper)
+
+
+@bokehv3_test
+def test_serializer_internals():
+    """
+    Test the internals of bokeh's Serializer used by the memoizing and normalizing serializers,
+    so that changes in new bokeh versions are detected instead of producing wrong test files
+    """
+    import array
+    import numpy as np
+    from bokeh.core.serialization import Serializer
+    from bokeh.model import Model
+    from bokeh.models import ColumnDataSource
+    from pytest_bokeh_regressions import memo_serialization, normalizing_serialization
+
+    assert memo_serialization.is_supported(), f"Serializer internals of bokeh {BOKEH_VERSION} are not supported"
+    assert normalizing_serialization.is_supported(), f"Serializer internals of bokeh {BOKEH_VERSION} are not supported"
+
+    calls = []
+
+    class RecordingSerializer(Serializer):
+        """
+        Serializer recording the calls of the overridden internals
+        """
+
+        def add_ref(self, obj, ref):
+            calls.append(obj)
+            super().add_ref(obj, ref)
+
+        def _encode_ndarray(self, obj):
+            calls.append("ndarray")
+            return super()._encode_ndarray(obj)
+
+        def _encode_typed_array(self, obj):
+            calls.append("typed_array")
+            return super()._encode_typed_array(obj)
+
+    source = ColumnDataSource(data={"x": np.linspace(0, 1, 11), "typed": array.array("d", range(11))})
+    p = figure()
+    p.line("x", "typed", source=source)
+    serializer = RecordingSerializer(deferred=False)
+    content = serializer.serialize(p).content
+    assert content == Serializer(deferred=False).serialize(p).content
+
+    models = [obj for obj in calls if isinstance(obj, Model)]
+    assert {id(model) for model in models} == {id(model) for model in p.references()}
+    assert set(serializer._references) == {id(model) for model in models}  # pylint: disable=protected-access
+    assert "ndarray" in calls
+    assert "typed_array" in calls
+
+
+@bokehv3_test
+def test_serializer_engine(pytester):
+    """
+    Test that the serializer engine produces the same test files as cleaning the serialized data
+    """
+    pytester.makepyfile(test_plots=TEST_SHARED_MODELS)
+
+    result = pytester.runpytest("--regen-all")
+    result.assert_outcomes(passed=2)
+    datadir = pytester.path / "test_plots"
+    expected = {path.name: path.read_bytes() for path in datadir.glob("*.yml")}
+
+    result = pytester.runpytest("--bokeh-engine=serializer")
+    result.assert_outcomes(passed=2)
+
+    result = pytester.runpytest("--bokeh-engine=serializer", "--regen-all")
+    result.assert_outcomes(passed=2)
+    assert {path.name: path.read_bytes() for path in datadir.glob("*.yml")} == expected
+
+
+TEST_TYPES = """
+from bokeh.plotting import figure
+
+def test_types(bokeh_json_regression):
+    p = figure(title="Types")
+    p.line([1, 2, 3], [4, 5, 6], line_width=2)
+    bokeh_json_regression.check_plot(p)
+"""
+
+
+@bokehv3_test
+@pytest.mark.parametrize(
+    "original, changed", [("line_width: 2\n", "line_width: 2.0\n"), ("visible: false\n", "visible: 0\n")]
+)
+def test_type_changes(pytester, original, changed):
+    """
+    Test that changes of the type of values (int and float, bool and int) are detected,
+    although the values are equal in Python
+    """
+    pytester.makepyfile(test_plots=TEST_TYPES)
+    result = pytester.runpytest("--regen-all")
+    result.assert_outcomes(passed=1)
+
+    yml_file = pytester.path / "test_plots" / "test_types.yml"
+    content = yml_file.read_text(encoding="utf-8")
+    assert original in content
+    yml_file.write_text(content.replace(original, changed), encoding="utf-8")
+
+    result = pytester.runpytest()
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*FILES DIFFER.*", f".*-.*{changed.strip()}", f".*\\+.*{original.strip()}"])
+
+    # Formatting changes of the test file are reported as well
+    yml_file.write_text(yaml.safe_dump(yaml.safe_load(content), indent=4), encoding="utf-8")
+    result = pytester.runpytest()
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*The data is equal, but the files are written differently.*"])
+
+
+@bokehv3_test
+def test_array_tolerance(bokeh_json_regression):
+    """
+    Test of the fixture when comparing numpy array data using tolerances instead of rounding
+    """
+    import numpy as np
+
+    x = np.linspace(-1, 1, 100)
+    y = x**2
+
+    p = figure(title="Parabola", x_axis_label="x", y_axis_label="y")
+    p.line(x, y, line_width=2)
+
+    bokeh_json_regression.check_plot(p, basename="test_array", atol=1e-5)
+
+    with pytest.raises(AssertionError, match="arrays are not equal within"):
+        x = x + 1e-3
+
+        p = figure(title="Parabola", x_axis_label="x", y_axis_label="y")
+        p.line(x, y, line_width=2)
+
+        bokeh_json_regression.check_plot(p, basename="test_array", atol=1e-5)
+
+    bokeh_json_regression.check_plot(p, basename="test_array", rtol=1e-2, atol=1e-2)
+
+
+@bokehv3_test
+def test_array_tolerance_custom_clean_fn(bokeh_json_regression):
+    """
+    Test that tolerances are rejected for cleaning functions not keeping the arrays
+    """
+    from functools import partial
+    from pytest_bokeh_regressions.json_comparison import default_json_clean_fn
+
+    bokeh_json_regression.clean_fn = partial(default_json_clean_fn, keep_arrays=False)
+
+    p = figure(title="Parabola", x_axis_label="x", y_axis_label="y")
+    p.line([1, 2, 3], [1, 4, 9], line_width=2)
+
+    with pytest.raises(ValueError, match="only supported with the default cleaning function"):
+        bokeh_json_regression.check_plot(p, basename="test_array", atol=1e-5)
+
+
+def test_normalize_list_of_dicts():
+    """
+    Test of the canonical ordering of lists of dicts used for cleaning JSON data of bokeh 2 or older
+    """
+    from pytest_bokeh_regressions.json_comparison import _normalize_list_of_dicts
+
+    list_of_dicts = [
+        {"type": "Plot", "attributes": {"width": 10}},
+        {"type": "Plot", "attributes": {"width": 9}},
+        {"type": "Axis", "attributes": {"ticks": [1, 2], "label": {"text": "x"}}},
+        {"type": "Axis", "attributes": {"label": {"text": "a"}}},
+    ]
+
+    assert _normalize_list_of_dicts(list_of_dicts) == [
+        {"type": "Axis", "attributes": {"label": {"text": "a"}}},
+        {"type": "Axis", "attributes": {"ticks": [1, 2], "label": {"text": "x"}}},
+        {"type": "Plot", "attributes": {"width": 10}},
+        {"type": "Plot", "attributes": {"width": 9}},
+    ]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the incremental regeneration of test files
+"""
+import numpy as np  # pylint: disable=unused-import # numpy cannot be imported again in the pytester runs
+import pytest
+import yaml
+
+TEST_PLOTS = """
+import numpy as np
+from bokeh.plotting import figure
+
+def test_unchanged(bokeh_json_regression):
+    p = figure()
+    p.line([1, 2, 3], [4, 5, 6])
+    bokeh_json_regression.check_plot(p)
+
+def test_changed(bokeh_json_regression):
+    x = np.linspace(-1, 1, 100)
+    p = figure()
+    p.line(x, x**2 + {shift})
+    bokeh_json_regression.check_plot(p)
+    bokeh_json_regression.check_plot(p, basename="array", atol={atol})
+"""
+
+
+@pytest.mark.parametrize("args", [(), ("-n", "2")])
+def test_regen_incremental(pytester, args):
+    """
+    Test that only changed or missing test files are written and that the
+    changed, added and obsolete test files are reported
+    """
+    if args:
+        pytest.importorskip("xdist")
+    pytester.makepyfile(test_plots=TEST_PLOTS.format(shift=0, atol=1e-5))
+
+    result = pytester.runpytest("--regen-all", *args)
+    result.assert_outcomes(passed=2)
+
+    datadir = pytester.path / "test_plots"
+    # Formatting changes of a test file are not considered as changes of the data
+    unchanged = datadir / "test_unchanged.yml"
+    unchanged.write_text(yaml.safe_dump(yaml.safe_load(unchanged.read_text(encoding="utf-8")), width=40))
+    formatted = unchanged.read_text(encoding="utf-8")
+    (datadir / "array.yml").unlink()
+    (datadir / "old.yml").write_text("name: Figure\ntype: object\n", encoding="utf-8")
+    # Files of other tests are not reported as obsolete
+    (datadir / "data.json").write_text('{"values": [1, 2]}', encoding="utf-8")
+    (datadir / "data.yml").write_text("values: [1, 2]\n", encoding="utf-8")
+
+    pytester.makepyfile(test_plots=TEST_PLOTS.format(shift=1, atol=1e-5))
+    result = pytester.runpytest("--bokeh-regen-incremental", *args)
+    result.assert_outcomes(passed=2)
+    result.stdout.re_match_lines(
+        [
+            ".*bokeh regression test files: 1 changed, 1 added, 1 unchanged.*",
+            ".*changed: .*test_changed.yml",
+            ".*added: .*array.yml",
+            ".*obsolete: .*old.yml",
+        ]
+    )
+    assert unchanged.read_text(encoding="utf-8") == formatted
+    assert "data.json" not in result.stdout.str()
+    assert "data.yml" not in result.stdout.str()
+
+    result = pytester.runpytest(*args)
+    result.assert_outcomes(passed=2)
+
+    result = pytester.runpytest("--bokeh-regen-incremental", "-k", "unchanged", *args)
+    result.assert_outcomes(passed=1)
+    result.stdout.re_match_lines([".*0 changed, 0 added, 1 unchanged.*", ".*obsolete test files are not reported.*"])
+
+
+TEST_SKIPPED = """
+import pytest
+from bokeh.plotting import figure
+
+def test_run(bokeh_json_regression):
+    p = figure()
+    p.line([1, 2, 3], [4, 5, 6])
+    bokeh_json_regression.check_plot(p)
+
+@pytest.mark.skip(reason="Test for another bokeh version")
+def test_skipped(bokeh_json_regression):
+    pass
+"""
+
+
+def test_regen_skipped(pytester):
+    """
+    Test that test files of skipped tests are not reported as obsolete
+    """
+    pytester.makepyfile(test_plots=TEST_SKIPPED)
+    datadir = pytester.path / "test_plots"
+    datadir.mkdir()
+    (datadir / "test_skipped.yml").write_text("name: Figure\ntype: object\n", encoding="utf-8")
+
+    result = pytester.runpytest("--bokeh-regen-incremental")
+    result.assert_outcomes(passed=1, skipped=1)
+    result.stdout.re_match_lines([".*bokeh regression test files: 0 changed, 1 added, 0 unchanged.*"])
+    assert "obsolete" not in result.stdout.str()
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the plugin when storing arrays outside of the YAML test files
+"""
+import subprocess
+import sys
+from pathlib import Path
+from packaging.version import Version
+import numpy as np  # pylint: disable=unused-import # numpy cannot be imported again in the pytester runs
+import pytest
+
+import bokeh
+
+BOKEH_VERSION = bokeh.__version__
+BOKEH_LT_3 = Version(BOKEH_VERSION) < Version("3.0.0")
+
+pytestmark = pytest.mark.skipif(BOKEH_LT_3, reason="Test for bokeh version 3 or newer")
+
+TEST_ARRAY = """
+import numpy as np
+from bokeh.plotting import figure
+
+def test_array(bokeh_json_regression):
+    x = np.linspace(-1, 1, 100) + {shift}
+    y = x**2
+
+    p = figure(title="Parabola", x_axis_label="x", y_axis_label="y")
+    p.line(x, y, line_width=2)
+
+    bokeh_json_regression.check_plot(p{args})
+"""
+
+
+def test_sidecar_arrays(pytester):
+    """
+    Test that arrays above the threshold are written to .npy files and compared against these
+    """
+    pytester.makepyfile(TEST_ARRAY.format(shift=0, args=""))
+
+    result = pytester.runpytest("--bokeh-sidecar-threshold=50")
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*File not found in data directory, created:.*"])
+
+    yml_file = pytester.path / "test_sidecar_arrays" / "test_array.yml"
+    assert yml_file.is_file()
+    assert sorted(path.name for path in (pytester.path / "test_sidecar_arrays" / "test_array.arrays").iterdir()) == [
+        "0.npy",
+        "1.npy",
+    ]
+    assert "type: npy" in yml_file.read_text(encoding="utf-8")
+
+    result = pytester.runpytest("--bokeh-sidecar-threshold=50")
+    result.assert_outcomes(passed=1)
+
+    # Writing the arrays in chunks produces the same files
+    arrays_dir = pytester.path / "test_sidecar_arrays" / "test_array.arrays"
+    content = {path.name: path.read_bytes() for path in arrays_dir.iterdir()}
+    yml_file.unlink()
+    for path in arrays_dir.iterdir():
+        path.unlink()
+    result = pytester.runpytest("--bokeh-sidecar-threshold=50", "--bokeh-chunk-size=7")
+    result.assert_outcomes(failed=1)
+    assert {path.name: path.read_bytes() for path in arrays_dir.iterdir()} == content
+
+    result = pytester.runpytest("--bokeh-sidecar-threshold=50", "--bokeh-chunk-size=7")
+    result.assert_outcomes(passed=1)
+
+    pytester.makepyfile(TEST_ARRAY.format(shift=0.01, args=""))
+    result = pytester.runpytest("--bokeh-sidecar-threshold=50")
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*test_array.obtained.yml", ".*arrays are not equal.*"])
+
+
+def test_tolerance_stored_format(pytester):
+    """
+    Test that test files generated when comparing arrays with tolerances are identical to
+    the ones produced without tolerances
+    """
+    pytester.makepyfile(TEST_ARRAY.format(shift=0, args=", atol=1e-5"))
+
+    result = pytester.runpytest()
+    result.assert_outcomes(failed=1)
+
+    yml_file = pytester.path / "test_tolerance_stored_format" / "test_array.yml"
+    expected_file = Path(__file__).parent / "test_json_comparison" / "test_array.yml"
+    assert yml_file.read_text(encoding="utf-8") == expected_file.read_text(encoding="utf-8")
+
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1)
+
+
+def test_hash(pytester):
+    """
+    Test that the comparison against the test file is skipped if the stored hash matches
+    """
+    pytester.makepyfile(TEST_ARRAY.format(shift=0, args=""))
+
+    result = pytester.runpytest("--bokeh-hash")
+    result.assert_outcomes(failed=1)
+
+    yml_file = pytester.path / "test_hash" / "test_array.yml"
+    assert (pytester.path / "test_hash" / "test_array.sha256").is_file()
+
+    result = pytester.runpytest("--bokeh-hash")
+    result.assert_outcomes(passed=1)
+
+    # Changes of the test file by other means (with the same size) are detected
+    content = yml_file.read_text(encoding="utf-8")
+    assert "text: Parabola" in content
+    yml_file.write_text(content.replace("text: Parabola", "text: Parabolx"), encoding="utf-8")
+    result = pytester.runpytest("--bokeh-hash")
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*Parabolx.*"])
+    yml_file.write_text(content, encoding="utf-8")
+
+    # Outdated hashes (e.g. of older versions of the plugin) are rewritten if the data is identical
+    hash_file = pytester.path / "test_hash" / "test_array.sha256"
+    digest = hash_file.read_text(encoding="utf-8")
+    hash_file.write_text(f"{'0' * 64} {yml_file.stat().st_size}\n", encoding="utf-8")
+    result = pytester.runpytest("--bokeh-hash")
+    result.assert_outcomes(passed=1)
+    assert hash_file.read_text(encoding="utf-8") == digest
+
+    # Regenerating the test file without --bokeh-hash removes the hash
+    result = pytester.runpytest("--regen-all")
+    result.assert_outcomes(passed=1)
+    assert not hash_file.exists()
+
+    pytester.makepyfile(TEST_ARRAY.format(shift=0.01, args=""))
+    result = pytester.runpytest("--bokeh-hash")
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*arrays are not equal.*"])
+
+
+def test_file_lock(tmp_path):
+    """
+    Test that the lock for writing test files can only be acquired once at a time
+    """
+    from pytest_bokeh_regressions.storage import atomic_write, file_lock
+
+    filename = tmp_path / "test.yml"
+    with file_lock(filename):
+        with pytest.raises(TimeoutError):
+            with file_lock(filename, timeout=0.05):
+                pass
+        atomic_write(filename, b"data")
+
+    with file_lock(filename, timeout=0.05):
+        pass
+
+    assert filename.read_bytes() == b"data"
+    # No lock files are left in the data directory
+    assert [path.name for path in tmp_path.iterdir()] == ["test.yml"]
+
+
+def test_file_lock_released_on_exit(tmp_path):
+    """
+    Test that the lock of a process, which is killed while holding it, is released
+    """
+    from pytest_bokeh_regressions.storage import file_lock
+
+    filename = tmp_path / "test.yml"
+    code = (
+        "import sys, time\n"
+        "from pathlib import Path\n"
+        "from pytest_bokeh_regressions.storage import file_lock\n"
+        "with file_lock(Path(sys.argv[1])):\n"
+        "    print('locked', flush=True)\n"
+        "    time.sleep(60)\n"
+    )
+    with subprocess.Popen([sys.executable, "-c", code, str(filename)], stdout=subprocess.PIPE, text=True) as process:
+        assert process.stdout.readline().strip() == "locked"
+        with pytest.raises(TimeoutError):
+            with file_lock(filename, timeout=0.05):
+                pass
+        process.kill()
+
+    with file_lock(filename, timeout=5):
+        pass
+
+
+@pytest.mark.parametrize("args", [(), ("--bokeh-sidecar-threshold=50", "--bokeh-hash")])
+def test_compression(pytester, args):
+    """
+    Test that new test files are written compressed and that compressed and
+    plain test files are detected when reading
+    """
+    pytester.makepyfile(TEST_ARRAY.format(shift=0, args=""))
+
+    result = pytester.runpytest("--bokeh-compression=gzip", *args)
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*test_array.yml.gz"])
+
+    datadir = pytester.path / "test_compression"
+    assert not (datadir / "test_array.yml").exists()
+    assert (datadir / "test_array.yml.gz").read_bytes()[:2] == b"\x1f\x8b"
+
+    # The format of existing test files is used independent of the option
+    result = pytester.runpytest(*args)
+    result.assert_outcomes(passed=1)
+    result = pytester.runpytest("--bokeh-compression=gzip", *args)
+    result.assert_outcomes(passed=1)
+
+    pytester.makepyfile(TEST_ARRAY.format(shift=0.01, args=""))
+    result = pytester.runpytest("--bokeh-compression=gzip", *args)
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*test_array.obtained.yml", ".*arrays are not equal.*"])
+
+    result = pytester.runpytest("--bokeh-compression=gzip", "--bokeh-regen", *args)
+    result.assert_outcomes(failed=1)
+    result = pytester.runpytest(*args)
+    result.assert_outcomes(passed=1)
+    assert sorted(path.name for path in datadir.glob("test_array.yml*")) == ["test_array.yml.gz"]
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd", "lz4"])
+def test_compressed_dump_load(tmp_path, compression):
+    """
+    Test writing and reading compressed test files
+    """
+    from pytest_bokeh_regressions import storage
+
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    elif compression == "lz4":
+        pytest.importorskip("lz4")
+
+    data = {"attributes": {"name": "täst", "values": [1.5, 2.5]}, "name": "Plot", "type": "object"}
+    filename = storage.find_test_file(tmp_path, "test", compression)
+    assert filename.name == f"test.yml{storage.COMPRESSION_SUFFIXES[compression]}"
+
+    storage.dump(data, filename)
+    assert storage.load(filename) == data
+    content = filename.read_bytes()
+    storage.dump(data, filename)
+    assert filename.read_bytes() == content
+
+    # The format is detected from the content of the file
+    plain = tmp_path / "plain.yml"
+    plain.write_bytes(content)
+    assert storage.load(plain) == data
+
+    assert storage.find_test_file(tmp_path, "test") == filename
+    assert storage.plain_filename(filename) == tmp_path / "test.yml"
+    assert storage.sidecar_dir(filename) == tmp_path / "test.arrays"
+    assert storage.is_test_file(filename)
+    assert not storage.is_test_file(tmp_path / "test.obtained.yml")
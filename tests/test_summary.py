@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of storing and comparing large arrays only by their summaries
+"""
+from packaging.version import Version
+import numpy as np
+import pytest
+import yaml
+
+import bokeh
+
+from pytest_bokeh_regressions.blob_store import array_digest
+from pytest_bokeh_regressions.summary import compare_summaries, summarize_array
+
+BOKEH_LT_3 = Version(bokeh.__version__) < Version("3.0.0")
+
+TEST_SUMMARY = """
+import numpy as np
+import pytest
+from bokeh.plotting import figure
+
+@pytest.mark.bokeh_summary(threshold=50)
+def test_summary(bokeh_json_regression):
+    x = np.linspace(1, 2, 1000)
+    y = x**2 + {shift}
+    y[::100] = np.nan
+
+    p = figure(title="Parabola")
+    p.line(x, y, line_width=2)
+    bokeh_json_regression.check_plot(p{args})
+"""
+
+
+def test_summarize_array():
+    """
+    Test that the summary computed chunk by chunk matches the statistics of the rounded array
+    """
+    array = np.random.default_rng(42).normal(size=(100, 37))
+    array[3, 5] = np.nan
+    rounded = np.around(array, decimals=5)
+
+    summary = summarize_array(array, fp_precision=5, chunk_size=101)
+    assert summary == summarize_array(array, fp_precision=5)
+    assert summary["dtype"] == "float64"
+    assert summary["shape"] == [100, 37]
+    assert summary["nan_count"] == 1
+    assert summary["min"] == np.nanmin(rounded)
+    assert summary["max"] == np.nanmax(rounded)
+    assert summary["mean"] == round(float(np.nanmean(rounded)), 5)
+    assert summary["std"] == round(float(np.nanstd(rounded)), 5)
+    assert summary["quantiles"]["p50"] == round(float(np.nanquantile(array, 0.5, method="inverted_cdf")), 5)
+    assert summary["sha256"] == array_digest(array, 5)
+
+    summary = summarize_array(np.arange(10), fp_precision=5)
+    assert summary["min"] == 0
+    assert summary["max"] == 9
+    assert summary["mean"] == 4.5
+    assert summary["quantiles"]["p1"] == 0
+
+    summary = summarize_array(np.array(["a", "b"]), fp_precision=5)
+    assert set(summary.keys()) == {"type", "dtype", "shape", "sha256"}
+
+
+def test_compare_summaries():
+    """
+    Test the comparison of summaries with and without tolerances
+    """
+    array = np.linspace(1, 2, 1000)
+    expected = summarize_array(array, fp_precision=5)
+
+    assert compare_summaries("/y", summarize_array(array, fp_precision=5), expected) is None
+
+    obtained = summarize_array(array + 1e-3, fp_precision=5)
+    difference = compare_summaries("/y", obtained, expected)
+    assert difference.startswith("/y: summary of the array differs: min expected 1.0, got 1.001;")
+    assert compare_summaries("/y", obtained, expected, atol=1e-2) is None
+
+    shuffled = array.copy()
+    shuffled[[0, 1]] = shuffled[[1, 0]]
+    assert compare_summaries("/y", summarize_array(shuffled, fp_precision=5), expected) == (
+        "/y: summary of the array differs: the statistics are equal, but the hash of the data differs"
+    )
+
+    assert compare_summaries("/y", summarize_array(array[:10], fp_precision=5), expected) == (
+        "/y: expected array of float64(1000,), got float64(10,)"
+    )
+
+
+@pytest.mark.skipif(BOKEH_LT_3, reason="Test for bokeh version 3 or newer")
+def test_summary_check(pytester):
+    """
+    Test that arrays above the threshold are stored as summaries and compared by them
+    """
+    pytester.makepyfile(test_plots=TEST_SUMMARY.format(shift=0, args=""))
+
+    result = pytester.runpytest()
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines([".*File not found in data directory, created:.*"])
+
+    yml_file = pytester.path / "test_plots" / "test_summary.yml"
+    content = yml_file.read_text(encoding="utf-8")
+    assert "type: summary" in content
+    assert "nan_count: 10" in content
+    assert len(content) < 10000
+
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1)
+
+    pytester.makepyfile(test_plots=TEST_SUMMARY.format(shift=1e-4, args=""))
+    result = pytester.runpytest()
+    result.assert_outcomes(failed=1)
+    result.stdout.re_match_lines(
+        [".*summary of the array differs: min expected 1.002, got 1.0021; max expected 4.0, got 4.0001.*"]
+    )
+
+    pytester.makepyfile(test_plots=TEST_SUMMARY.format(shift=1e-4, args=", atol=1e-3"))
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1)
+
+    # The argument of check_plot overrides the threshold of the marker
+    pytester.makepyfile(test_plots=TEST_SUMMARY.format(shift=0, args=", summary_threshold=2000"))
+    yml_file.unlink()
+    result = pytester.runpytest()
+    result.assert_outcomes(failed=1)
+    data = yaml.safe_load(yml_file.read_text(encoding="utf-8"))
+    data_source = data["attributes"]["renderers"][0]["attributes"]["data_source"]
+    assert [entry[1]["type"] for entry in data_source["attributes"]["data"]["entries"]] == ["ndarray", "ndarray"]
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the timing of the stages of the bokeh regression checks
+"""
+import json
+
+import numpy as np
+import pytest
+import yaml  # pylint: disable=unused-import # the libyaml bindings cannot be imported again in the pytester runs
+
+TEST_PLOTS = """
+import numpy as np
+from bokeh.plotting import figure
+
+def test_small(bokeh_json_regression):
+    p = figure()
+    p.line([1, 2, 3], [4, 5, 6])
+    bokeh_json_regression.check_plot(p)
+
+def test_large(bokeh_json_regression):
+    x = np.linspace(-1, 1, 10000)
+    p = figure()
+    p.line(x, x**2)
+    bokeh_json_regression.check_plot(p, basename="first")
+    bokeh_json_regression.check_plot(p, basename="second")
+"""
+
+CONFTEST = """
+import json
+
+def pytest_bokeh_check_plot_timing(config, nodeid, timing):
+    with open("hook.jsonl", "a") as file:
+        file.write(json.dumps({"nodeid": nodeid, **timing.to_dict()}) + "\\n")
+"""
+
+
+@pytest.mark.parametrize("args", [(), ("-n", "2")])
+def test_durations(pytester, args):
+    """
+    Test the terminal report, the JSON export and the hook for the timings of the checks
+    """
+    if args:
+        pytest.importorskip("xdist")
+    pytester.makepyfile(TEST_PLOTS)
+    pytester.makeconftest(CONFTEST)
+
+    result = pytester.runpytest("--bokeh-durations=2", "--bokeh-durations-json=timings.json", "--regen-all", *args)
+    result.assert_outcomes(passed=2)
+    result.stdout.re_match_lines(
+        [
+            ".*slowest 2 bokeh_json_regression checks.*",
+            r".*s test_durations.py::test_large \[(first|second)\] \(serialize .*s, clean .*s, dump .*s; .* array bytes\)",
+        ]
+    )
+    assert len([line for line in result.stdout.lines if line.endswith("array bytes)")]) == 2
+
+    timings = json.loads((pytester.path / "timings.json").read_text(encoding="utf-8"))
+    assert sorted(timing["basename"] for timing in timings) == ["first", "second", "test_small"]
+    large = next(timing for timing in timings if timing["basename"] == "first")
+    assert large["nodeid"] == "test_durations.py::test_large"
+    assert set(large["stages"]) == {"serialize", "clean", "dump"}
+    assert large["array_bytes"] == 2 * 10000 * 8
+    assert large["document_entries"] > 0
+
+    hook_calls = [json.loads(line) for line in (pytester.path / "hook.jsonl").read_text().splitlines()]
+    assert sorted(timing["basename"] for timing in hook_calls) == ["first", "second", "test_small"]
+
+    result = pytester.runpytest("--bokeh-durations=0", *args)
+    result.assert_outcomes(passed=2)
+    result.stdout.re_match_lines(
+        [".*bokeh_json_regression check durations.*", r".*\[test_small\] \(serialize .*s, clean .*s, compare .*s;.*"]
+    )
+
+
+def test_no_durations(pytester, monkeypatch):
+    """
+    Test that the checked documents are not walked for their statistics if the timings are not reported
+    """
+    from pytest_bokeh_regressions import timing
+
+    def _fail(data):
+        raise AssertionError("The document statistics were collected")
+
+    monkeypatch.setattr(timing, "document_stats", _fail)
+    pytester.makepyfile(TEST_PLOTS)
+
+    result = pytester.runpytest("--regen-all")
+    result.assert_outcomes(passed=2)
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=2)
+
+    result = pytester.runpytest("--bokeh-durations=1")
+    result.assert_outcomes(failed=2)
+    result.stdout.re_match_lines([".*The document statistics were collected.*"])
+
+
+def test_document_stats():
+    """
+    Test counting the entries and array bytes of cleaned documents
+    """
+    from pytest_bokeh_regressions.timing import document_stats
+
+    data = {
+        "a": [1, {"type": "ndarray", "array": {"type": "bytes", "data": "AAAAAAAA"}}],
+        "b": np.zeros(10),
+        "c": {"__ndarray__": "AAAA", "dtype": "int8"},
+    }
+    assert document_stats(data) == (8, 6 + 80 + 3)